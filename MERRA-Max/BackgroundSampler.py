@@ -0,0 +1,362 @@
+
+import csv
+import hashlib
+import math
+import os
+
+import numpy
+
+from osgeo import gdal
+from osgeo import gdalconst
+
+from ISFS import mdsBuilder
+from ISFS import tif2asc
+
+#-------------------------------------------------------------------------------
+# class BackgroundSampler
+#
+# This draws one set of background points for a run, so every trial and the
+# final model see the same background.  Points are drawn from cells where
+# every predictor has data, optionally only within a buffer distance of the
+# presence points, and optionally weighted by a bias grid on the predictors'
+# grid.  The points and their predictor values are cached in a compressed,
+# columnar .npz file.  Grid trials, which MaxEnt samples itself, receive the
+# same eligible cells and weights as a bias grid.
+#-------------------------------------------------------------------------------
+class BackgroundSampler(object):
+
+    DEFAULT_POINTS = 10000
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, predFiles, numPoints = DEFAULT_POINTS, presPoints = None,
+                 bufferDistance = None, biasFile = None, logger = None):
+
+        if not predFiles:
+            raise RuntimeError('Background points require predictors.')
+
+        if bufferDistance and not presPoints:
+            raise RuntimeError('A buffer requires presence points.')
+
+        self.predFiles      = sorted(predFiles)
+        self.numPoints      = int(numPoints)
+        self.presPoints     = presPoints or []
+        self.bufferDistance = bufferDistance
+        self.biasFile       = biasFile
+        self.logger         = logger
+
+        # Every predictor is on the same grid, so any one describes it.
+        dataset     = gdal.Open(self.predFiles[0], gdalconst.GA_ReadOnly)
+        self.xform  = dataset.GetGeoTransform()
+        self.width  = dataset.RasterXSize
+        self.height = dataset.RasterYSize
+
+        self.names  = [os.path.splitext(os.path.basename(p))[0]
+                       for p in self.predFiles]
+
+        self.xs     = None
+        self.ys     = None
+        self.values = None
+
+    #---------------------------------------------------------------------------
+    # applyBuffer
+    #
+    # This keeps only cells whose centres are within the buffer distance of a
+    # presence point.
+    #---------------------------------------------------------------------------
+    def applyBuffer(self, mask):
+
+        inBuffer = numpy.zeros(mask.shape, numpy.bool_)
+        scale    = math.fabs(self.xform[1])
+        radius   = int(math.ceil(self.bufferDistance / scale))
+
+        presXs = numpy.array([float(p[0]) for p in self.presPoints])
+        presYs = numpy.array([float(p[1]) for p in self.presPoints])
+        cols, rows = mdsBuilder.groundToImage(presXs, presYs, self.xform)
+
+        for col, row in zip(cols.tolist(), rows.tolist()):
+
+            c0 = max(col - radius, 0)
+            c1 = min(col + radius + 1, self.width)
+            r0 = max(row - radius, 0)
+            r1 = min(row + radius + 1, self.height)
+
+            if c0 >= c1 or r0 >= r1:
+                continue
+
+            # Compare cell-centre distances to the point's cell centre.
+            dCols, dRows = numpy.meshgrid(numpy.arange(c0, c1) - col,
+                                          numpy.arange(r0, r1) - row)
+
+            inBuffer[r0:r1, c0:c1] |= \
+                (dCols ** 2 + dRows ** 2) * scale ** 2 <= \
+                self.bufferDistance ** 2
+
+        return mask & inBuffer
+
+    #---------------------------------------------------------------------------
+    # getEligibleMask
+    #
+    # A cell is eligible when it is valid and within the buffer, if any.
+    #---------------------------------------------------------------------------
+    def getEligibleMask(self):
+
+        mask = self.getValidMask()
+
+        if self.bufferDistance:
+            mask = self.applyBuffer(mask)
+
+        return mask
+
+    #---------------------------------------------------------------------------
+    # getFileHash
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getFileHash(path):
+
+        digest = hashlib.sha1()
+
+        with open(path, 'rb') as f:
+
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    #---------------------------------------------------------------------------
+    # getSettings
+    #
+    # These are everything the draw depends on:  its settings, the presence
+    # points the buffer surrounds, the grid, each predictor's size and
+    # modification time, and the bias grid's contents.
+    #---------------------------------------------------------------------------
+    def getSettings(self):
+
+        presHash = hashlib.sha1(repr([(str(p[0]), str(p[1]))
+                                      for p in self.presPoints])).hexdigest()
+
+        biasHash = None
+
+        if self.biasFile:
+            biasHash = BackgroundSampler.getFileHash(self.biasFile)
+
+        return [str(self.numPoints),
+                str(self.bufferDistance),
+                str(self.biasFile),
+                str(biasHash),
+                presHash,
+                repr(tuple(self.xform)),
+                str(self.width) + 'x' + str(self.height)] + \
+               [os.path.basename(p) + ':' + \
+                str(os.path.getsize(p)) + ':' + \
+                repr(os.path.getmtime(p)) for p in self.predFiles]
+
+    #---------------------------------------------------------------------------
+    # getValidMask
+    #
+    # A cell is valid when every predictor has data there.
+    #---------------------------------------------------------------------------
+    def getValidMask(self):
+
+        mask = numpy.ones((self.height, self.width), numpy.bool_)
+
+        for predFile in self.predFiles:
+
+            dataset = gdal.Open(predFile, gdalconst.GA_ReadOnly)
+
+            if not dataset:
+                raise RuntimeError('Unable to read ' + predFile + '.')
+
+            row = 0
+
+            for block in tif2asc.readBlocks(dataset):
+
+                mask[row:row + block.shape[0]] &= block != tif2asc.nodata
+                row += block.shape[0]
+
+        return mask
+
+    #---------------------------------------------------------------------------
+    # getWeights
+    #
+    # This returns the bias grid's values in the given cells, or None when
+    # there is no bias grid.
+    #---------------------------------------------------------------------------
+    def getWeights(self, cells):
+
+        if not self.biasFile:
+            return None
+
+        dataset = gdal.Open(self.biasFile, gdalconst.GA_ReadOnly)
+
+        if not dataset:
+            raise RuntimeError('Unable to read ' + self.biasFile + '.')
+
+        if dataset.RasterXSize != self.width or \
+           dataset.RasterYSize != self.height:
+
+            raise RuntimeError('The bias grid must be on the predictors\' ' + \
+                               'grid.')
+
+        bias    = numpy.concatenate(list(tif2asc.readBlocks(dataset)))
+        weights = bias.ravel()[cells].astype(numpy.float64)
+        weights[(weights == tif2asc.nodata) | (weights < 0.0)] = 0.0
+
+        if weights.sum() <= 0.0:
+            raise RuntimeError('The bias grid has no positive weights.')
+
+        return weights / weights.sum()
+
+    #---------------------------------------------------------------------------
+    # isCacheCurrent
+    #
+    # A cache is current when it was drawn from the same predictors, presence
+    # points and grid, with the same settings.
+    #---------------------------------------------------------------------------
+    def isCacheCurrent(self, cacheFile):
+
+        if not os.path.exists(cacheFile):
+            return False
+
+        cache = numpy.load(cacheFile)
+
+        return cache['names'].tolist() == self.names and \
+               cache['settings'].tolist() == self.getSettings()
+
+    #---------------------------------------------------------------------------
+    # readCache
+    #---------------------------------------------------------------------------
+    def readCache(self, cacheFile):
+
+        cache = numpy.load(cacheFile)
+
+        self.names  = cache['names'].tolist()
+        self.xs     = cache['x']
+        self.ys     = cache['y']
+        self.values = cache['values']
+
+        return self
+
+    #---------------------------------------------------------------------------
+    # sample
+    #---------------------------------------------------------------------------
+    def sample(self):
+
+        cells   = numpy.flatnonzero(self.getEligibleMask())
+        weights = self.getWeights(cells)
+
+        if weights is not None:
+            cells = cells[weights > 0.0]
+            weights = weights[weights > 0.0]
+
+        numPoints = min(self.numPoints, len(cells))
+
+        if self.logger:
+
+            self.logger.info('Drawing ' + str(numPoints) + \
+                             ' background points from ' + str(len(cells)) + \
+                             ' valid cells.')
+
+        if numPoints == 0:
+            raise RuntimeError('There are no valid background cells.')
+
+        cells = numpy.sort(numpy.random.choice(cells,
+                                               numPoints,
+                                               replace = False,
+                                               p = weights))
+
+        # Sample the predictors at the cell centres.
+        self.xs = self.xform[0] + (cells % self.width  + 0.5) * self.xform[1]
+        self.ys = self.xform[3] + (cells // self.width + 0.5) * self.xform[5]
+
+        fieldData = [['x', 'y']] + [[x, y] for x, y in zip(self.xs.tolist(),
+                                                            self.ys.tolist())]
+
+        fieldData   = mdsBuilder.loadValues(self.predFiles, fieldData)
+        self.values = numpy.array([row[2:] for row in fieldData[1:]],
+                                  numpy.float32)
+
+        return self
+
+    #---------------------------------------------------------------------------
+    # writeBiasGrid
+    #
+    # This writes a GeoTIFF of each eligible cell's weight, on the predictors'
+    # grid, for MaxEnt's biasfile.  MaxEnt requires positive bias values, so
+    # cells that cannot be drawn are no-data, which MaxEnt leaves out of the
+    # background.
+    #---------------------------------------------------------------------------
+    def writeBiasGrid(self, biasTif):
+
+        cells   = numpy.flatnonzero(self.getEligibleMask())
+        weights = self.getWeights(cells)
+
+        if weights is not None:
+
+            cells   = cells[weights > 0.0]
+            weights = weights[weights > 0.0] * len(weights)
+
+        if len(cells) == 0:
+            raise RuntimeError('There are no valid background cells.')
+
+        grid = numpy.full((self.height, self.width), tif2asc.nodata,
+                          numpy.float32)
+
+        grid.flat[cells] = 1.0 if weights is None else weights
+
+        predictor = gdal.Open(self.predFiles[0], gdalconst.GA_ReadOnly)
+        driver    = gdal.GetDriverByName('GTiff')
+
+        dataset = driver.Create(biasTif, self.width, self.height, 1,
+                                gdalconst.GDT_Float32)
+
+        if not dataset:
+            raise RuntimeError('Unable to create ' + biasTif + '.')
+
+        dataset.SetGeoTransform(self.xform)
+        dataset.SetProjection(predictor.GetProjection())
+
+        band = dataset.GetRasterBand(1)
+        band.SetNoDataValue(tif2asc.nodata)
+        band.WriteArray(grid)
+        band.FlushCache()
+
+        if self.logger:
+
+            self.logger.info('Wrote bias grid ' + biasTif + ' of ' + \
+                             str(len(cells)) + ' eligible cells.')
+
+        return biasTif
+
+    #---------------------------------------------------------------------------
+    # writeCache
+    #---------------------------------------------------------------------------
+    def writeCache(self, cacheFile):
+
+        numpy.savez_compressed(cacheFile,
+                               names    = numpy.array(self.names),
+                               settings = numpy.array(self.getSettings()),
+                               x        = self.xs,
+                               y        = self.ys,
+                               values   = self.values)
+
+    #---------------------------------------------------------------------------
+    # writeSwdFile
+    #
+    # This writes the background in MaxEnt's samples-with-data format.
+    #---------------------------------------------------------------------------
+    def writeSwdFile(self, swdFile):
+
+        with open(swdFile, 'w') as f:
+
+            writer = csv.writer(f, delimiter = ',')
+            writer.writerow(['background', 'x', 'y'] + self.names)
+
+            for x, y, values in zip(self.xs.tolist(),
+                                    self.ys.tolist(),
+                                    self.values.tolist()):
+
+                writer.writerow(['background', x, y] + \
+                                ['%.8g' % value for value in values])
+
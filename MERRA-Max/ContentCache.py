@@ -0,0 +1,248 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import time
+
+#-------------------------------------------------------------------------------
+# class ContentCache
+#
+# This is the index of a cache shared by runs, in one SQLite database in the
+# cache's directory.  Subclasses key their entries by the contents of files,
+# whose hashes are kept by path, size and modification time, so unchanged
+# files are not read again.  Each entry records its size, when it was created
+# and last used, and how often it was used.
+#
+# Entries not used within a number of days are evicted, then the least
+# recently used, until the cache is within its size.
+#-------------------------------------------------------------------------------
+class ContentCache(object):
+
+    # The subclass's database, table of entries, and columns after the common
+    # ones
+    CACHE_FILE = None
+    COLUMNS    = []
+    TABLE      = None
+
+    # Seconds to wait for another process's transaction.
+    TIMEOUT = 600
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cacheDir, maxMB = None, maxDays = None, logger = None):
+
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+
+        self.cacheDir  = cacheDir
+        self.cacheFile = os.path.join(cacheDir, self.CACHE_FILE)
+        self.maxMB     = maxMB
+        self.maxDays   = maxDays
+        self.logger    = logger
+
+        with self.connect() as conn:
+
+            conn.execute('PRAGMA journal_mode = DELETE')
+
+            conn.execute('CREATE TABLE IF NOT EXISTS ' + self.TABLE + ' ('
+                         'key     TEXT PRIMARY KEY, '
+                         'size    INTEGER NOT NULL, '
+                         'created REAL NOT NULL, '
+                         'used    REAL NOT NULL, '
+                         'hits    INTEGER NOT NULL DEFAULT 0' + \
+                         ''.join([', ' + name + ' ' + columnType
+                                  for name, columnType in self.COLUMNS]) + \
+                         ')')
+
+            conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                         'path  TEXT PRIMARY KEY, '
+                         'size  INTEGER NOT NULL, '
+                         'mtime REAL NOT NULL, '
+                         'hash  TEXT NOT NULL)')
+
+            # Caches created before hits were counted lack their column.
+            columns = [row[1] for row in
+                       conn.execute('PRAGMA table_info(' + self.TABLE + ')')]
+
+            if 'hits' not in columns:
+
+                conn.execute('ALTER TABLE ' + self.TABLE + ' ADD COLUMN '
+                             'hits INTEGER NOT NULL DEFAULT 0')
+
+    #---------------------------------------------------------------------------
+    # addEntry
+    #
+    # This adds an entry, with values for the subclass's columns.
+    #---------------------------------------------------------------------------
+    def addEntry(self, key, size, values):
+
+        names = [name for name, columnType in self.COLUMNS]
+        now   = time.time()
+
+        with self.connect() as conn:
+
+            conn.execute('INSERT OR REPLACE INTO ' + self.TABLE + ' '
+                         '(key, size, created, used, hits, ' + \
+                         ', '.join(names) + ') VALUES (?, ?, ?, ?, 0, ' + \
+                         ', '.join('?' * len(names)) + ')',
+                         [key, size, now, now] + \
+                         [values[name] for name in names])
+
+    #---------------------------------------------------------------------------
+    # connect
+    #---------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def connect(self):
+
+        conn = sqlite3.connect(self.cacheFile, timeout = ContentCache.TIMEOUT)
+
+        try:
+            with conn:
+                yield conn
+
+        finally:
+            conn.close()
+
+    #---------------------------------------------------------------------------
+    # evict
+    #
+    # This returns the number of entries evicted.
+    #---------------------------------------------------------------------------
+    def evict(self):
+
+        cutoff  = time.time() - (self.maxDays or 0) * 86400
+        evicted = []
+        total   = 0
+
+        with self.connect() as conn:
+
+            rows = conn.execute('SELECT key, size, used FROM ' + self.TABLE + \
+                                ' ORDER BY used DESC').fetchall()
+
+            for key, size, used in rows:
+
+                total += size
+
+                if (self.maxDays and used < cutoff) or \
+                   (self.maxMB and total > self.maxMB * 1024 * 1024):
+
+                    conn.execute('DELETE FROM ' + self.TABLE + \
+                                 ' WHERE key = ?', (key,))
+
+                    evicted.append(key)
+
+            # Hashes of files that no longer exist are not needed.
+            for (path,) in conn.execute('SELECT path FROM files').fetchall():
+
+                if not os.path.exists(path):
+                    conn.execute('DELETE FROM files WHERE path = ?', (path,))
+
+        for key in evicted:
+            self.removeEntry(key)
+
+        if evicted and self.logger:
+
+            self.logger.info('Evicted ' + str(len(evicted)) + \
+                             ' entries from ' + self.cacheFile + '.')
+
+        return len(evicted)
+
+    #---------------------------------------------------------------------------
+    # getFileHash
+    #
+    # A file's hash is read again only when its size or modification time
+    # changes.
+    #---------------------------------------------------------------------------
+    def getFileHash(self, path):
+
+        path  = os.path.abspath(path)
+        size  = os.path.getsize(path)
+        mtime = os.path.getmtime(path)
+
+        with self.connect() as conn:
+
+            row = conn.execute('SELECT hash FROM files '
+                               'WHERE path = ? AND size = ? AND mtime = ?',
+                               (path, size, mtime)).fetchone()
+
+        if row:
+            return row[0]
+
+        digest = hashlib.sha1()
+
+        with open(path, 'rb') as f:
+
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+
+        with self.connect() as conn:
+
+            conn.execute('INSERT OR REPLACE INTO files '
+                         '(path, size, mtime, hash) VALUES (?, ?, ?, ?)',
+                         (path, size, mtime, digest.hexdigest()))
+
+        return digest.hexdigest()
+
+    #---------------------------------------------------------------------------
+    # getReport
+    #
+    # This returns lines describing the cache's entries and their use.
+    #---------------------------------------------------------------------------
+    def getReport(self):
+
+        with self.connect() as conn:
+
+            numEntries, size, hits, oldest, newest = \
+                conn.execute('SELECT COUNT(*), SUM(size), SUM(hits), '
+                             'MIN(used), MAX(used) FROM ' + \
+                             self.TABLE).fetchone()
+
+        lines = [self.cacheFile + ':  ' + str(numEntries) + ' entries, ' + \
+                 '%.1f' % ((size or 0) / 1048576.0) + ' MB' + \
+                 (' of ' + str(self.maxMB) + ' MB' if self.maxMB else '') + \
+                 ', used ' + str(hits or 0) + ' times']
+
+        if numEntries:
+
+            lines.append('Least recently used ' + \
+                         time.strftime('%Y-%m-%d %H:%M',
+                                       time.localtime(oldest)) + \
+                         ', most recently used ' + \
+                         time.strftime('%Y-%m-%d %H:%M',
+                                       time.localtime(newest)))
+
+        return lines
+
+    #---------------------------------------------------------------------------
+    # removeEntry
+    #
+    # Subclasses keeping an entry's contents outside the index remove them
+    # here.
+    #---------------------------------------------------------------------------
+    def removeEntry(self, key):
+        pass
+
+    #---------------------------------------------------------------------------
+    # useEntry
+    #
+    # This returns the values of the subclass's columns for a key, and records
+    # their use, or returns None when the key is not cached.
+    #---------------------------------------------------------------------------
+    def useEntry(self, key):
+
+        names = [name for name, columnType in self.COLUMNS]
+
+        with self.connect() as conn:
+
+            row = conn.execute('SELECT ' + ', '.join(names) + ' FROM ' + \
+                               self.TABLE + ' WHERE key = ?',
+                               (key,)).fetchone()
+
+            if not row:
+                return None
+
+            conn.execute('UPDATE ' + self.TABLE + ' SET used = ?, ' + \
+                         'hits = hits + 1 WHERE key = ?', (time.time(), key))
+
+        return dict(zip(names, row))
@@ -0,0 +1,178 @@
+
+import json
+import os
+import time
+
+import numpy
+
+#-------------------------------------------------------------------------------
+# class CostModel
+#
+# This predicts a trial's run time from what is known before it runs:  the
+# number of sample points, the cells in the layers' grid, and which predictors
+# the trial uses.  It is fitted by ridge regression to the run times of trials
+# that succeeded, and kept in the run's TRIALS directory, so later runs and
+# resets start with it.  Run time is modelled as a constant, plus costs per
+# layer scaled by the points and cells, plus a cost for each predictor.
+#-------------------------------------------------------------------------------
+class CostModel(object):
+
+    MODEL_FILE = 'costModel.json'
+
+    # Successful trials to see before predicting
+    MIN_SAMPLES = 3
+
+    # The ridge penalty, which keeps the predictors' costs small until the
+    # run times distinguish them
+    RIDGE = 0.1
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, trialsDir, layerNames, numPoints, numCells,
+                 logger = None):
+
+        self.modelFile    = os.path.join(trialsDir, CostModel.MODEL_FILE)
+        self.layerNames   = sorted(layerNames)
+        self.numPoints    = numPoints
+        self.numCells     = numCells
+        self.logger       = logger
+        self.coefficients = None
+        self.numSamples   = 0
+
+        if os.path.exists(self.modelFile):
+            self.read()
+
+    #---------------------------------------------------------------------------
+    # fit
+    #
+    # This fits the model to samples of features and run times in seconds, and
+    # writes it.  It returns False, leaving the model as it was, when there are
+    # too few samples.
+    #---------------------------------------------------------------------------
+    def fit(self, samples):
+
+        if len(samples) < CostModel.MIN_SAMPLES:
+            return False
+
+        features = numpy.array([self.getVector(f) for f, s in samples])
+        seconds  = numpy.array([s for f, s in samples])
+
+        # The constant is not penalized.
+        penalty       = numpy.eye(features.shape[1]) * CostModel.RIDGE
+        penalty[0, 0] = 0.0
+
+        self.coefficients = \
+            numpy.linalg.solve(features.T.dot(features) + penalty,
+                               features.T.dot(seconds)).tolist()
+
+        self.numSamples = len(samples)
+        self.write()
+
+        if self.logger:
+
+            self.logger.info('Fitted the trial cost model to ' + \
+                             str(self.numSamples) + ' run times.')
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # getFeatureNames
+    #---------------------------------------------------------------------------
+    def getFeatureNames(self):
+
+        return ['constant', 'layers', 'pointLayers', 'cellLayers'] + \
+               self.layerNames
+
+    #---------------------------------------------------------------------------
+    # getFeatures
+    #
+    # This returns a trial's features, as recorded with its run time.
+    #---------------------------------------------------------------------------
+    def getFeatures(self, predictors):
+
+        return {'points': self.numPoints,
+                'cells': self.numCells,
+                'predictors': [os.path.splitext(os.path.basename(p))[0]
+                               for p in predictors]}
+
+    #---------------------------------------------------------------------------
+    # getVector
+    #
+    # Points and cells are in millions, so their costs are of the order of the
+    # others.
+    #---------------------------------------------------------------------------
+    def getVector(self, features):
+
+        numLayers = len(features['predictors'])
+
+        return [1.0,
+                numLayers,
+                features['points'] * numLayers / 1.0e6,
+                features['cells'] * numLayers / 1.0e6] + \
+               [1.0 if name in features['predictors'] else 0.0
+                for name in self.layerNames]
+
+    #---------------------------------------------------------------------------
+    # isFitted
+    #---------------------------------------------------------------------------
+    def isFitted(self):
+        return self.coefficients != None
+
+    #---------------------------------------------------------------------------
+    # predict
+    #
+    # This returns a trial's predicted run time in seconds, or None before the
+    # model is fitted.
+    #---------------------------------------------------------------------------
+    def predict(self, predictors):
+
+        if not self.isFitted():
+            return None
+
+        vector = self.getVector(self.getFeatures(predictors))
+
+        return max(sum([c * v for c, v in zip(self.coefficients, vector)]),
+                   0.0)
+
+    #---------------------------------------------------------------------------
+    # read
+    #
+    # A model for other layers is not used.
+    #---------------------------------------------------------------------------
+    def read(self):
+
+        with open(self.modelFile) as f:
+            inDict = json.loads(f.read())
+
+        if inDict['featureNames'] != self.getFeatureNames():
+
+            if self.logger:
+
+                self.logger.info('The trial cost model in ' + \
+                                 self.modelFile + ' is for other layers, ' + \
+                                 'so it is not used.')
+
+            return
+
+        self.coefficients = inDict['coefficients']
+        self.numSamples   = inDict['numSamples']
+
+    #---------------------------------------------------------------------------
+    # write
+    #---------------------------------------------------------------------------
+    def write(self):
+
+        outDict = {'featureNames': self.getFeatureNames(),
+                   'coefficients': self.coefficients,
+                   'numSamples': self.numSamples,
+                   'fitted': time.time()}
+
+        # Other processes may be reading it, so replace it atomically.
+        tempFile = self.modelFile + '.' + str(os.getpid()) + '.tmp'
+
+        with open(tempFile, 'w') as f:
+            f.write(json.dumps(outDict, indent = 0))
+
+        os.rename(tempFile, self.modelFile)
+
@@ -0,0 +1,132 @@
+
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.security.Permission;
+
+import density.Params;
+import density.Runner;
+import density.Utils;
+
+//------------------------------------------------------------------------------
+// class MaxEntWorker
+//
+// This runs many MaxEnt jobs in one JVM, so each job does not pay for the JVM's
+// startup and for loading MaxEnt's classes.  Each line of standard input is one
+// job:  MaxEnt's command-line arguments, separated by tabs.  After each job,
+// the worker writes a line of the form
+//
+//     MaxEntWorker: done <exit code>
+//
+// to standard output.  The worker ends when standard input closes.  It runs
+// each job as density.MaxEnt's main does, without the GUI.
+//
+// javac -cp maxent.jar MaxEntWorker.java
+// java -cp maxent.jar:. MaxEntWorker
+//------------------------------------------------------------------------------
+public class MaxEntWorker {
+
+    public static final String DONE = "MaxEntWorker: done ";
+
+    //--------------------------------------------------------------------------
+    // class ExitException
+    //
+    // MaxEnt exits the JVM on some errors.  Within a job, that exit becomes
+    // this exception, so the worker survives to report the job's exit code.
+    //--------------------------------------------------------------------------
+    static class ExitException extends SecurityException {
+
+        final int status;
+
+        ExitException(int status) {
+
+            super("MaxEnt exited with status " + status);
+            this.status = status;
+        }
+    }
+
+    //--------------------------------------------------------------------------
+    // class ExitTrap
+    //--------------------------------------------------------------------------
+    static class ExitTrap extends SecurityManager {
+
+        public void checkExit(int status) {
+            throw new ExitException(status);
+        }
+
+        public void checkPermission(Permission perm) {
+        }
+
+        public void checkPermission(Permission perm, Object context) {
+        }
+    }
+
+    //--------------------------------------------------------------------------
+    // main
+    //--------------------------------------------------------------------------
+    public static void main(String[] args) throws Exception {
+
+        // MaxEnt writes progress to standard output, which is our channel.
+        PrintStream out = System.out;
+        System.setOut(System.err);
+
+        BufferedReader in =
+            new BufferedReader(new InputStreamReader(System.in));
+
+        // Newer JVMs refuse security managers, and an exit ends the worker.
+        try {
+            System.setSecurityManager(new ExitTrap());
+
+        } catch (UnsupportedOperationException e) {
+        }
+
+        String line;
+
+        while ((line = in.readLine()) != null) {
+
+            if (line.trim().length() == 0) {
+                continue;
+            }
+
+            int exitCode = runJob(line.split("\t"));
+            out.println(DONE + exitCode);
+            out.flush();
+        }
+    }
+
+    //--------------------------------------------------------------------------
+    // runJob
+    //--------------------------------------------------------------------------
+    static int runJob(String[] args) {
+
+        try {
+            Params params = new Params();
+            String error  = params.readFromArgs(args);
+
+            // Arguments MaxEnt cannot parse fail the job, as in MaxEnt's main.
+            if (error != null) {
+
+                System.err.println("MaxEntWorker: " + error);
+                return 1;
+            }
+
+            Utils.applyStaticParams(params);
+            params.setSelections();
+
+            Runner runner = new Runner(params);
+            runner.start();
+            runner.end();
+
+            return 0;
+
+        } catch (ExitException e) {
+
+            return e.status;
+
+        } catch (Exception e) {
+
+            e.printStackTrace();
+            return 1;
+        }
+    }
+}
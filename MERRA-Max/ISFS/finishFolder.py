@@ -36,8 +36,7 @@ def main():
 		sys.exit(1)
     
 	resampleForTemplate(args[0], args[1])	
-	ascDir = createAsc(args[1])
-	fixAscNan(ascDir)
+	createAsc(args[1])
 
 ##############################################
 # resampleForTemplate
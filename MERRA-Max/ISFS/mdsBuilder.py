@@ -6,6 +6,10 @@ import os
 import shutil
 import sys
 
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
 from osgeo import gdal
 from osgeo import gdalconst
 from osgeo import gdal_array
@@ -13,6 +17,15 @@ from osgeo import osr
 
 from optparse import OptionParser
 
+# The value written for points outside an image or on its no-data pixels.
+nodata = -9999.0
+
+# The largest window read at once; sparser points are read tile by tile.
+maxWindowPixels = 16 * 1024 * 1024
+
+# The number of images sampled concurrently.
+numThreads = 8
+
 #-------------------------------------------------------------------------------
 # createMDS
 #-------------------------------------------------------------------------------
@@ -21,10 +34,10 @@ def createMDS(fdFile, imgFiles, catFiles, outFile):
     # Read the entire csv file.
     fieldData = readFieldData(fdFile)
 
-    # Loop through image files.
+    # Sample the image files.
     fieldData = loadValues(imgFiles, fieldData)
     
-    # Loop through categorical image files.
+    # Sample the categorical image files.
     fieldData = loadValues(catFiles, fieldData, True)
     
     # Write the field data
@@ -48,6 +61,9 @@ def getEPSG(dataset):
 
 #-------------------------------------------------------------------------------
 # groundToImage
+#
+# This accepts scalars or arrays of coordinates, and returns the zero-based
+# column and row of the pixels containing them.
 #-------------------------------------------------------------------------------
 def groundToImage(x, y, coefs):
     
@@ -56,29 +72,44 @@ def groundToImage(x, y, coefs):
     pixelWidth  = coefs[1] 
     pixelHeight = coefs[5] 
     
-    xOffset = round(float((x - xOrigin) / pixelWidth))
-    yOffset = round(float((y - yOrigin) / pixelHeight))
+    xOffset = numpy.floor((numpy.asarray(x, numpy.float64) - xOrigin) / \
+                          pixelWidth).astype(numpy.int64)
+                          
+    yOffset = numpy.floor((numpy.asarray(y, numpy.float64) - yOrigin) / \
+                          pixelHeight).astype(numpy.int64)
     
     return [xOffset, yOffset]
 
 #-------------------------------------------------------------------------------
 # loadValues
+#
+# Each image is sampled at every point in one batch, and the images are
+# sampled concurrently, each by a thread with its own dataset.
 #-------------------------------------------------------------------------------
 def loadValues(imgFiles, fieldData, isCategorical = False):
     
-    epsg = None
-    firstEPSG = None
+    if not imgFiles:
+        return fieldData
+        
+    xs = numpy.array([float(row[0]) for row in fieldData[1:]])
+    ys = numpy.array([float(row[1]) for row in fieldData[1:]])
+    
+    pool = ThreadPool(max(min(numThreads, len(imgFiles)), 1))
     
-    for imgFile in imgFiles:  
+    try:
+        samples = pool.map(lambda imgFile: sampleImage(imgFile, xs, ys,
+                                                       isCategorical), 
+                           imgFiles)
         
-        # Open the image.
-        dataset = gdal.Open(imgFile, gdalconst.GA_ReadOnly)
-
-        if not dataset: 
-            raise RuntimeError('Unable to read ' + imgFile + '.')
+    finally:
         
-        # Ensure each image is of the same projection.
-        epsg = getEPSG(dataset)
+        pool.close()
+        pool.join()
+        
+    # Ensure each image is of the same projection.
+    firstEPSG = None
+    
+    for imgFile, (epsg, values) in zip(imgFiles, samples):
         
         if not firstEPSG:
             
@@ -87,53 +118,127 @@ def loadValues(imgFiles, fieldData, isCategorical = False):
         elif epsg != firstEPSG:
             
             raise RuntimeError('Error: image ' + imgFile + \
-                               ' has EPSG ' + epsg + \
+                               ' has EPSG ' + str(epsg) + \
                                '.  Previous images have EPSG ' + \
-                               firstEPSG + '.')
+                               str(firstEPSG) + '.')
         
         # Load the values for the current image.
         path, fileName = os.path.split(imgFile)
         name, ext = os.path.splitext(fileName)
         if isCategorical:  name = 'categorical:' + name
-        fieldData = loadValuesForImage(dataset, fieldData, name)
+        fieldData = loadValuesForImage(values, fieldData, name)
     
     return fieldData
 
 #-------------------------------------------------------------------------------
 # loadValuesForImage
 #-------------------------------------------------------------------------------
-def loadValuesForImage(dataset, fieldData, predictorName):
+def loadValuesForImage(values, fieldData, predictorName):
         
-    # Loop through field data.
-    first = True
+    fieldData[0].append(predictorName)
     
-    for row in fieldData:
+    for row, value in zip(fieldData[1:], values.tolist()):
+        row.append(value)
+                    
+    return fieldData
+
+#-------------------------------------------------------------------------------
+# readPixels
+#
+# This reads the pixels at the given columns and rows.  Nearby points are read
+# in one window.  Points spread over a larger area are read a block-aligned
+# tile at a time, reading only tiles that contain points.
+#-------------------------------------------------------------------------------
+def readPixels(band, cols, rows, dtype = numpy.float64):
+    
+    values = numpy.empty(len(cols), dtype)
+    
+    if len(cols) == 0:
+        return values
         
-        if first == True:
-            
-            first = False
-            row.append(predictorName)
+    xMin, xMax = int(cols.min()), int(cols.max())
+    yMin, yMax = int(rows.min()), int(rows.max())
+    width      = xMax - xMin + 1
+    height     = yMax - yMin + 1
+    
+    if width * height <= maxWindowPixels:
         
-        else:
-            
-            # Ground to image.
-            coefs = dataset.GetGeoTransform()
-            x = float(row[0])
-            y = float(row[1])
-            
-            offsets = groundToImage(x, y, coefs)
+        window = band.ReadAsArray(xMin, yMin, width, height)
+        values[:] = window[rows - yMin, cols - xMin]
+        return values
+        
+    # Read tile by tile.
+    blockWidth, blockHeight = band.GetBlockSize()
+    tileWidth  = max(blockWidth,  256)
+    tileHeight = max(blockHeight, 256)
+    tileCols   = cols // tileWidth
+    tileRows   = rows // tileHeight
+    tileIds    = tileRows * (band.XSize // tileWidth + 1) + tileCols
+    
+    for tileId in numpy.unique(tileIds):
+        
+        inTile = tileIds == tileId
+        x0     = int(tileCols[inTile][0]) * tileWidth
+        y0     = int(tileRows[inTile][0]) * tileHeight
+        
+        tile = band.ReadAsArray(x0, 
+                                y0, 
+                                min(tileWidth,  band.XSize - x0),
+                                min(tileHeight, band.YSize - y0))
+                                
+        values[inTile] = tile[rows[inTile] - y0, cols[inTile] - x0]
+        
+    return values
+    
+#-------------------------------------------------------------------------------
+# sampleImage
+#
+# This returns the image's EPSG code and its values at the points.  Points
+# outside the image, and its no-data or NaN pixels, get the nodata value.
+# Categorical values of an integer band stay integers.
+#-------------------------------------------------------------------------------
+def sampleImage(imgFile, xs, ys, isCategorical = False):
+    
+    # Open the image.
+    dataset = gdal.Open(imgFile, gdalconst.GA_ReadOnly)
 
-            # Offsets start at 1, while bands start at 0.
-            xOffset = int(offsets[0]) - 1
-            yOffset = int(offsets[1]) - 1
+    if not dataset: 
+        raise RuntimeError('Unable to read ' + imgFile + '.')
+        
+    epsg = getEPSG(dataset)
+    band = dataset.GetRasterBand(1)
+    
+    # Ground to image, for every point at once.
+    cols, rows = groundToImage(xs, ys, dataset.GetGeoTransform())
+    
+    inBounds = (cols >= 0) & (cols < dataset.RasterXSize) & \
+               (rows >= 0) & (rows < dataset.RasterYSize)
+               
+    dtype = numpy.float64
+    
+    if isCategorical:
+        
+        bandType = gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType)
+        
+        if numpy.issubdtype(bandType, numpy.integer):
+            dtype = numpy.int64
             
-            band = dataset.GetRasterBand(1)
-            data = band.ReadAsArray(xOffset, yOffset, 1, 1)
+    values = numpy.empty(len(xs), dtype)
+    values.fill(nodata)
     
-            value = data[0, 0]
-            row.append(value)
-                    
-    return fieldData
+    values[inBounds] = readPixels(band, 
+                                  cols[inBounds], 
+                                  rows[inBounds], 
+                                  dtype)
+    
+    imageNoData = band.GetNoDataValue()
+    
+    if imageNoData is not None:
+        values[values == imageNoData] = nodata
+        
+    values[~numpy.isfinite(values)] = nodata
+    
+    return epsg, values
 
 #-------------------------------------------------------------------------------
 # readFieldData
@@ -6,6 +6,10 @@ import math
 import os
 import shutil
 import sys
+import tempfile
+import time
+
+import numpy
 
 from   optparse import OptionParser
 
@@ -14,6 +18,9 @@ from   osgeo    import gdal
 	
 nodata = -9999.0
 
+# Rows read, converted and written at a time by writeAsc.
+blockRows = 256
+
 ##############################################
 # main
 ##############################################
@@ -26,18 +33,58 @@ def main():
 	desc = "This application converts tifs in the input directory to ASCII/Grid format."
 	
 	parser = OptionParser(usage=usageStmt, description=desc)
+	
+	parser.add_option("-b", "--benchmark", action="store_true", default=False,
+					  help="time writeAsc against gdal_translate and fixAscNan for an input file")
+	
 	(options, args) = parser.parse_args()
 
 	if len(args) < 1:
 		print "An input file or directory must be specified."
 		sys.exit(1)
 		
+	if options.benchmark:
+		benchmarkAsc(args[0])
+		return
+		
 	ascDir = createAsc(args[0])
-	if ascDir == None: sys.exit(1)
+	if not ascDir: sys.exit(1)
 	
-	result = fixAscNan(ascDir)
+##############################################
+# benchmarkAsc
+#
+# This compares writeAsc with the previous two-step conversion, gdal_translate
+# followed by fixAscNan, for one image.
+##############################################
+def benchmarkAsc(inFile):
+
+	tempDir = tempfile.mkdtemp()
 	
-	if result == False: sys.exit(1)
+	try:
+		gdalFile  = os.path.join(tempDir, "gdal.asc")
+		numpyFile = os.path.join(tempDir, "numpy.asc")
+		
+		startTime = time.time()
+		cmd = 'gdal_translate -q -ot Float32 -a_nodata ' + str(nodata) + ' -of AAIGrid "' + inFile + '" "' + gdalFile + '"'
+		os.system(cmd)
+		fixAscNan([gdalFile])
+		gdalTime = time.time() - startTime
+		
+		startTime = time.time()
+		writeAsc(inFile, numpyFile)
+		numpyTime = time.time() - startTime
+		
+		gdalValues  = numpy.loadtxt(gdalFile,  skiprows=6)
+		numpyValues = numpy.loadtxt(numpyFile, skiprows=6)
+		
+		print "gdal_translate + fixAscNan: " + str(gdalTime) + " seconds, " + str(os.path.getsize(gdalFile)) + " bytes"
+		print "writeAsc:                   " + str(numpyTime) + " seconds, " + str(os.path.getsize(numpyFile)) + " bytes"
+		print "Speed up:                   " + str(gdalTime / max(numpyTime, 1e-9))
+		print "Maximum difference:         " + str(numpy.abs(gdalValues - numpyValues).max())
+		
+	finally:
+		shutil.rmtree(tempDir)
+		
 	
 ##############################################
 # fixAscNan
@@ -94,30 +141,93 @@ def createAsc(inDir):
 	if not os.path.exists(ascDir): os.mkdir(ascDir)
 
 	for inFile in sourceImages:
+	
+		if createAscFile(inFile, ascDir) == None:
+			return False
+			
+	return ascDir
+		
+##############################################
+# createAscFile
+##############################################
+def createAscFile(inFile, ascDir):
+	return createLayerFile(inFile, ascDir, "asc")
+	
+##############################################
+# createLayerFile
+#
+# The layer format is "asc" for ASCII/Grid or "bil" for binary, band-
+# interleaved-by-line with an ESRI .hdr header.  Images known to have square
+# pixels, such as warpToGrid's, are not checked and squared again.
+##############################################
+def createLayerFile(inFile, layerDir, layerFormat, isSquare = False):
 
-		print "Creating asc image from " + inFile + "..."
+	print "Creating " + layerFormat + " image from " + inFile + "..."
+	
+	path, inFileNameOnly = os.path.split(inFile)
+	basename, extension = os.path.splitext(inFileNameOnly)
+	
+	outFile   = layerDir + "/" + basename + "." + layerFormat
+	squareTif = layerDir + "/" + basename + "-squared.tif"
+	
+	convertFile = inFile
+	wasSquared = not isSquare and squarePixels(inFile, squareTif)
+	if wasSquared: convertFile = squareTif
+	
+	try:
+		if layerFormat == "bil":
+			writeBil(convertFile, outFile)
+		else:
+			writeAsc(convertFile, outFile)
 		
-		path, inFileNameOnly = os.path.split(inFile)
-		basename, extension = os.path.splitext(inFileNameOnly)
+	except RuntimeError, e:
+		print str(e)
+		return None
 		
-		outFile   = ascDir + "/" + basename + ".asc"
-		squareTif = ascDir + "/" + basename + "-squared.tif"
+	finally:
+		if wasSquared: os.remove(squareTif)
+	
+	return outFile
+	
+##############################################
+# openSquareImage
+##############################################
+def openSquareImage(inFile):
+
+	dataset = gdal.Open(inFile, gdalconst.GA_ReadOnly)
+	if dataset is None:
+		raise RuntimeError("Unable to open " + inFile)
 		
-		convertFile = inFile
-		wasSquared = squarePixels(inFile, squareTif)
-		if wasSquared: convertFile = squareTif
+	xform = dataset.GetGeoTransform()
+	
+	if math.fabs(math.fabs(xform[1]) - math.fabs(xform[5])) > 0.0000001:
+		raise RuntimeError("The pixels in " + inFile + " are not square.")
 		
-		cmd = 'gdal_translate -ot Float32 -a_nodata ' + str(nodata) + ' -of AAIGrid "' + convertFile + '" "' + outFile + '"'
-		os.system(cmd)
+	return dataset
+	
+##############################################
+# readBlocks
+#
+# This yields the image blockRows rows at a time, as Float32 arrays in which
+# NaNs and the image's no-data values are replaced by the nodata value.
+##############################################
+def readBlocks(dataset):
+
+	width  = dataset.RasterXSize
+	height = dataset.RasterYSize
+	band   = dataset.GetRasterBand(1)
+	imageNoData = band.GetNoDataValue()
+	
+	for row in range(0, height, blockRows):
+	
+		numRows = min(blockRows, height - row)
+		block = band.ReadAsArray(0, row, width, numRows).astype(numpy.float32)
 		
-		if wasSquared: os.remove(squareTif)
+		invalid = ~numpy.isfinite(block)
+		if imageNoData is not None: invalid |= block == numpy.float32(imageNoData)
+		block[invalid] = nodata
 		
-		# Check for the output file, ensuring gdal_translate succeeded.
-		if not os.path.exists(outFile):
-			print "gdal_translate did not produce output.  The command was " + cmd
-			return False
-			
-	return ascDir
+		yield block
 		
 ##############################################
 # squarePixels
@@ -172,6 +282,85 @@ def squarePixels(inFile, outFile):
 	
 	return False
 	
+##############################################
+# writeAsc
+#
+# This writes an ASCII/Grid file in one pass, formatting each block read by
+# readBlocks straight to disk.  The pixels must be square.
+##############################################
+def writeAsc(inFile, outFile):
+
+	dataset = openSquareImage(inFile)
+	xform   = dataset.GetGeoTransform()
+	height  = dataset.RasterYSize
+	
+	tempFile = outFile + ".tmp"
+	
+	try:
+		with open(tempFile, "w") as f:
+		
+			f.write("ncols        " + str(dataset.RasterXSize) + "\n")
+			f.write("nrows        " + str(height) + "\n")
+			f.write("xllcorner    " + repr(xform[0]) + "\n")
+			f.write("yllcorner    " + repr(xform[3] + height * xform[5]) + "\n")
+			f.write("cellsize     " + repr(math.fabs(xform[1])) + "\n")
+			f.write("NODATA_value " + str(int(nodata)) + "\n")
+			
+			for block in readBlocks(dataset):
+				numpy.savetxt(f, block, fmt="%.8g", delimiter=" ")
+				
+		os.rename(tempFile, outFile)
+		
+	except:
+		if os.path.exists(tempFile): os.remove(tempFile)
+		raise
+		
+	return outFile
+	
+##############################################
+# writeBil
+#
+# This writes little-endian Float32 pixels, and an ESRI .hdr file beside them
+# that locates the centre of the upper-left pixel.  The pixels must be square.
+##############################################
+def writeBil(inFile, outFile):
+
+	dataset = openSquareImage(inFile)
+	xform   = dataset.GetGeoTransform()
+	scale   = math.fabs(xform[1])
+	hdrFile = os.path.splitext(outFile)[0] + ".hdr"
+	
+	tempFile = outFile + ".tmp"
+	
+	try:
+		with open(tempFile, "wb") as f:
+			for block in readBlocks(dataset):
+				block.astype("<f4").tofile(f)
+				
+		with open(hdrFile, "w") as f:
+		
+			f.write("BYTEORDER      I\n")
+			f.write("LAYOUT         BIL\n")
+			f.write("NROWS          " + str(dataset.RasterYSize) + "\n")
+			f.write("NCOLS          " + str(dataset.RasterXSize) + "\n")
+			f.write("NBANDS         1\n")
+			f.write("NBITS          32\n")
+			f.write("PIXELTYPE      FLOAT\n")
+			f.write("ULXMAP         " + repr(xform[0] + scale / 2.0) + "\n")
+			f.write("ULYMAP         " + repr(xform[3] - scale / 2.0) + "\n")
+			f.write("XDIM           " + repr(scale) + "\n")
+			f.write("YDIM           " + repr(scale) + "\n")
+			f.write("NODATA         " + str(int(nodata)) + "\n")
+			
+		os.rename(tempFile, outFile)
+		
+	except:
+		for partial in [tempFile, hdrFile]:
+			if os.path.exists(partial): os.remove(partial)
+		raise
+		
+	return outFile
+	
 ##############################################
 # Invoke the main
 ##############################################
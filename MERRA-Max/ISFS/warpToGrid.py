@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+import argparse
+import glob
+import math
+import os
+import sys
+
+from osgeo import gdal
+from osgeo import gdalconst
+from osgeo import osr
+
+#-------------------------------------------------------------------------------
+# This replaces clipReproject, finishFolder and tif2asc.squarePixels for
+# preparing a directory of predictors.  The final grid is computed once, then
+# each source image is clipped, reprojected, squared and resampled by a single
+# in-process warp, without intermediate files.
+#-------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------
+# computeTargetGrid
+#
+# Returns ulx, uly, lrx, lry, scale in the destination SRS.  The scale is the
+# coarsest resolution any source image would have after reprojection, used for
+# both axes, so the pixels are square.  The extent is the AOI, transformed to
+# the destination SRS and extended to a whole number of pixels.
+#-------------------------------------------------------------------------------
+def computeTargetGrid(sourceImages, destEPSG, ulx, uly, lrx, lry, clipEPSG):
+
+    if len(sourceImages) == 0:
+        raise RuntimeError('There are no images from which to compute a grid.')
+
+    destSRS = getSRS(destEPSG)
+    clipSRS = getSRS(clipEPSG)
+
+    # Find the coarsest resolution among the reprojected source images.
+    destWkt = destSRS.ExportToWkt()
+    scale   = 0.0
+
+    for sourceImage in sourceImages:
+
+        dataset = gdal.Open(sourceImage, gdalconst.GA_ReadOnly)
+
+        if not dataset:
+            raise RuntimeError('Unable to read ' + sourceImage + '.')
+
+        vrt   = gdal.AutoCreateWarpedVRT(dataset, None, destWkt)
+        xform = vrt.GetGeoTransform()
+        scale = max(scale, math.fabs(xform[1]), math.fabs(xform[5]))
+
+    # Transform the AOI to the destination SRS.
+    xUl, yUl, xLr, yLr = ulx, uly, lrx, lry
+
+    if not clipSRS.IsSame(destSRS):
+
+        xform   = osr.CoordinateTransformation(clipSRS, destSRS)
+        corners = [xform.TransformPoint(x, y)
+                   for x, y in [(ulx, uly), (lrx, uly), (lrx, lry), (ulx, lry)]]
+
+        xUl = min([c[0] for c in corners])
+        xLr = max([c[0] for c in corners])
+        yUl = max([c[1] for c in corners])
+        yLr = min([c[1] for c in corners])
+
+    # Snap the lower-right corner to a whole number of square pixels.
+    numCols = max(int(math.ceil((xLr - xUl) / scale - 1e-9)), 1)
+    numRows = max(int(math.ceil((yUl - yLr) / scale - 1e-9)), 1)
+    xLr     = xUl + numCols * scale
+    yLr     = yUl - numRows * scale
+
+    return xUl, yUl, xLr, yLr, scale
+
+#-------------------------------------------------------------------------------
+# getSRS
+#-------------------------------------------------------------------------------
+def getSRS(epsg):
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(int(str(epsg).upper().replace('EPSG:', '')))
+
+    # GDAL 3 honors the authority's axis order, unless told otherwise.
+    if hasattr(srs, 'SetAxisMappingStrategy'):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    return srs
+
+#-------------------------------------------------------------------------------
+# warpDir
+#-------------------------------------------------------------------------------
+def warpDir(sourceDir, destDir, destEPSG, ulx, uly, lrx, lry, clipEPSG):
+
+    sourceDir = os.path.expanduser(sourceDir)
+    destDir   = os.path.expanduser(destDir)
+
+    if sourceDir == destDir:
+        raise RuntimeError('The source and destination directories must differ.')
+
+    sourceImages = sorted(glob.glob(os.path.join(sourceDir, '*.tif')))
+
+    grid = computeTargetGrid(sourceImages, destEPSG, ulx, uly, lrx, lry,
+                             clipEPSG)
+
+    destImages = []
+
+    for sourceImage in sourceImages:
+
+        destImage = os.path.join(destDir, os.path.basename(sourceImage))
+        warpFile(sourceImage, destImage, destEPSG, grid)
+        destImages.append(destImage)
+
+    return destImages
+
+#-------------------------------------------------------------------------------
+# warpFile
+#
+# The grid is the tuple from computeTargetGrid.
+#-------------------------------------------------------------------------------
+def warpFile(sourceFile, destFile, destEPSG, grid):
+
+    ulx, uly, lrx, lry, scale = grid
+
+    options = gdal.WarpOptions(dstSRS = getSRS(destEPSG).ExportToWkt(),
+                               outputBounds = (ulx, lry, lrx, uly),
+                               xRes = scale,
+                               yRes = scale,
+                               multithread = True)
+
+    dataset = gdal.Warp(destFile, sourceFile, options = options)
+
+    if not dataset:
+
+        if os.path.exists(destFile):
+            os.remove(destFile)
+
+        raise RuntimeError('Unable to warp ' + sourceFile + '.')
+
+    # Closing the dataset flushes it to disk.
+    dataset = None
+
+    return destFile
+
+#-------------------------------------------------------------------------------
+# main
+#-------------------------------------------------------------------------------
+def main():
+
+    desc = 'This application clips, reprojects and resamples a directory ' + \
+           'of tifs to a common grid of square pixels in a single warp.'
+
+    parser = argparse.ArgumentParser(description = desc)
+    parser.add_argument('-i', required = True, help = 'source directory')
+    parser.add_argument('-o', required = True, help = 'destination directory')
+    parser.add_argument('--epsg', required = True, help = 'destination EPSG')
+    parser.add_argument('--ulx', required = True, type = float)
+    parser.add_argument('--uly', required = True, type = float)
+    parser.add_argument('--lrx', required = True, type = float)
+    parser.add_argument('--lry', required = True, type = float)
+
+    parser.add_argument('--clipEpsg',
+                        help = 'EPSG of the corners; defaults to --epsg')
+
+    args = parser.parse_args()
+
+    warpDir(args.i, args.o, args.epsg, args.ulx, args.uly, args.lrx, args.lry,
+            args.clipEpsg or args.epsg)
+
+#-------------------------------------------------------------------------------
+# Invoke the main
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,110 @@
 
 import csv
+import math
 import os
 import shutil
+import subprocess
+import threading
+
+from osgeo import gdal
+from osgeo import gdalconst
 
 #-------------------------------------------------------------------------------
 # class MaxEntHelper
 #-------------------------------------------------------------------------------
 class MaxEntHelper(object):
 
+    FULL_PROFILE      = 'full'
+    SCREENING_PROFILE = 'screening'
+    
+    # The heap, in megabytes, when there is nothing from which to estimate it.
+    DEFAULT_HEAP = 1024
+    
+    # MaxEnt draws at most this many background points from grids.
+    MAX_BACKGROUND_POINTS = 10000
+    
+    # The JVM exits with this code when it runs out of memory.
+    OOM_EXIT_CODE = 3
+    
+    # A run killed for exceeding its time limit has this code, as with
+    # coreutils' timeout.
+    TIMEOUT_EXIT_CODE = 124
+    
+    # Outcomes of a run
+    BAD_INPUT = 'badInput'
+    OOM       = 'oom'
+    SUCCESS   = 'success'
+    TIMEOUT   = 'timeout'
+    UNKNOWN   = 'unknown'
+    
+    # Outcomes that may not recur when run again.  A run out of memory has
+    # already been retried with more heap.
+    TRANSIENT_OUTCOMES = [TIMEOUT, UNKNOWN]
+    
+    #---
+    # Screening trials are read only for their variable contributions, which
+    # MaxEnt writes to maxentResults.csv regardless of these flags.  The full
+    # profile is for the final model.
+    #---
+    PROFILES = {FULL_PROFILE      : ['-P', '-J', 'writeplotdata'],
+    
+                SCREENING_PROFILE : ['responsecurves=false', 
+                                     'jackknife=false',
+                                     'writeplotdata=false',
+                                     'pictures=false',
+                                     'outputgrids=false']}
+    
+    #---------------------------------------------------------------------------
+    # classifyOutcome
+    #
+    # A run succeeds only when MaxEnt exits with zero and writes its results.
+    # Bad input is found before MaxEnt runs, by getMaxEntArgs.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def classifyOutcome(exitCode, outDir):
+        
+        resultsFile = os.path.join(outDir, 'maxentResults.csv')
+        
+        if exitCode == 0 and os.path.exists(resultsFile):
+            return MaxEntHelper.SUCCESS
+            
+        if exitCode == MaxEntHelper.OOM_EXIT_CODE:
+            return MaxEntHelper.OOM
+            
+        if exitCode == MaxEntHelper.TIMEOUT_EXIT_CODE:
+            return MaxEntHelper.TIMEOUT
+            
+        return MaxEntHelper.UNKNOWN
+        
+    #---------------------------------------------------------------------------
+    # convertLayers
+    #
+    # MaxEnt converts a directory of layers to another format, including its
+    # own compressed .mxe format, which is the fastest for it to read.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def convertLayers(inDir, inFormat, outDir, outFormat, logger):
+        
+        if not os.path.exists(outDir):
+            os.mkdir(outDir)
+            
+        cmd = 'java -Xmx1024m -cp ' + MaxEntHelper.getMaxEntJar() + \
+              ' density.Convert "' + inDir + '" ' + inFormat + ' "' + \
+              outDir + '" ' + outFormat
+              
+        if logger:
+            logger.info('MaxEnt conversion command: ' + cmd)
+            
+        exitCode = subprocess.call(cmd, shell = True)
+        
+        if exitCode != 0:
+            raise RuntimeError('Unable to convert the layers in ' + inDir)
+            
     #---------------------------------------------------------------------------
     # copyAscFiles
     #---------------------------------------------------------------------------
     @staticmethod
-    def copyAscFiles(predFiles, destDir):
+    def copyAscFiles(predFiles, destDir, layerFormat = 'asc'):
         
         if not destDir:
             raise RuntimeError('A destination directory must be provided.')
@@ -25,23 +117,10 @@ class MaxEntHelper(object):
             
         for predFile in predFiles:
             
-            # If it is a TIF file, get the ASC version.
-            path, name = os.path.split(predFile)
-            ascName    = None
-            sourceFile = None
-
-            if '.tif' in name:
-                
-                ascName    = name.replace('.tif', '.asc')
-                sourceFile = os.path.join(path, 'asc', ascName)
+            for sourceFile in MaxEntHelper.getLayerFiles(predFile, layerFormat):
 
-            else:
-                
-                ascName    = name
-                sourceFile = predFile
-                
-            destFile = os.path.join(destDir, ascName)
-            shutil.copyfile(sourceFile, destFile)
+                destFile = os.path.join(destDir, os.path.basename(sourceFile))
+                shutil.copyfile(sourceFile, destFile)
                 
     #---------------------------------------------------------------------------
     # createSamplesFile
@@ -71,39 +150,260 @@ class MaxEntHelper(object):
         return samplesFile
         
     #---------------------------------------------------------------------------
-    # runMaxEnt
+    # estimateHeap
+    #
+    # This estimates the megabytes of heap MaxEnt needs.  It holds each
+    # selected layer's grid as floats, and a row of features for each sample
+    # point, with up to a product feature for each pair of layers.  Output
+    # grids add one more grid.  Samples-with-data runs have no grids.
     #---------------------------------------------------------------------------
     @staticmethod
-    def runMaxEnt(speciesFile, ascDir, outDir, logger):
+    def estimateHeap(numCells, numLayers, numPoints):
+        
+        BASE_MB  = 256
+        MARGIN   = 1.5
+        STEP_MB  = 64
+        
+        gridBytes    = 4 * numCells * (numLayers + 1)
+        featureBytes = 8 * numPoints * (numLayers + numLayers ** 2)
+        heapMB       = BASE_MB + \
+                       MARGIN * (gridBytes + featureBytes) / (1024.0 * 1024.0)
+        
+        return max(int(math.ceil(heapMB / STEP_MB)) * STEP_MB, 2 * BASE_MB)
+        
+    #---------------------------------------------------------------------------
+    # getLayerFiles
+    #
+    # If the predictor is a TIF file, its layer is in the subdirectory named
+    # for the layer format.  A .bil layer needs its .hdr file too.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getLayerFiles(predFile, layerFormat):
+        
+        path, name = os.path.split(predFile)
+        
+        if '.tif' in name:
+
+            layerName = name.replace('.tif', '.' + layerFormat)
+            layerFile = os.path.join(path, layerFormat, layerName)
+
+        else:
+            layerFile = predFile
+            
+        layerFiles = [layerFile]
+        
+        if layerFile.endswith('.bil'):
+            layerFiles.append(os.path.splitext(layerFile)[0] + '.hdr')
+            
+        return layerFiles
+        
+    #---------------------------------------------------------------------------
+    # getMaxEntArgs
+    #
+    # The layers are a directory of grids or a samples-with-data background
+    # file.  Each name in toggles is passed to MaxEnt's -N flag.  The profile
+    # names the set of outputs MaxEnt writes.  MaxEnt draws the background of
+    # grid layers from the bias file's cells, weighted by its values.  This
+    # returns MaxEnt's arguments, as it receives them, for a JVM of its own or
+    # a worker's.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getMaxEntArgs(speciesFile, layerDir, outDir, toggles = None,
+                      projectionDir = None, profile = FULL_PROFILE,
+                      biasFile = None):
         
         if not os.path.exists(speciesFile):
 
             raise RuntimeError('Species file: ' + str(speciesFile) + \
                                ' does not exist.')
 
-        if not ascDir or not os.path.isdir(ascDir):
-            raise RuntimeError('You must provide an ASC directory.')
+        if not layerDir or not os.path.exists(layerDir):
+            
+            raise RuntimeError('You must provide a layer directory or ' + \
+                               'samples-with-data file.')
 
         if not outDir or not os.path.isdir(outDir):
             raise RuntimeError('You must provide an output directory.')
 
-        maxentJar = os.path.join(os.path.dirname(os.path.realpath(__file__)),
-                                 'ISFS',
-                                 'maxent.jar')
-        
-        baseCmd = 'java -Xmx1024m -jar ' + \
-                  maxentJar + \
-                  ' visible=false autorun -P -J writeplotdata ' + \
-                  '"applythresholdrule=Equal training sensitivity and specificity" ' + \
-                  'removeduplicates=false '
-                  
-        cmd = baseCmd + \
-              '-s "' + speciesFile + '" ' + \
-              '-e "' + ascDir + '" ' + \
-              '-o "' + outDir + '"'
+        if profile not in MaxEntHelper.PROFILES:
+            
+            raise RuntimeError('The MaxEnt profile must be one of ' + \
+                               str(sorted(MaxEntHelper.PROFILES.keys())) + '.')
+            
+        args = ['visible=false', 'autorun'] + \
+               MaxEntHelper.PROFILES[profile] + \
+               ['applythresholdrule=Equal training sensitivity and specificity',
+                'removeduplicates=false',
+                '-s', speciesFile,
+                '-e', layerDir,
+                '-o', outDir]
+              
+        for toggle in toggles or []:
+            args += ['-N', toggle]
+        
+        # A model trained on samples with data is projected onto grids.
+        if projectionDir:
+            args.append('projectionlayers=' + projectionDir)
+        
+        if biasFile:
+            args.append('biasfile=' + biasFile)
+            
+        return args
+        
+    #---------------------------------------------------------------------------
+    # getMaxEntJar
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getMaxEntJar():
+        
+        return os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            'ISFS',
+                            'maxent.jar')
+        
+    #---------------------------------------------------------------------------
+    # getNumCells
+    #
+    # This returns the number of cells in a layer's grid.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getNumCells(layerFile):
+        
+        dataset = gdal.Open(layerFile, gdalconst.GA_ReadOnly)
+        
+        if not dataset:
+            raise RuntimeError('Unable to read ' + str(layerFile) + '.')
+            
+        return dataset.RasterXSize * dataset.RasterYSize
+        
+    #---------------------------------------------------------------------------
+    # getToggles
+    #
+    # MaxEnt's -N flag toggles every layer whose name begins with the given
+    # prefix, so deselecting "T2M" would also toggle "T2MMAX".  Walking the
+    # names in sorted order, where every name precedes its extensions, and
+    # toggling each layer whose state is still wrong, yields toggles that
+    # select exactly the given layers.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getToggles(layerNames, selectedNames):
+        
+        selectedNames = set(selectedNames)
+        missing       = selectedNames - set(layerNames)
+        
+        if missing:
+            raise RuntimeError('Layers not available: ' + str(sorted(missing)))
+            
+        isSelected = dict([(name, True) for name in layerNames])
+        toggles    = []
+        
+        for name in sorted(layerNames):
+            
+            if isSelected[name] != (name in selectedNames):
+                
+                toggles.append(name)
+                
+                for other in isSelected.iterkeys():
+                    
+                    if other.startswith(name):
+                        isSelected[other] = not isSelected[other]
+                        
+        return toggles
+        
+    #---------------------------------------------------------------------------
+    # linkLayerFiles
+    #
+    # This is like copyAscFiles, but links the layers instead of copying them.
+    # Where links are not supported, the layers are copied.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def linkLayerFiles(predFiles, destDir, layerFormat = 'asc'):
+        
+        if not hasattr(os, 'symlink'):
+            
+            MaxEntHelper.copyAscFiles(predFiles, destDir, layerFormat)
+            return
+            
+        if not destDir or not os.path.isdir(destDir):
+            raise RuntimeError('A destination directory must be provided.')
+            
+        for predFile in predFiles:
+            
+            for sourceFile in MaxEntHelper.getLayerFiles(predFile, layerFormat):
+
+                destFile = os.path.join(destDir, os.path.basename(sourceFile))
+                
+                if os.path.lexists(destFile):
+                    os.remove(destFile)
+                    
+                os.symlink(os.path.abspath(sourceFile), destFile)
+                
+    #---------------------------------------------------------------------------
+    # runMaxEnt
+    #
+    # The arguments are those of getMaxEntArgs.  When the heap is exhausted,
+    # the exit code is OOM_EXIT_CODE.  A run exceeding timeoutSeconds is
+    # killed, and its exit code is TIMEOUT_EXIT_CODE.  onStart, when given, is
+    # called with the MaxEnt process, so the caller can stop it.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def runMaxEnt(speciesFile, layerDir, outDir, logger, toggles = None,
+                  projectionDir = None, profile = FULL_PROFILE,
+                  heapMB = DEFAULT_HEAP, timeoutSeconds = None, onStart = None,
+                  biasFile = None):
+        
+        cmd = ['java', 
+               '-Xmx' + str(int(heapMB)) + 'm',
+               '-XX:+ExitOnOutOfMemoryError',
+               '-jar', MaxEntHelper.getMaxEntJar()] + \
+              MaxEntHelper.getMaxEntArgs(speciesFile, 
+                                         layerDir, 
+                                         outDir, 
+                                         toggles,
+                                         projectionDir, 
+                                         profile,
+                                         biasFile)
         
         if logger:
-            logger.info('MaxEnt command: ' + cmd)
+            
+            logger.info('MaxEnt command: ' + \
+                        ' '.join(['"' + a + '"' if ' ' in a else a 
+                                  for a in cmd]))
 
-        os.system(cmd)
-    
+        process = subprocess.Popen(cmd)
+        
+        if onStart:
+            onStart(process)
+            
+        if not timeoutSeconds:
+            return process.wait()
+            
+        timedOut = threading.Event()
+        
+        timer = threading.Timer(timeoutSeconds, 
+                                MaxEntHelper.stopProcess, 
+                                (process, timedOut))
+        
+        timer.start()
+        exitCode = process.wait()
+        timer.cancel()
+        
+        return MaxEntHelper.TIMEOUT_EXIT_CODE if timedOut.is_set() else exitCode
+        
+    #---------------------------------------------------------------------------
+    # stopProcess
+    #
+    # This kills a process that is still running, and sets the event to show
+    # it was stopped.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def stopProcess(process, stoppedEvent):
+        
+        if process.poll() == None:
+            
+            stoppedEvent.set()
+            
+            try:
+                process.kill()
+                
+            except OSError:
+                pass
@@ -0,0 +1,205 @@
+
+import os
+import Queue
+import subprocess
+import threading
+
+from MaxEntHelper import MaxEntHelper
+
+#-------------------------------------------------------------------------------
+# class MaxEntWorkerPool
+#
+# This keeps a number of MaxEnt JVMs alive, each running ISFS/MaxEntWorker, and
+# runs MaxEnt jobs in whichever is idle.  Jobs are the arguments from
+# MaxEntHelper.getMaxEntArgs, so they produce what a JVM of their own would.
+# The workers' heaps are reserved from the memory scheduler while the pool is
+# open.
+#-------------------------------------------------------------------------------
+class MaxEntWorkerPool(object):
+
+    WORKER_CLASS = 'MaxEntWorker'
+    WORKER_DONE  = 'MaxEntWorker: done '
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, numWorkers, heapMB, scheduler, logger = None):
+
+        # Reserve as many workers' heaps as fit in the budget.
+        numWorkers = max(min(numWorkers, scheduler.budgetMB // heapMB), 1)
+
+        self.classPath = MaxEntWorkerPool.compileWorker(logger)
+        self.heapMB    = heapMB
+        self.logger    = logger
+        self.scheduler = scheduler
+        self.idle      = Queue.Queue()
+        self.lock      = threading.Lock()
+        self.workers   = []
+
+        for i in range(numWorkers):
+
+            self.heapMB = self.scheduler.acquire(heapMB)
+            worker      = self.startWorker()
+            self.workers.append(worker)
+            self.idle.put(worker)
+
+        if self.logger:
+
+            self.logger.info('Started ' + str(numWorkers) + \
+                             ' MaxEnt workers with ' + str(self.heapMB) + \
+                             ' MB each.')
+
+    #---------------------------------------------------------------------------
+    # close
+    #---------------------------------------------------------------------------
+    def close(self):
+
+        for worker in self.workers:
+
+            try:
+                worker.stdin.close()
+
+            except IOError:
+                pass
+
+            worker.wait()
+            self.scheduler.release(self.heapMB)
+
+        self.workers = []
+
+    #---------------------------------------------------------------------------
+    # compileWorker
+    #
+    # This compiles the worker, when its class is missing or out of date, and
+    # returns the class path on which to run it.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def compileWorker(logger = None):
+
+        jarFile    = MaxEntHelper.getMaxEntJar()
+        workerDir  = os.path.dirname(jarFile)
+        sourceFile = os.path.join(workerDir,
+                                  MaxEntWorkerPool.WORKER_CLASS + '.java')
+
+        classFile  = os.path.join(workerDir,
+                                  MaxEntWorkerPool.WORKER_CLASS + '.class')
+
+        if not os.path.exists(classFile) or \
+           os.path.getmtime(classFile) < os.path.getmtime(sourceFile):
+
+            cmd = ['javac', '-cp', jarFile, '-d', workerDir, sourceFile]
+
+            if logger:
+                logger.info('Compiling the MaxEnt worker: ' + ' '.join(cmd))
+
+            if subprocess.call(cmd) != 0:
+                raise RuntimeError('Unable to compile ' + sourceFile + '.')
+
+        return os.pathsep.join([jarFile, workerDir])
+
+    #---------------------------------------------------------------------------
+    # run
+    #
+    # This runs one job in an idle worker and returns MaxEnt's exit code.  A
+    # worker whose JVM ended, as when it runs out of memory, is replaced, and
+    # the job's exit code is the JVM's.  A worker whose job exceeds
+    # timeoutSeconds is killed, and the exit code is TIMEOUT_EXIT_CODE.
+    # onStart, when given, is called with the worker's process, so the caller
+    # can stop it.
+    #---------------------------------------------------------------------------
+    def run(self, args, timeoutSeconds = None, onStart = None):
+
+        for arg in args:
+
+            if '\t' in arg or '\n' in arg:
+
+                raise RuntimeError('MaxEnt worker arguments cannot contain ' + \
+                                   'tabs or new lines: ' + arg)
+
+        worker   = self.idle.get()
+        exitCode = None
+        timedOut = threading.Event()
+        timer    = None
+        
+        if onStart:
+            onStart(worker)
+            
+        if timeoutSeconds:
+            
+            timer = threading.Timer(timeoutSeconds, 
+                                    MaxEntHelper.stopProcess, 
+                                    (worker, timedOut))
+                                    
+            timer.start()
+
+        try:
+            worker.stdin.write('\t'.join(args) + '\n')
+            worker.stdin.flush()
+
+            while exitCode == None:
+
+                line = worker.stdout.readline()
+
+                if not line:
+                    break
+
+                if line.startswith(MaxEntWorkerPool.WORKER_DONE):
+
+                    exitCode = \
+                        int(line[len(MaxEntWorkerPool.WORKER_DONE):].strip())
+
+        except IOError:
+            pass
+
+        finally:
+
+            if timer:
+                timer.cancel()
+                
+            # A worker killed as its job finished is replaced, too.
+            if exitCode == None or timedOut.is_set():
+
+                workerCode = worker.wait()
+                worker     = self.replaceWorker(worker)
+
+                if exitCode == None:
+                    
+                    exitCode = MaxEntHelper.TIMEOUT_EXIT_CODE \
+                               if timedOut.is_set() else workerCode
+                    
+            self.idle.put(worker)
+
+        return exitCode
+
+    #---------------------------------------------------------------------------
+    # replaceWorker
+    #---------------------------------------------------------------------------
+    def replaceWorker(self, worker):
+
+        if self.logger:
+
+            self.logger.warning('A MaxEnt worker exited with code ' + \
+                                str(worker.returncode) + '.  Restarting it.')
+
+        newWorker = self.startWorker()
+
+        with self.lock:
+            self.workers[self.workers.index(worker)] = newWorker
+
+        return newWorker
+
+    #---------------------------------------------------------------------------
+    # startWorker
+    #---------------------------------------------------------------------------
+    def startWorker(self):
+
+        cmd = ['java',
+               '-Xmx' + str(int(self.heapMB)) + 'm',
+               '-XX:+ExitOnOutOfMemoryError',
+               '-cp', self.classPath,
+               MaxEntWorkerPool.WORKER_CLASS]
+
+        return subprocess.Popen(cmd,
+                                stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE)
+
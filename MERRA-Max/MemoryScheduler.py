@@ -0,0 +1,112 @@
+
+import os
+import threading
+
+from MaxEntHelper import MaxEntHelper
+
+#-------------------------------------------------------------------------------
+# class MemoryScheduler
+#
+# This admits MaxEnt JVMs while the sum of their heaps fits the node's memory
+# budget, so a node runs many small JVMs or a few large ones.  A JVM that runs
+# out of memory is retried with twice the heap, up to the whole budget.
+#-------------------------------------------------------------------------------
+class MemoryScheduler(object):
+
+    # Without a budget, leave this fraction of RAM to the system.
+    RAM_FRACTION = 0.8
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, budgetMB = None, logger = None):
+
+        if not budgetMB:
+
+            budgetMB = int(MemoryScheduler.getPhysicalMemory() * \
+                           MemoryScheduler.RAM_FRACTION)
+
+        self.budgetMB  = budgetMB
+        self.logger    = logger
+        self.inUseMB   = 0
+        self.condition = threading.Condition()
+
+    #---------------------------------------------------------------------------
+    # acquire
+    #
+    # This blocks until the heap fits in the budget, then reserves it.  A heap
+    # larger than the budget is reduced to the budget.
+    #---------------------------------------------------------------------------
+    def acquire(self, heapMB):
+
+        heapMB = min(heapMB, self.budgetMB)
+
+        with self.condition:
+
+            while self.inUseMB + heapMB > self.budgetMB:
+                self.condition.wait()
+
+            self.inUseMB += heapMB
+
+        return heapMB
+
+    #---------------------------------------------------------------------------
+    # getPhysicalMemory
+    #
+    # This returns the node's RAM in megabytes, or MaxEnt's default heap when
+    # it cannot be determined.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getPhysicalMemory():
+
+        try:
+            numBytes = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+        except (AttributeError, ValueError, OSError):
+            return MaxEntHelper.DEFAULT_HEAP
+
+        return int(numBytes / (1024 * 1024))
+
+    #---------------------------------------------------------------------------
+    # release
+    #---------------------------------------------------------------------------
+    def release(self, heapMB):
+
+        with self.condition:
+
+            self.inUseMB -= heapMB
+            self.condition.notify_all()
+
+    #---------------------------------------------------------------------------
+    # run
+    #
+    # This calls runFunction with an admitted heap size and returns its exit
+    # code and the last heap size.  runFunction accepts the heap in megabytes
+    # and returns MaxEnt's exit code.
+    #---------------------------------------------------------------------------
+    def run(self, runFunction, heapMB):
+
+        while True:
+
+            heapMB = self.acquire(heapMB)
+
+            try:
+                exitCode = runFunction(heapMB)
+
+            finally:
+                self.release(heapMB)
+
+            if exitCode != MaxEntHelper.OOM_EXIT_CODE or \
+               heapMB >= self.budgetMB:
+
+                return exitCode, heapMB
+
+            if self.logger:
+
+                self.logger.warning('MaxEnt ran out of memory with ' + \
+                                    str(heapMB) + ' MB.  Retrying with ' + \
+                                    str(min(2 * heapMB, self.budgetMB)) + \
+                                    ' MB.')
+
+            heapMB *= 2
+
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+
+from osgeo import gdal
+
+from ContentCache import ContentCache
+from ISFS import warpToGrid
+
+#-------------------------------------------------------------------------------
+# class MerraCache
+#
+# This keeps MERRA orders from RECOVER across runs, so an area and dates
+# already ordered are not ordered again.  Orders are indexed by product, EPSG
+# code, extent and dates.  A request within the extent of a cached order is
+# satisfied by clipping the order's images to the request's extent.
+#
+# MERRA Max images summarize the whole of an order's dates, so a longer order
+# cannot be subset to shorter dates.  Dates must match an order's exactly.
+#-------------------------------------------------------------------------------
+class MerraCache(ContentCache):
+
+    CACHE_FILE  = 'merra.db'
+    COLUMNS     = [('product',   'TEXT'),
+                   ('epsg',      'INTEGER'),
+                   ('ulx',       'REAL'),
+                   ('uly',       'REAL'),
+                   ('lrx',       'REAL'),
+                   ('lry',       'REAL'),
+                   ('startDate', 'TEXT'),
+                   ('endDate',   'TEXT'),
+                   ('zipName',   'TEXT')]
+    DEFAULT_MB  = 20000
+    ENTRIES_DIR = 'merra'
+    TABLE       = 'orders'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cacheDir, maxMB = DEFAULT_MB, maxDays = None,
+                 logger = None):
+
+        super(MerraCache, self).__init__(cacheDir, maxMB, maxDays, logger)
+
+    #---------------------------------------------------------------------------
+    # clipFile
+    #
+    # This copies the pixels of an image within an extent in the given EPSG
+    # code, without resampling them.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def clipFile(sourceFile, destFile, epsg, ulx, uly, lrx, lry):
+
+        srsWkt  = warpToGrid.getSRS(epsg).ExportToWkt()
+        options = gdal.TranslateOptions(projWin = [ulx, uly, lrx, lry],
+                                        projWinSRS = srsWkt)
+
+        dataset = gdal.Translate(destFile, sourceFile, options = options)
+
+        if not dataset:
+
+            if os.path.exists(destFile):
+                os.remove(destFile)
+
+            raise RuntimeError('Unable to clip ' + sourceFile + '.')
+
+        # Closing the dataset flushes it to disk.
+        dataset = None
+
+    #---------------------------------------------------------------------------
+    # find
+    #
+    # This returns the key of the smallest cached order containing the
+    # request, or None.  Dates are datetime.dates.
+    #---------------------------------------------------------------------------
+    def find(self, product, epsg, ulx, uly, lrx, lry, startDate, endDate):
+
+        with self.connect() as conn:
+
+            row = conn.execute('SELECT key FROM ' + MerraCache.TABLE + ' '
+                               'WHERE product = ? AND epsg = ? AND '
+                               'ulx <= ? AND uly >= ? AND '
+                               'lrx >= ? AND lry <= ? AND '
+                               'startDate = ? AND endDate = ? '
+                               'ORDER BY (lrx - ulx) * (uly - lry) LIMIT 1',
+                               (product, int(epsg), ulx, uly, lrx, lry,
+                                startDate.isoformat(),
+                                endDate.isoformat())).fetchone()
+
+        return row[0] if row else None
+
+    #---------------------------------------------------------------------------
+    # get
+    #
+    # This writes a cached order's images to destDir, clipped to the given
+    # extent when the order is larger, and returns the number of images, or
+    # returns 0 when the order is not cached.
+    #---------------------------------------------------------------------------
+    def get(self, key, destDir, ulx, uly, lrx, lry):
+
+        entryDir = self.getEntryDir(key)
+        order    = self.useEntry(key) if os.path.isdir(entryDir) else None
+
+        if not order:
+            return 0
+
+        sameExtent = [order['ulx'], order['uly'], order['lrx'],
+                      order['lry']] == [ulx, uly, lrx, lry]
+
+        tempDir = os.path.join(destDir, 'cached.' + str(os.getpid()) + '.tmp')
+        shutil.rmtree(tempDir, ignore_errors = True)
+        os.makedirs(tempDir)
+
+        numImages = 0
+
+        try:
+            zipFile = os.path.join(entryDir, order['zipName'])
+
+            with zipfile.ZipFile(zipFile, 'r') as zf:
+
+                for member in zf.namelist():
+
+                    if os.path.splitext(member)[1].lower() != '.tif':
+                        continue
+
+                    tempFile = zf.extract(member, tempDir)
+                    destFile = os.path.join(destDir, os.path.basename(member))
+
+                    if sameExtent:
+                        os.rename(tempFile, destFile)
+
+                    else:
+                        MerraCache.clipFile(tempFile, destFile, order['epsg'],
+                                            ulx, uly, lrx, lry)
+
+                    numImages += 1
+
+        finally:
+            shutil.rmtree(tempDir, ignore_errors = True)
+
+        if self.logger:
+
+            self.logger.info('Found ' + str(numImages) + ' MERRA images ' + \
+                             'in cached order ' + order['zipName'] + ', ' + \
+                             str((order['ulx'], order['uly'],
+                                  order['lrx'], order['lry'])) + '.')
+
+        return numImages
+
+    #---------------------------------------------------------------------------
+    # getEntryDir
+    #---------------------------------------------------------------------------
+    def getEntryDir(self, key):
+        return os.path.join(self.cacheDir, MerraCache.ENTRIES_DIR, key)
+
+    #---------------------------------------------------------------------------
+    # getKey
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getKey(product, epsg, ulx, uly, lrx, lry, startDate, endDate):
+
+        digest = hashlib.sha1()
+
+        digest.update(json.dumps([product,
+                                  int(epsg),
+                                  [repr(float(c))
+                                   for c in [ulx, uly, lrx, lry]],
+                                  startDate.isoformat(),
+                                  endDate.isoformat()]))
+
+        return digest.hexdigest()
+
+    #---------------------------------------------------------------------------
+    # put
+    #
+    # This caches an order's zip file.  It is copied, so the run's copy may be
+    # changed or removed.
+    #---------------------------------------------------------------------------
+    def put(self, product, epsg, ulx, uly, lrx, lry, startDate, endDate,
+            zipFile):
+
+        key      = MerraCache.getKey(product, epsg, ulx, uly, lrx, lry,
+                                     startDate, endDate)
+        entryDir = self.getEntryDir(key)
+        tempDir  = entryDir + '.' + str(os.getpid()) + '.tmp'
+
+        shutil.rmtree(tempDir, ignore_errors = True)
+        os.makedirs(tempDir)
+
+        zipName = os.path.basename(zipFile)
+        shutil.copy2(zipFile, os.path.join(tempDir, zipName))
+
+        shutil.rmtree(entryDir, ignore_errors = True)
+        os.rename(tempDir, entryDir)
+
+        self.addEntry(key,
+                      os.path.getsize(os.path.join(entryDir, zipName)),
+                      {'product':   product,
+                       'epsg':      int(epsg),
+                       'ulx':       ulx,
+                       'uly':       uly,
+                       'lrx':       lrx,
+                       'lry':       lry,
+                       'startDate': startDate.isoformat(),
+                       'endDate':   endDate.isoformat(),
+                       'zipName':   zipName})
+
+        return key
+
+    #---------------------------------------------------------------------------
+    # removeEntry
+    #---------------------------------------------------------------------------
+    def removeEntry(self, key):
+        shutil.rmtree(self.getEntryDir(key), ignore_errors = True)
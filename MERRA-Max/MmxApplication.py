@@ -14,6 +14,10 @@ class MmxApplication(object):
     PENDING_FILE  = 'pending.state'
     RUNNING_FILE  = 'running.state'
     
+    BIAS_GRID           = 'bias'
+    SWD_BACKGROUND_FILE = 'background.csv'
+    SWD_PRESENCE_FILE   = 'presence.csv'
+    
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
@@ -39,6 +43,7 @@ class MmxApplication(object):
         self.clipReprojDir   = os.path.join(mmxConfig.inDir,  'CLIP_REPROJ')
         self.finishedDir     = os.path.join(mmxConfig.inDir,  'FINISHED')
         self.merraDir        = os.path.join(mmxConfig.inDir,  'RAW_MERRA')
+        self.swdDir          = os.path.join(mmxConfig.outDir, 'SWD')
         self.trialsDir       = os.path.join(mmxConfig.outDir, 'TRIALS')
 
     #---------------------------------------------------------------------------
@@ -50,6 +55,28 @@ class MmxApplication(object):
         self.logger.info(self.applicationName)
         self.logger.info('--------------------------------------------------')
         
+    #---------------------------------------------------------------------------
+    # getBiasGrid
+    #
+    # Grid trials and the final grid model draw their background from the
+    # cells in this grid, written by prepareTrials.  This returns None for SWD
+    # runs, and for runs prepared without one.
+    #---------------------------------------------------------------------------
+    def getBiasGrid(self):
+        
+        if self.config.trialMode == 'swd':
+            return None
+            
+        layerFormat = self.config.layerFormat
+        
+        if layerFormat == 'mxe':
+            layerFormat = 'asc'
+            
+        biasGrid = os.path.join(self.trialsDir, 
+                                MmxApplication.BIAS_GRID + '.' + layerFormat)
+                                
+        return biasGrid if os.path.exists(biasGrid) else None
+        
     #---------------------------------------------------------------------------
     # getPhase
     #---------------------------------------------------------------------------
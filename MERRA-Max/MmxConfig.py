@@ -25,8 +25,10 @@ class MmxConfig(object):
     END_DATE_KEY     = 'endDate'
     EPSG_KEY         = 'epsg'
     IN_DIR_KEY       = 'inputDirectory'
+    LAYER_FORMAT_KEY = 'layerFormat'
     LRX_KEY          = 'lrx'
     LRY_KEY          = 'lry'
+    MEMORY_KEY       = 'memoryBudget'
     NUM_PROCS_KEY    = 'numProcesses'
     NUM_TRIALS_KEY   = 'numTrials'
     OUT_DIR_KEY      = 'outputDirectory'
@@ -36,13 +38,19 @@ class MmxConfig(object):
     START_DATE_KEY   = 'startDate'
     STATE_KEY        = 'state'
     TOP_TEN_KEY      = 'topTen'
+    TRIAL_MODE_KEY   = 'trialMode'
     ULX_KEY          = 'ulx'
     ULY_KEY          = 'uly'
     
-    DEFAULT_PROCESSES = 10
-    DEFAULT_TRIALS    = 10
-    MAXIMUM_PROCESSES = 2000
-    MAXIMUM_TRIALS    = 10000
+    DEFAULT_LAYER_FORMAT = 'asc'
+    DEFAULT_PROCESSES    = 10
+    DEFAULT_TRIALS       = 10
+    DEFAULT_TRIAL_MODE   = 'grid'
+    LAYER_FORMATS        = ['asc', 'bil', 'mxe']
+    MAXIMUM_PROCESSES    = 2000
+    MAXIMUM_TRIALS       = 10000
+    MINIMUM_MEMORY       = 512
+    TRIAL_MODES          = ['grid', 'swd']
 
     #---------------------------------------------------------------------------
     # __init__
@@ -71,7 +79,12 @@ class MmxConfig(object):
         self.lry          = None
         self.epsg         = None
         
+        self.layerFormat  = MmxConfig.DEFAULT_LAYER_FORMAT
+        self.trialMode    = MmxConfig.DEFAULT_TRIAL_MODE
         self.topTen       = None
+        
+        # Megabytes available to MaxEnt on a node; None is most of its RAM.
+        self.memoryBudget = None
 
     #---------------------------------------------------------------------------
     # fromDict
@@ -82,8 +95,11 @@ class MmxConfig(object):
         self.setEndDate(inDict[MmxConfig.END_DATE_KEY])
         self.setEPSG(inDict[MmxConfig.EPSG_KEY])
         self.setInDir(inDict[MmxConfig.IN_DIR_KEY])
+        self.setLayerFormat(inDict.get(MmxConfig.LAYER_FORMAT_KEY,
+                                       MmxConfig.DEFAULT_LAYER_FORMAT))
         self.setLrx(inDict[MmxConfig.LRX_KEY])
         self.setLry(inDict[MmxConfig.LRY_KEY])
+        self.setMemoryBudget(inDict.get(MmxConfig.MEMORY_KEY))
         self.setNumProcs(inDict[MmxConfig.NUM_PROCS_KEY])
         self.setNumTrials(inDict[MmxConfig.NUM_TRIALS_KEY])
         self.setOutDir(inDict[MmxConfig.OUT_DIR_KEY])
@@ -93,6 +109,8 @@ class MmxConfig(object):
         self.setStartDate(inDict[MmxConfig.START_DATE_KEY])
         self.state = inDict[MmxConfig.STATE_KEY]
         self.topTen = inDict[MmxConfig.TOP_TEN_KEY]
+        self.setTrialMode(inDict.get(MmxConfig.TRIAL_MODE_KEY,
+                                     MmxConfig.DEFAULT_TRIAL_MODE))
         self.setUlx(inDict[MmxConfig.ULX_KEY])
         self.setUly(inDict[MmxConfig.ULY_KEY])
 
@@ -170,6 +188,18 @@ class MmxConfig(object):
             
         self.inDir = inDir
         
+    #---------------------------------------------------------------------------
+    # setLayerFormat
+    #---------------------------------------------------------------------------
+    def setLayerFormat(self, layerFormat):
+        
+        if layerFormat not in MmxConfig.LAYER_FORMATS:
+            
+            raise RuntimeError('The layer format must be one of ' + \
+                               str(MmxConfig.LAYER_FORMATS) + '.')
+            
+        self.layerFormat = layerFormat
+        
     #---------------------------------------------------------------------------
     # setLrx
     #---------------------------------------------------------------------------
@@ -200,6 +230,22 @@ class MmxConfig(object):
                                    
             self.lry = lry
         
+    #---------------------------------------------------------------------------
+    # setMemoryBudget
+    #---------------------------------------------------------------------------
+    def setMemoryBudget(self, memoryBudget):
+        
+        if memoryBudget != None:
+            
+            memoryBudget = int(memoryBudget)
+            
+            if memoryBudget < MmxConfig.MINIMUM_MEMORY:
+                
+                raise RuntimeError('The memory budget must be at least ' + \
+                                   str(MmxConfig.MINIMUM_MEMORY) + ' MB.')
+                
+        self.memoryBudget = memoryBudget
+        
     #---------------------------------------------------------------------------
     # setNumProcs
     #---------------------------------------------------------------------------
@@ -298,6 +344,21 @@ class MmxConfig(object):
     def setStateRunning(self):
         self.state = MmxConfig.STATES['RUNNING']
 
+    #---------------------------------------------------------------------------
+    # setTrialMode
+    #
+    # Grid trials give MaxEnt full-extent layers.  SWD trials give it samples
+    # with data, the predictor values at presence and background points.
+    #---------------------------------------------------------------------------
+    def setTrialMode(self, trialMode):
+        
+        if trialMode not in MmxConfig.TRIAL_MODES:
+            
+            raise RuntimeError('The trial mode must be one of ' + \
+                               str(MmxConfig.TRIAL_MODES) + '.')
+            
+        self.trialMode = trialMode
+        
     #---------------------------------------------------------------------------
     # setUlx
     #---------------------------------------------------------------------------
@@ -345,8 +406,10 @@ class MmxConfig(object):
         return {MmxConfig.CONFIG_FILE_KEY  : self.configFile,
                 MmxConfig.END_DATE_KEY     : endDate,
                 MmxConfig.EPSG_KEY         : self.epsg,
+                MmxConfig.LAYER_FORMAT_KEY : self.layerFormat,
                 MmxConfig.LRX_KEY          : self.lrx,
                 MmxConfig.LRY_KEY          : self.lry,
+                MmxConfig.MEMORY_KEY       : self.memoryBudget,
                 MmxConfig.NUM_PROCS_KEY    : self.numProcesses,
                 MmxConfig.NUM_TRIALS_KEY   : self.numTrials,
                 MmxConfig.IN_DIR_KEY       : self.inDir,
@@ -357,6 +420,7 @@ class MmxConfig(object):
                 MmxConfig.START_DATE_KEY   : startDate,
                 MmxConfig.STATE_KEY        : self.state,
                 MmxConfig.TOP_TEN_KEY      : self.topTen,
+                MmxConfig.TRIAL_MODE_KEY   : self.trialMode,
                 MmxConfig.ULX_KEY          : self.ulx,
                 MmxConfig.ULY_KEY          : self.uly}
                       
@@ -393,10 +457,15 @@ class MmxConfig(object):
         
         configFile = os.path.join(self.outDir, 'config.mmx')
         
-        with open(configFile, 'w') as f:
+        # Other processes may be reading it, so replace it atomically.
+        tempFile = configFile + '.' + str(os.getpid()) + '.tmp'
+        
+        with open(tempFile, 'w') as f:
 
             self.configFile = configFile
             f.write(json.dumps(self.toDict(), indent = 0)) #indent pretty prints
             
+        os.rename(tempFile, configFile)
+            
         
         
\ No newline at end of file
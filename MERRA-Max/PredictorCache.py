@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+
+from ContentCache import ContentCache
+from MaxEntHelper import MaxEntHelper
+
+#-------------------------------------------------------------------------------
+# class PredictorCache
+#
+# This keeps prepared predictors across runs, so a MERRA image already
+# clipped, reprojected and converted to the same grid is not prepared again.
+# Predictors are keyed by the contents of their source images and by the
+# target grid:  its extent, pixel size and EPSG code, and the layer format.
+# Each entry is a directory holding the prepared image and its layer files.
+#
+# Runs get hard links to an entry's files, so evicting it does not disturb
+# them.  Files are copied when the cache is on another file system.
+#-------------------------------------------------------------------------------
+class PredictorCache(ContentCache):
+
+    CACHE_FILE  = 'predictors.db'
+    COLUMNS     = [('name', 'TEXT'), ('grid', 'TEXT')]
+    DEFAULT_MB  = 5000
+    ENTRIES_DIR = 'predictors'
+    TABLE       = 'predictors'
+
+    # An entry's files are named for the predictor, whatever its image's name.
+    ENTRY_NAME = 'predictor'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cacheDir, maxMB = DEFAULT_MB, maxDays = None,
+                 logger = None):
+
+        super(PredictorCache, self).__init__(cacheDir, maxMB, maxDays, logger)
+
+    #---------------------------------------------------------------------------
+    # get
+    #
+    # This links a cached predictor's image and layer files to those given,
+    # and returns True, or returns False when it is not cached.
+    #---------------------------------------------------------------------------
+    def get(self, key, finishedImage, layerFormat):
+
+        entryDir = self.getEntryDir(key)
+
+        if not os.path.isdir(entryDir) or not self.useEntry(key):
+            return False
+
+        for entryFile, runFile in self.getFilePairs(entryDir,
+                                                    finishedImage,
+                                                    layerFormat):
+
+            if os.path.lexists(runFile):
+                os.remove(runFile)
+
+            PredictorCache.linkFile(entryFile, runFile)
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # getEntryDir
+    #---------------------------------------------------------------------------
+    def getEntryDir(self, key):
+
+        return os.path.join(self.cacheDir,
+                            PredictorCache.ENTRIES_DIR,
+                            key[:2],
+                            key)
+
+    #---------------------------------------------------------------------------
+    # getFilePairs
+    #
+    # This returns the files of an entry, each with its file in a run.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getFilePairs(entryDir, finishedImage, layerFormat):
+
+        entryImage = os.path.join(entryDir, PredictorCache.ENTRY_NAME + '.tif')
+
+        return zip(MaxEntHelper.getLayerFiles(entryImage, layerFormat) + \
+                   [entryImage],
+                   MaxEntHelper.getLayerFiles(finishedImage, layerFormat) + \
+                   [finishedImage])
+
+    #---------------------------------------------------------------------------
+    # getKey
+    #
+    # The grid is (ulx, uly, lrx, lry, scale).
+    #---------------------------------------------------------------------------
+    def getKey(self, sourceImage, epsg, grid, layerFormat):
+
+        digest = hashlib.sha1()
+
+        digest.update(json.dumps([self.getFileHash(sourceImage),
+                                  str(epsg),
+                                  [repr(float(g)) for g in grid],
+                                  layerFormat]))
+
+        return digest.hexdigest()
+
+    #---------------------------------------------------------------------------
+    # linkFile
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def linkFile(sourceFile, destFile):
+
+        try:
+            os.link(sourceFile, destFile)
+
+        except OSError:
+            shutil.copy2(sourceFile, destFile)
+
+    #---------------------------------------------------------------------------
+    # put
+    #
+    # This caches a prepared predictor.  Its files are copied, so rewriting
+    # them in the run does not change the cache.  The entry is assembled
+    # aside, and renamed into place, for other processes adding it too.
+    #---------------------------------------------------------------------------
+    def put(self, key, finishedImage, layerFormat, grid):
+
+        entryDir = self.getEntryDir(key)
+        tempDir  = entryDir + '.' + str(os.getpid()) + '.tmp'
+
+        shutil.rmtree(tempDir, ignore_errors = True)
+        os.makedirs(tempDir)
+
+        size = 0
+
+        for entryFile, runFile in self.getFilePairs(tempDir,
+                                                    finishedImage,
+                                                    layerFormat):
+
+            if not os.path.isdir(os.path.dirname(entryFile)):
+                os.makedirs(os.path.dirname(entryFile))
+
+            shutil.copy2(runFile, entryFile)
+            size += os.path.getsize(entryFile)
+
+        try:
+            os.rename(tempDir, entryDir)
+
+        except OSError:
+
+            # Another process added it first.
+            shutil.rmtree(tempDir, ignore_errors = True)
+
+        self.addEntry(key,
+                      size,
+                      {'name': os.path.basename(finishedImage),
+                       'grid': json.dumps(list(grid))})
+
+    #---------------------------------------------------------------------------
+    # removeEntry
+    #---------------------------------------------------------------------------
+    def removeEntry(self, key):
+        shutil.rmtree(self.getEntryDir(key), ignore_errors = True)
@@ -0,0 +1,83 @@
+import csv
+import hashlib
+import json
+import os
+
+from ContentCache import ContentCache
+
+#-------------------------------------------------------------------------------
+# class ResultCache
+#
+# This keeps MaxEnt's results across runs, so a trial identical to one run
+# before, in this run or another, is not run again.  Results are keyed by the
+# contents of the trial's samples and layer files, and by MaxEnt's arguments,
+# but not by where the files are.  Each entry holds the rows of the trial's
+# maxentResults.csv.
+#-------------------------------------------------------------------------------
+class ResultCache(ContentCache):
+
+    CACHE_FILE   = 'results.db'
+    COLUMNS      = [('rows', 'TEXT')]
+    DEFAULT_MB   = 500
+    RESULTS_FILE = 'maxentResults.csv'
+    TABLE        = 'results'
+
+    # Arguments followed by paths, which are keyed by their contents instead
+    PATH_ARGS = ['-e', '-o', '-s']
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cacheDir, maxMB = DEFAULT_MB, maxDays = None,
+                 logger = None):
+
+        super(ResultCache, self).__init__(cacheDir, maxMB, maxDays, logger)
+
+    #---------------------------------------------------------------------------
+    # get
+    #
+    # This writes the cached results for a key to outDir, and returns True, or
+    # returns False when there are none.
+    #---------------------------------------------------------------------------
+    def get(self, key, outDir):
+
+        entry = self.useEntry(key)
+
+        if not entry:
+            return False
+
+        with open(os.path.join(outDir, ResultCache.RESULTS_FILE), 'wb') as f:
+            csv.writer(f).writerows(json.loads(entry['rows']))
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # getKey
+    #
+    # This returns the key of MaxEnt's results from the given input files and
+    # arguments.  Paths in the arguments do not affect it.
+    #---------------------------------------------------------------------------
+    def getKey(self, inputFiles, args):
+
+        argsWithoutPaths = [arg for i, arg in enumerate(args)
+                            if i == 0 or args[i - 1] not in
+                            ResultCache.PATH_ARGS]
+
+        digest = hashlib.sha1()
+
+        digest.update(json.dumps([self.getFileHash(f) for f in inputFiles]))
+        digest.update(json.dumps(argsWithoutPaths))
+
+        return digest.hexdigest()
+
+    #---------------------------------------------------------------------------
+    # put
+    #
+    # This caches the results MaxEnt wrote to outDir.
+    #---------------------------------------------------------------------------
+    def put(self, key, outDir):
+
+        with open(os.path.join(outDir, ResultCache.RESULTS_FILE), 'rb') as f:
+            rows = json.dumps([row for row in csv.reader(f)])
+
+        self.addEntry(key, len(rows), {'rows': rows})
@@ -0,0 +1,66 @@
+
+import json
+import os
+
+#-------------------------------------------------------------------------------
+# class TrialManifest
+#
+# A trial's manifest lists the predictors the trial uses, so the trial can be
+# run against shared layers or samples-with-data tables.
+#-------------------------------------------------------------------------------
+class TrialManifest(object):
+
+    MANIFEST_FILE  = 'trial.json'
+    PREDICTORS_KEY = 'predictors'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, trialDir, predictors = None):
+
+        self.trialDir     = trialDir
+        self.manifestFile = os.path.join(trialDir, TrialManifest.MANIFEST_FILE)
+        self.predictors   = predictors or []
+
+    #---------------------------------------------------------------------------
+    # exists
+    #---------------------------------------------------------------------------
+    def exists(self):
+        return os.path.exists(self.manifestFile)
+
+    #---------------------------------------------------------------------------
+    # getPredictorNames
+    #
+    # These are the layer names MaxEnt uses for the predictors.
+    #---------------------------------------------------------------------------
+    def getPredictorNames(self):
+
+        return [os.path.splitext(os.path.basename(p))[0]
+                for p in self.predictors]
+
+    #---------------------------------------------------------------------------
+    # read
+    #---------------------------------------------------------------------------
+    def read(self):
+
+        if not self.exists():
+            raise RuntimeError('Trial manifest, ' + self.manifestFile + \
+                               ', does not exist.')
+
+        with open(self.manifestFile, 'r') as f:
+
+            inDict = json.loads(f.read())
+            self.predictors = inDict[TrialManifest.PREDICTORS_KEY]
+
+        return self
+
+    #---------------------------------------------------------------------------
+    # write
+    #---------------------------------------------------------------------------
+    def write(self):
+
+        with open(self.manifestFile, 'w') as f:
+
+            f.write(json.dumps({TrialManifest.PREDICTORS_KEY : self.predictors},
+                               indent = 0))
+
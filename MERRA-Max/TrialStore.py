@@ -0,0 +1,738 @@
+
+import contextlib
+import errno
+import fcntl
+import glob
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from MaxEntHelper import MaxEntHelper
+from MmxApplication import MmxApplication
+from MmxConfig import MmxConfig
+from TrialManifest import TrialManifest
+
+#-------------------------------------------------------------------------------
+# class TrialStore
+#
+# This is the state of a run's trials, in one SQLite database, in place of
+# state files in each trial directory.  Every operation is a transaction, so
+# any number of threads and processes, on any number of nodes sharing the run
+# directory, can claim and complete trials.  Each operation opens its own
+# connection, because connections cannot be shared among threads.  Each
+# trial's directory is TRIALS/<name>.
+#
+# A claim is a lease, which its holder renews while the trial runs.  A trial
+# whose lease expires, because its holder died, can be claimed again, until
+# it has had maxAttempts runs.  Then it fails, so a trial that keeps killing
+# its holder, as by exhausting a node's memory, does not keep the queue from
+# draining.  Each claim has a token, so only the current holder can renew or
+# complete it.
+#
+# A trial running much longer than others can be claimed a second time, as a
+# speculative copy, which writes its results to a directory of its own.  The
+# first copy to succeed completes the trial, and records which directory has
+# its results.  The other copy's token is then no longer valid.
+#
+# Pending trials are claimed longest expected first.  The run times of
+# successful trials, with the features of CostModel, are kept across resets
+# to fit it.
+#
+# The journal stays in SQLite's default rollback mode, because write-ahead
+# logging needs shared memory that network file systems do not provide.
+#
+# Claims are atomic only while SQLite's POSIX (fcntl) locks hold across every
+# node using the store.  NFS provides them through its lock manager, unless
+# mounted with nolock or local_lock, and Lustre only when mounted with
+# -o flock.  The store refuses file systems mounted without them, and those
+# on which a lock cannot be taken at all.
+#-------------------------------------------------------------------------------
+class TrialStore(object):
+
+    STORE_FILE = 'trials.db'
+
+    COMPLETE = MmxConfig.STATES['COMPLETE']
+    FAILED   = MmxConfig.STATES['FAILED']
+    PENDING  = MmxConfig.STATES['PENDING']
+    RUNNING  = MmxConfig.STATES['RUNNING']
+
+    COLUMNS = ['id', 'name', 'predictors', 'state', 'attempts', 'host', 'pid',
+               'started', 'finished', 'exitCode', 'heapMB', 'lease', 'token',
+               'outcome', 'specLease', 'specToken', 'resultsName',
+               'expectedSeconds']
+    
+    # The directories, within a trial's, of the results of each copy
+    RESULTS_NAME             = 'results'
+    SPECULATIVE_RESULTS_NAME = 'results-spec'
+    
+    # Seconds a claim lasts without being renewed.
+    DEFAULT_LEASE = 300
+
+    # Most runs of a trial
+    MAX_ATTEMPTS = 3
+
+    # Seconds to wait for another process's transaction.
+    TIMEOUT = 600
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, trialsDir, maxAttempts = MAX_ATTEMPTS):
+
+        TrialStore.checkLocking(trialsDir)
+
+        self.maxAttempts = maxAttempts
+        self.storeFile   = os.path.join(trialsDir, TrialStore.STORE_FILE)
+
+        with self.connect() as conn:
+
+            conn.execute('PRAGMA journal_mode = DELETE')
+            
+            conn.execute('CREATE TABLE IF NOT EXISTS trials ('
+                         'id         INTEGER PRIMARY KEY, '
+                         'name       TEXT NOT NULL, '
+                         'predictors TEXT, '
+                         'state      TEXT NOT NULL, '
+                         'attempts   INTEGER NOT NULL DEFAULT 0, '
+                         'host       TEXT, '
+                         'pid        INTEGER, '
+                         'started    REAL, '
+                         'finished   REAL, '
+                         'exitCode   INTEGER, '
+                         'heapMB     INTEGER, '
+                         'lease      REAL, '
+                         'token      TEXT, '
+                         'outcome    TEXT, '
+                         'specLease  REAL, '
+                         'specToken  TEXT, '
+                         'resultsName TEXT, '
+                         'expectedSeconds REAL)')
+
+            conn.execute('CREATE INDEX IF NOT EXISTS trialsByState '
+                         'ON trials (state)')
+
+            conn.execute('CREATE TABLE IF NOT EXISTS runtimes ('
+                         'trial    INTEGER NOT NULL, '
+                         'features TEXT NOT NULL, '
+                         'seconds  REAL NOT NULL, '
+                         'recorded REAL NOT NULL)')
+
+            # Stores created before leases, outcomes, speculative copies and
+            # cost estimates lack their columns.
+            columns = [row[1] for row in 
+                       conn.execute('PRAGMA table_info(trials)').fetchall()]
+            
+            for column, columnType in [('lease',       'REAL'), 
+                                       ('token',       'TEXT'),
+                                       ('outcome',     'TEXT'),
+                                       ('specLease',   'REAL'),
+                                       ('specToken',   'TEXT'),
+                                       ('resultsName', 'TEXT'),
+                                       ('expectedSeconds', 'REAL')]:
+                
+                if column not in columns:
+                    
+                    conn.execute('ALTER TABLE trials ADD COLUMN ' + column + \
+                                 ' ' + columnType)
+
+        # Trials prepared before the store are added to it.
+        if not self.getTrials():
+            self.importTrialDirs(trialsDir)
+
+    #---------------------------------------------------------------------------
+    # addRuntime
+    #
+    # This records the run time of a successful trial, with its features.
+    #---------------------------------------------------------------------------
+    def addRuntime(self, trialNum, features, seconds):
+
+        with self.connect() as conn:
+
+            conn.execute('INSERT INTO runtimes '
+                         '(trial, features, seconds, recorded) '
+                         'VALUES (?, ?, ?, ?)',
+                         (trialNum, json.dumps(features), seconds, 
+                          time.time()))
+
+    #---------------------------------------------------------------------------
+    # addTrial
+    #
+    # This adds a pending trial, or makes an existing one pending with new
+    # predictors.
+    #---------------------------------------------------------------------------
+    def addTrial(self, trialNum, predictors, state = PENDING):
+
+        with self.connect() as conn:
+
+            conn.execute('INSERT OR REPLACE INTO trials '
+                         '(id, name, predictors, state) VALUES (?, ?, ?, ?)',
+                         (trialNum,
+                          TrialStore.getTrialName(trialNum),
+                          json.dumps(predictors) if predictors else None,
+                          state))
+
+    #---------------------------------------------------------------------------
+    # checkLocking
+    #
+    # This raises a RuntimeError when the directory's file system cannot give
+    # every node the same POSIX locks.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def checkLocking(trialsDir):
+
+        fsType, options = TrialStore.getMount(trialsDir)
+
+        if fsType == 'lustre' and 'flock' not in options:
+
+            raise RuntimeError(trialsDir + ' is on Lustre mounted without ' + \
+                               '-o flock, so its locks do not hold ' + \
+                               'across nodes, and trials could be ' + \
+                               'claimed twice.')
+
+        if fsType and fsType.startswith('nfs') and \
+           ('nolock' in options or 'local_lock=all' in options or
+            'local_lock=posix' in options):
+
+            raise RuntimeError(trialsDir + ' is on NFS mounted with local ' + \
+                               'locks, so its locks do not hold across ' + \
+                               'nodes, and trials could be claimed twice.')
+
+        # Some file systems refuse locks outright.
+        probeFile = os.path.join(trialsDir, 
+                                 '.lock-probe.' + socket.gethostname() + \
+                                 '.' + str(os.getpid()))
+
+        try:
+            with open(probeFile, 'w') as f:
+
+                fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+        except IOError as e:
+
+            raise RuntimeError('Unable to lock files in ' + trialsDir + \
+                               ':  ' + str(e))
+
+        finally:
+
+            if os.path.exists(probeFile):
+                os.remove(probeFile)
+
+    #---------------------------------------------------------------------------
+    # claim
+    #
+    # This claims the first trial matching the condition, in the given order,
+    # in a single UPDATE, so only one caller can claim it.  It returns the
+    # claimed trial, or None.
+    #---------------------------------------------------------------------------
+    def claim(self, condition, conditionArgs, leaseSeconds, order = 'id'):
+
+        now   = time.time()
+        token = uuid.uuid4().hex
+
+        with self.connect() as conn:
+
+            cursor = conn.execute('UPDATE trials SET state = ?, '
+                                  'attempts = attempts + 1, host = ?, '
+                                  'pid = ?, started = ?, finished = NULL, '
+                                  'exitCode = NULL, outcome = NULL, '
+                                  'resultsName = NULL, lease = ?, token = ? '
+                                  'WHERE id = (SELECT id FROM trials WHERE ' + \
+                                  condition + ' ORDER BY ' + order + \
+                                  ' LIMIT 1)',
+                                  [TrialStore.RUNNING,
+                                   socket.gethostname(),
+                                   os.getpid(),
+                                   now,
+                                   now + leaseSeconds,
+                                   token] + conditionArgs)
+
+            if cursor.rowcount != 1:
+                return None
+
+        trial = self.getTrials(token = token)[0]
+        trial['speculative'] = False
+        
+        return trial
+
+    #---------------------------------------------------------------------------
+    # claimNextTrial
+    #
+    # This claims the pending trial expected to take longest, or one whose
+    # lease expired with attempts remaining, with numbers from firstTrial to
+    # lastTrial, when they are given.  Expired trials without attempts
+    # remaining fail.
+    #---------------------------------------------------------------------------
+    def claimNextTrial(self, leaseSeconds = DEFAULT_LEASE, firstTrial = None,
+                       lastTrial = None):
+
+        now = time.time()
+        
+        self.failAbandonedTrials(now)
+
+        condition = '(state = ? OR (state = ? AND lease < ? AND attempts < ?))'
+        args      = [TrialStore.PENDING, TrialStore.RUNNING, now, 
+                     self.maxAttempts]
+
+        if firstTrial != None and lastTrial != None:
+
+            condition += ' AND id BETWEEN ? AND ?'
+            args      += [firstTrial, lastTrial]
+
+        return self.claim(condition, 
+                          args, 
+                          leaseSeconds,
+                          'expectedSeconds IS NULL, expectedSeconds DESC, id')
+
+    #---------------------------------------------------------------------------
+    # claimSpeculation
+    #
+    # This claims a speculative copy of the running trial that started first,
+    # when it has run for at least minSeconds, its holder is alive and it has
+    # no live copy.  It returns the trial with the copy's token, or None.
+    #---------------------------------------------------------------------------
+    def claimSpeculation(self, minSeconds, leaseSeconds = DEFAULT_LEASE,
+                         firstTrial = None, lastTrial = None):
+
+        now       = time.time()
+        token     = uuid.uuid4().hex
+        condition = 'state = ? AND lease >= ? AND started <= ? AND ' + \
+                    '(specToken IS NULL OR specLease < ?)'
+                    
+        args      = [TrialStore.RUNNING, now, now - minSeconds, now]
+
+        if firstTrial != None and lastTrial != None:
+
+            condition += ' AND id BETWEEN ? AND ?'
+            args      += [firstTrial, lastTrial]
+
+        with self.connect() as conn:
+
+            cursor = conn.execute('UPDATE trials SET specLease = ?, '
+                                  'specToken = ? '
+                                  'WHERE id = (SELECT id FROM trials WHERE ' + \
+                                  condition + ' ORDER BY started LIMIT 1)',
+                                  [now + leaseSeconds, token] + args)
+
+            if cursor.rowcount != 1:
+                return None
+
+        trial                = self.getTrials(token = token)[0]
+        trial['token']       = token
+        trial['speculative'] = True
+        
+        return trial
+
+    #---------------------------------------------------------------------------
+    # claimTrial
+    #
+    # Only one caller, in any process, can change a trial from pending to
+    # running.  This returns the trial for that caller, and None for others.
+    #---------------------------------------------------------------------------
+    def claimTrial(self, trialNum, leaseSeconds = DEFAULT_LEASE):
+
+        return self.claim('id = ? AND state = ?',
+                          [trialNum, TrialStore.PENDING],
+                          leaseSeconds)
+
+    #---------------------------------------------------------------------------
+    # completeTrial
+    #
+    # A trial completes when its outcome is MaxEntHelper.SUCCESS.  Otherwise,
+    # it fails, or is pending again when it is to be retried, unless another
+    # copy of it is still running, which then finishes it.  This returns the
+    # trial's new state, or None when the claim was lost to another holder or
+    # copy.  The statements share one transaction, so no other process
+    # completes the trial between them.
+    #---------------------------------------------------------------------------
+    def completeTrial(self, trial, outcome, exitCode, heapMB = None, 
+                      retry = False):
+
+        now     = time.time()
+        holder  = 'id = ? AND state = ? AND (token = ? OR specToken = ?)'
+        keys    = [trial['id'], TrialStore.RUNNING, trial['token'], 
+                   trial['token']]
+        
+        results = TrialStore.getResultsName(trial)
+        
+        with self.connect() as conn:
+
+            if outcome == MaxEntHelper.SUCCESS:
+                
+                cursor = conn.execute('UPDATE trials SET state = ?, '
+                                      'finished = ?, exitCode = ?, '
+                                      'outcome = ?, '
+                                      'heapMB = COALESCE(?, heapMB), '
+                                      'resultsName = ?, lease = NULL, '
+                                      'token = NULL, specLease = NULL, '
+                                      'specToken = NULL WHERE ' + holder,
+                                      [TrialStore.COMPLETE, 
+                                       now, 
+                                       exitCode, 
+                                       outcome,
+                                       heapMB,
+                                       results] + keys)
+                                      
+                return TrialStore.COMPLETE if cursor.rowcount == 1 else None
+                
+            # A failed speculative copy leaves the trial to its holder.
+            cursor = conn.execute('UPDATE trials SET specLease = NULL, '
+                                  'specToken = NULL '
+                                  'WHERE id = ? AND specToken = ? '
+                                  'AND lease >= ?',
+                                  (trial['id'], trial['token'], now))
+                                  
+            if cursor.rowcount == 1:
+                return TrialStore.RUNNING
+                
+            # A failed holder leaves the trial to its speculative copy.
+            cursor = conn.execute('UPDATE trials SET lease = specLease, '
+                                  'token = specToken, specLease = NULL, '
+                                  'specToken = NULL '
+                                  'WHERE id = ? AND token = ? '
+                                  'AND specLease >= ?',
+                                  (trial['id'], trial['token'], now))
+                                  
+            if cursor.rowcount == 1:
+                return TrialStore.RUNNING
+                
+            state = TrialStore.PENDING if retry else TrialStore.FAILED
+
+            cursor = conn.execute('UPDATE trials SET state = ?, finished = ?, '
+                                  'exitCode = ?, outcome = ?, '
+                                  'heapMB = COALESCE(?, heapMB), '
+                                  'lease = NULL, token = NULL, '
+                                  'specLease = NULL, specToken = NULL '
+                                  'WHERE ' + holder,
+                                  [state, 
+                                   now, 
+                                   exitCode, 
+                                   outcome,
+                                   heapMB] + keys)
+
+            return state if cursor.rowcount == 1 else None
+
+    #---------------------------------------------------------------------------
+    # connect
+    #
+    # This yields a connection in a transaction, which commits unless there is
+    # an exception.
+    #---------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def connect(self):
+
+        conn = sqlite3.connect(self.storeFile, timeout = TrialStore.TIMEOUT)
+
+        try:
+            with conn:
+                yield conn
+
+        finally:
+            conn.close()
+
+    #---------------------------------------------------------------------------
+    # failAbandonedTrials
+    #
+    # Trials whose leases expired after their last attempt, without a live
+    # speculative copy, fail.
+    #---------------------------------------------------------------------------
+    def failAbandonedTrials(self, now):
+
+        with self.connect() as conn:
+
+            conn.execute('UPDATE trials SET state = ?, finished = ?, '
+                         'outcome = ?, lease = NULL, token = NULL, '
+                         'specLease = NULL, specToken = NULL '
+                         'WHERE state = ? AND lease < ? AND attempts >= ? '
+                         'AND (specToken IS NULL OR specLease < ?)',
+                         (TrialStore.FAILED,
+                          now,
+                          MaxEntHelper.UNKNOWN,
+                          TrialStore.RUNNING,
+                          now,
+                          self.maxAttempts,
+                          now))
+
+    #---------------------------------------------------------------------------
+    # getMount
+    #
+    # This returns the type and options of the file system holding a path,
+    # from /proc/mounts, or None and no options where there is none.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getMount(path):
+
+        fsType  = None
+        options = []
+
+        if not os.path.exists('/proc/mounts'):
+            return fsType, options
+
+        path       = os.path.realpath(path)
+        mountPoint = ''
+
+        with open('/proc/mounts') as f:
+
+            for line in f:
+
+                fields = line.split()
+
+                if len(fields) < 4:
+                    continue
+
+                # Spaces in mount points are escaped.
+                point = fields[1].replace('\\040', ' ')
+
+                if (path == point or 
+                    path.startswith(point.rstrip('/') + '/')) and \
+                   len(point) >= len(mountPoint):
+
+                    mountPoint = point
+                    fsType     = fields[2]
+                    options    = fields[3].split(',')
+
+        return fsType, options
+
+    #---------------------------------------------------------------------------
+    # getResultsName
+    #
+    # This returns the name of the directory for a claimed copy's results.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getResultsName(trial):
+        
+        if trial.get('speculative'):
+            return TrialStore.SPECULATIVE_RESULTS_NAME
+            
+        return TrialStore.RESULTS_NAME
+        
+    #---------------------------------------------------------------------------
+    # getRuntimes
+    #
+    # This returns the recorded features and run times, as pairs.
+    #---------------------------------------------------------------------------
+    def getRuntimes(self):
+
+        with self.connect() as conn:
+
+            rows = conn.execute('SELECT features, seconds FROM runtimes '
+                                'ORDER BY recorded').fetchall()
+
+        return [(json.loads(features), seconds) for features, seconds in rows]
+
+    #---------------------------------------------------------------------------
+    # getTrial
+    #---------------------------------------------------------------------------
+    def getTrial(self, trialNum):
+        
+        trials = [t for t in self.getTrials() if t['id'] == trialNum]
+        
+        return trials[0] if trials else None
+        
+    #---------------------------------------------------------------------------
+    # getTrialName
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getTrialName(trialNum):
+        return 'trial-' + str(trialNum)
+
+    #---------------------------------------------------------------------------
+    # getTrials
+    #
+    # This returns the trials as dictionaries keyed by COLUMNS, in order of
+    # their numbers, optionally only those in the given states or with the
+    # given claim token, of a holder or a speculative copy.
+    #---------------------------------------------------------------------------
+    def getTrials(self, states = None, token = None):
+
+        sql  = 'SELECT ' + ', '.join(TrialStore.COLUMNS) + ' FROM trials'
+        args = []
+
+        conditions = []
+
+        if states:
+
+            conditions.append('state IN (' + ', '.join('?' * len(states)) + ')')
+            args += states
+
+        if token:
+
+            conditions.append('(token = ? OR specToken = ?)')
+            args += [token, token]
+
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        with self.connect() as conn:
+            rows = conn.execute(sql + ' ORDER BY id', args).fetchall()
+
+        trials = []
+
+        for row in rows:
+
+            trial = dict(zip(TrialStore.COLUMNS, row))
+
+            if trial['predictors']:
+                trial['predictors'] = json.loads(trial['predictors'])
+
+            trials.append(trial)
+
+        return trials
+
+    #---------------------------------------------------------------------------
+    # importTrialDirs
+    #
+    # This adds trials prepared before the store, from their directories and
+    # state files.
+    #---------------------------------------------------------------------------
+    def importTrialDirs(self, trialsDir):
+
+        # A trial that was running when its process ended runs again.
+        STATE_FILES = [(MmxApplication.COMPLETE_FILE, TrialStore.COMPLETE),
+                       (MmxApplication.FAILURE_FILE,  TrialStore.FAILED),
+                       (MmxApplication.RUNNING_FILE,  TrialStore.PENDING),
+                       (MmxApplication.PENDING_FILE,  TrialStore.PENDING)]
+
+        for trialDir in glob.glob(os.path.join(trialsDir, 'trial-*')):
+
+            trialNum = int(os.path.basename(trialDir).split('-')[1])
+            manifest = TrialManifest(trialDir)
+            state    = None
+
+            for stateFile, fileState in STATE_FILES:
+
+                if os.path.exists(os.path.join(trialDir, stateFile)):
+
+                    state = fileState
+                    break
+
+            if not state:
+                continue
+
+            predictors = None
+
+            if manifest.exists():
+                predictors = manifest.read().predictors
+
+            self.addTrial(trialNum, predictors, state)
+
+    #---------------------------------------------------------------------------
+    # isAlive
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def isAlive(pid):
+
+        if pid == os.getpid():
+            return True
+
+        try:
+            os.kill(pid, 0)
+
+        except OSError as e:
+            # EPERM means it exists, as another user.
+            return e.errno == errno.EPERM
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # recoverTrials
+    #
+    # Trials left running by processes on this host that no longer exist are
+    # made pending again, or fail when they have had maxAttempts runs.  This
+    # returns their number.
+    #---------------------------------------------------------------------------
+    def recoverTrials(self):
+
+        host      = socket.gethostname()
+        recovered = 0
+
+        for trial in self.getTrials([TrialStore.RUNNING]):
+
+            if trial['host'] != host or TrialStore.isAlive(trial['pid']):
+                continue
+
+            with self.connect() as conn:
+
+                cursor = conn.execute('UPDATE trials SET '
+                                      'state = CASE WHEN attempts >= ? '
+                                      'THEN ? ELSE ? END, '
+                                      'outcome = CASE WHEN attempts >= ? '
+                                      'THEN ? ELSE NULL END, '
+                                      'lease = NULL, token = NULL, '
+                                      'specLease = NULL, specToken = NULL '
+                                      'WHERE id = ? AND state = ? '
+                                      'AND pid = ?',
+                                      (self.maxAttempts,
+                                       TrialStore.FAILED,
+                                       TrialStore.PENDING,
+                                       self.maxAttempts,
+                                       MaxEntHelper.UNKNOWN,
+                                       trial['id'],
+                                       TrialStore.RUNNING,
+                                       trial['pid']))
+
+                recovered += cursor.rowcount
+
+        return recovered
+
+    #---------------------------------------------------------------------------
+    # renewLease
+    #
+    # This renews the lease of a holder or a speculative copy.  It returns
+    # False when the claim was lost to another holder or copy.
+    #---------------------------------------------------------------------------
+    def renewLease(self, trial, leaseSeconds = DEFAULT_LEASE):
+
+        lease = time.time() + leaseSeconds
+        token = trial['token']
+        
+        with self.connect() as conn:
+
+            cursor = conn.execute('UPDATE trials SET '
+                                  'lease = CASE WHEN token = ? THEN ? '
+                                  'ELSE lease END, '
+                                  'specLease = CASE WHEN specToken = ? '
+                                  'THEN ? ELSE specLease END '
+                                  'WHERE id = ? AND (token = ? OR '
+                                  'specToken = ?)',
+                                  (token, lease, token, lease, trial['id'],
+                                   token, token))
+
+            return cursor.rowcount == 1
+
+    #---------------------------------------------------------------------------
+    # resetTrials
+    #
+    # This makes every trial pending, keeping only its predictors and the heap
+    # it last used.  A trial that ran out of memory keeps twice that heap.
+    #---------------------------------------------------------------------------
+    def resetTrials(self):
+
+        with self.connect() as conn:
+
+            conn.execute('UPDATE trials SET state = ?, attempts = 0, '
+                         'host = NULL, pid = NULL, started = NULL, '
+                         'finished = NULL, exitCode = NULL, lease = NULL, '
+                         'token = NULL, outcome = NULL, specLease = NULL, '
+                         'specToken = NULL, resultsName = NULL, '
+                         'heapMB = CASE WHEN exitCode = ? THEN 2 * heapMB '
+                         'ELSE heapMB END',
+                         (TrialStore.PENDING, MaxEntHelper.OOM_EXIT_CODE))
+
+    #---------------------------------------------------------------------------
+    # setExpectedSeconds
+    #
+    # expected maps trial numbers to their expected run times.
+    #---------------------------------------------------------------------------
+    def setExpectedSeconds(self, expected):
+
+        with self.connect() as conn:
+
+            conn.executemany('UPDATE trials SET expectedSeconds = ? '
+                             'WHERE id = ?',
+                             [(seconds, trialNum) 
+                              for trialNum, seconds in expected.items()])
+
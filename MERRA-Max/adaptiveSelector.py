@@ -0,0 +1,266 @@
+#!/usr/bin/python
+
+import argparse
+import math
+import sys
+
+from MmxApplication import MmxApplication
+from MmxConfig import MmxConfig
+from prepareTrials import PrepareTrials
+from runTrials import RunTrials
+from selector import Selector
+from TrialStore import TrialStore
+
+#-------------------------------------------------------------------------------
+# class AdaptiveSelector
+#
+# This selects the top-ten predictors from trials run in waves, instead of
+# from a fixed number of trials.  After each wave, the predictors are ranked
+# by their average contributions so far.  Waves stop when the top ten have not
+# changed for a number of waves, when they have not changed since the last
+# wave and are separated from the rest with enough confidence, or when the
+# configuration's number of trials is reached.
+#-------------------------------------------------------------------------------
+class AdaptiveSelector(MmxApplication):
+
+    DEFAULT_CONFIDENCE   = 0.95
+    DEFAULT_STABLE_WAVES = 3
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #
+    # The wave size defaults to the number of processes, and the most trials
+    # to run to the configuration's number of trials.
+    #---------------------------------------------------------------------------
+    def __init__(self, configFile, waveSize = None,
+                 stableWaves = DEFAULT_STABLE_WAVES,
+                 confidence = DEFAULT_CONFIDENCE, maxTrials = None,
+                 useWorkers = False, logger = None):
+
+        mmxConfig = MmxConfig()
+        mmxConfig.initializeFromFile(configFile)
+
+        super(AdaptiveSelector, self).__init__(mmxConfig,
+                                               'AdaptiveSelector',
+                                               logger)
+
+        self.configFile  = configFile
+        self.waveSize    = waveSize or int(self.config.numProcesses)
+        self.stableWaves = stableWaves
+        self.confidence  = confidence
+        self.maxTrials   = maxTrials or int(self.config.numTrials)
+        self.useWorkers  = useWorkers
+
+        if self.waveSize < 1:
+            raise RuntimeError('Waves must have at least one trial.')
+
+        self.logHeader()
+
+    #---------------------------------------------------------------------------
+    # getConfidence
+    #
+    # This returns the confidence that the top ten are the ten predictors with
+    # the highest mean contributions:  the least, over the predictors outside
+    # the top ten, of the probability that the tenth predictor's mean exceeds
+    # theirs.  Means are taken to be normal, with their standard errors.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getConfidence(contributions, ranked):
+
+        if len(ranked) <= 10:
+            return 1.0
+
+        tenth      = ranked[9][0]
+        confidence = 1.0
+
+        for name, mean in ranked[10:]:
+
+            samples = [contributions[tenth], contributions[name]]
+
+            if min([len(s) for s in samples]) < 2:
+                return 0.0
+
+            error = math.sqrt(sum([AdaptiveSelector.getVariance(s) / len(s)
+                                   for s in samples]))
+
+            difference = ranked[9][1] - mean
+
+            if error == 0.0:
+                probability = 1.0 if difference > 0.0 else 0.5
+
+            else:
+
+                probability = \
+                    0.5 * (1.0 + math.erf(difference / error / math.sqrt(2.0)))
+
+            confidence = min(confidence, probability)
+
+        return confidence
+
+    #---------------------------------------------------------------------------
+    # getPhase
+    #---------------------------------------------------------------------------
+    def getPhase(self):
+        return 'ADAPTIVE_SELECTOR'
+
+    #---------------------------------------------------------------------------
+    # getVariance
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getVariance(samples):
+
+        mean = sum(samples) / len(samples)
+
+        return sum([(s - mean) ** 2 for s in samples]) / (len(samples) - 1)
+
+    #---------------------------------------------------------------------------
+    # run
+    #---------------------------------------------------------------------------
+    def run(self):
+
+        prepTrials = PrepareTrials(self.configFile, logger = self.logger)
+        prepTrials.prepareInputs()
+
+        store     = TrialStore(self.trialsDir)
+        numTrials = len(store.getTrials())
+
+        # Trials left pending by an earlier run are its unfinished wave.
+        if store.getTrials([TrialStore.PENDING]):
+
+            if self.logger:
+                self.logger.info('Finishing the trials already prepared.')
+
+            RunTrials(self.configFile,
+                      useWorkers = self.useWorkers,
+                      logger = self.logger).run()
+
+        lastTopTen = None
+        isStable   = False
+        numStable  = 0
+        waveNum    = 0
+
+        while numTrials < self.maxTrials:
+
+            waveNum   += 1
+            trialNums  = prepTrials.addTrials(min(self.waveSize,
+                                                  self.maxTrials - numTrials))
+            numTrials += len(trialNums)
+
+            RunTrials(self.configFile,
+                      str(trialNums[0]) + '-' + str(trialNums[-1]),
+                      self.useWorkers,
+                      logger = self.logger).run()
+
+            selector      = Selector(self.configFile, self.logger)
+            contributions = selector.compileContributions()
+            ranked        = Selector.rankPredictors(contributions)
+            topTen        = set([name for name, mean in ranked[:10]])
+            confidence    = AdaptiveSelector.getConfidence(contributions,
+                                                           ranked)
+
+            if lastTopTen == None:
+                numKept = 0
+
+            else:
+                numKept = len(topTen & lastTopTen)
+
+            if topTen == lastTopTen:
+                numStable += 1
+
+            else:
+                numStable = 0
+
+            lastTopTen = topTen
+
+            if self.logger:
+
+                self.logger.info('Wave ' + str(waveNum) + ' brought the ' + \
+                                 'trials to ' + str(numTrials) + '.  ' + \
+                                 str(numKept) + ' of the top ten stayed, ' + \
+                                 'unchanged for ' + str(numStable) + \
+                                 ' waves, with confidence ' + \
+                                 '%.3f' % confidence + '.')
+
+            # Confidence from one wave's trials alone is not trusted.
+            if numStable >= self.stableWaves or \
+               (numStable > 0 and confidence >= self.confidence):
+
+                if self.logger:
+
+                    self.logger.info('The top ten are stable after ' + \
+                                     str(numTrials) + ' trials.')
+
+                isStable = True
+                break
+
+        if not isStable and self.logger:
+
+            self.logger.info('Ran the most trials, ' + str(numTrials) + \
+                             ', before the top ten were stable.')
+
+        Selector(self.configFile, self.logger).run()
+
+#-------------------------------------------------------------------------------
+# main
+#
+# 1.  configureMmxRun
+# 2.  getMerra
+# 3.  prepareImages
+# 4.  ./adaptiveSelector.py -c ~/Desktop/SystemTesting/Mmx/config.mmx, instead
+#     of prepareTrials, runTrials and selector
+# 5.  ./modeler.py
+#-------------------------------------------------------------------------------
+def main():
+
+    # Process command-line args.
+    desc = 'This application selects the top ten predictors from trials ' + \
+           'run in waves, until the top ten are stable.'
+
+    parser = argparse.ArgumentParser(description = desc)
+
+    parser.add_argument('-c',
+                        required = True,
+                        help = 'Path to MERRA-Max configuration file')
+
+    parser.add_argument('--wave',
+                        type = int,
+                        help = 'trials in each wave; defaults to the ' + \
+                               'number of processes')
+
+    parser.add_argument('--stableWaves',
+                        type = int,
+                        default = AdaptiveSelector.DEFAULT_STABLE_WAVES,
+                        help = 'stop after the top ten are unchanged for ' + \
+                               'this many waves')
+
+    parser.add_argument('--confidence',
+                        type = float,
+                        default = AdaptiveSelector.DEFAULT_CONFIDENCE,
+                        help = 'stop once the top ten are separated from ' + \
+                               'the rest with this confidence')
+
+    parser.add_argument('--maxTrials',
+                        type = int,
+                        help = 'most trials to run; defaults to the ' + \
+                               'configuration\'s number of trials')
+
+    parser.add_argument('--workers',
+                        action = 'store_true',
+                        help = 'Run the trials in persistent MaxEnt JVMs, ' + \
+                               'instead of a JVM for each trial.')
+
+    args = parser.parse_args()
+
+    selector = AdaptiveSelector(args.c,
+                                args.wave,
+                                args.stableWaves,
+                                args.confidence,
+                                args.maxTrials,
+                                args.workers)
+    selector.run()
+
+#-------------------------------------------------------------------------------
+# Invoke the main
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,7 +18,10 @@ class ConfigureMmxRun(MmxApplication):
     # __init__
     #---------------------------------------------------------------------------
     def __init__(self, presFile, startDate, endDate, species, inDir = '.', 
-                 outDir = '.', numProcs = 10, numTrials = 10, logger = None):
+                 outDir = '.', numProcs = 10, numTrials = 10, 
+                 layerFormat = MmxConfig.DEFAULT_LAYER_FORMAT, 
+                 trialMode = MmxConfig.DEFAULT_TRIAL_MODE, memoryBudget = None,
+                 logger = None):
         
 		# Create the MmxConfig object.
         mmxConfig = MmxConfig()
@@ -26,6 +29,10 @@ class ConfigureMmxRun(MmxApplication):
         mmxConfig.initializeFromValues(presFile, startDate, endDate, species, 
                                        inDir, outDir, numProcs, numTrials)
 
+        mmxConfig.setLayerFormat(layerFormat)
+        mmxConfig.setTrialMode(trialMode)
+        mmxConfig.setMemoryBudget(memoryBudget)
+
 		# Define the bounding box.
         presPts = PresencePoints(presFile, species)
         bbox = BoundingBox(presPts.points, presPts.epsg)
@@ -92,11 +99,27 @@ def main():
     
     parser.add_argument('--startDate', help = 'MM-DD-YYYY')
     parser.add_argument('--endDate', help = 'MM-DD-YYYY')
+    
+    parser.add_argument('--layerFormat',
+                        choices = MmxConfig.LAYER_FORMATS,
+                        default = MmxConfig.DEFAULT_LAYER_FORMAT,
+                        help = 'format of the layers given to MaxEnt')
+    
+    parser.add_argument('--trialMode',
+                        choices = MmxConfig.TRIAL_MODES,
+                        default = MmxConfig.DEFAULT_TRIAL_MODE,
+                        help = 'give trials full grids or samples with data')
+
+    parser.add_argument('--memoryBudget',
+                        type = int,
+                        help = 'megabytes of memory MaxEnt may use on a ' + \
+                               'node; defaults to most of its RAM')
 
     args = parser.parse_args()
     
     ConfigureMmxRun(args.f, args.startDate, args.endDate, args.s, args.i, 
-                    args.o, args.p, args.t)
+                    args.o, args.p, args.t, args.layerFormat,
+                    args.trialMode, args.memoryBudget)
     
 #-------------------------------------------------------------------------------
 # Invoke the main
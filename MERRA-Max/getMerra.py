@@ -4,30 +4,49 @@ import argparse
 import glob
 import os
 import sys
+import urlparse
 import zipfile
 
 from osgeo import gdal
 
-sys.path.append('/Users/a/Desktop/Source/Recover/RecoverScripts')
+# The RECOVER scripts, including the Downloader, are beside MERRA-Max.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'RECOVER', 'RecoverScripts'))
+
 import wrangleEmptySite
 import wrangleOnePredictor
 
+from Downloader import Downloader
+from MerraCache import MerraCache
 from MmxApplication import MmxApplication
 from MmxConfig import MmxConfig
 
 #-------------------------------------------------------------------------------
 # class GetMerra
+#
+# With a cache directory, orders are kept across runs, and a run within the
+# extent of an earlier order with the same dates uses it instead of RECOVER.
+#
+# With the URL of a finished order's zip file, the order is downloaded again,
+# resuming a partial download, without waiting for RECOVER to prepare it.
+#
+# Several runs, like those of different species or areas, can get MERRA at
+# once.  Their orders are placed, waited for and downloaded together.
 #-------------------------------------------------------------------------------
 class GetMerra(MmxApplication):
     
-    USER   = 'wmAdmin'
-    KEY    = '13c952ea-9ca6-4248-a6b1-f9af29a1fa37'
-    SERVER = 'recoverdss.us'
+    USER      = 'wmAdmin'
+    KEY       = '13c952ea-9ca6-4248-a6b1-f9af29a1fa37'
+    PRODUCT   = 'MERRA All'
+    PREDICTOR = 'MERRA Max'
+    SERVER    = 'recoverdss.us'
     
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
-    def __init__(self, configFile, siteID = None, logger = None):
+    def __init__(self, configFile, siteID = None, cacheDir = None,
+                 cacheMB = MerraCache.DEFAULT_MB, cacheDays = None,
+                 url = None, logger = None):
         
         mmxConfig = MmxConfig()
         mmxConfig.initializeFromFile(configFile)
@@ -56,6 +75,96 @@ class GetMerra(MmxApplication):
             if self.siteID:
                 self.logger.info('Using site: ' + str(self.siteID))
         
+        self.merraCache = None
+        self.url        = url
+        
+        if cacheDir:
+            
+            self.merraCache = MerraCache(cacheDir, 
+                                         cacheMB, 
+                                         cacheDays, 
+                                         self.logger)
+
+    #---------------------------------------------------------------------------
+    # createSite
+    #---------------------------------------------------------------------------
+    def createSite(self):
+
+        sDateStr = self.config.startDate.strftime('%Y-%m-%d')
+        eDateStr = self.config.endDate.strftime('%Y-%m-%d')
+
+        self.siteID = wrangleEmptySite.createEmptySite(self.config.ulx, 
+                                                       self.config.uly, 
+                                                       self.config.lrx, 
+                                                       self.config.lry, 
+                                                       self.config.epsg, 
+                                                       GetMerra.USER, 
+                                                       GetMerra.KEY,
+                                                       sDateStr, 
+                                                       eDateStr,
+                                                       GetMerra.SERVER, 
+                                                       False)
+                         
+        self.logger.info('New site ID: ' + str(self.siteID))
+
+    #---------------------------------------------------------------------------
+    # extractImages
+    #---------------------------------------------------------------------------
+    def extractImages(self):
+
+        if self.zipFile:
+            
+            zf = zipfile.ZipFile(self.zipFile , 'r')
+            zf.extractall(self.merraDir)
+            
+        # Remove images comprised entirely of filler.
+        self.removeFiller()
+                                        
+    #---------------------------------------------------------------------------
+    # getCachedOrder
+    #
+    # This extracts the images of a cached order containing the run's extent
+    # and dates to the MERRA directory, and returns True, or returns False
+    # when there is none.
+    #---------------------------------------------------------------------------
+    def getCachedOrder(self):
+        
+        if not self.merraCache:
+            return False
+            
+        key = self.merraCache.find(GetMerra.PRODUCT,
+                                   self.config.epsg,
+                                   self.config.ulx, 
+                                   self.config.uly, 
+                                   self.config.lrx, 
+                                   self.config.lry, 
+                                   self.config.startDate, 
+                                   self.config.endDate)
+                                   
+        if not key:
+            
+            self.logger.info('No cached MERRA order contains this run.')
+            return False
+            
+        return self.merraCache.get(key, 
+                                   self.merraDir, 
+                                   self.config.ulx, 
+                                   self.config.uly, 
+                                   self.config.lrx, 
+                                   self.config.lry) > 0
+        
+    #---------------------------------------------------------------------------
+    # getOrderFile
+    #
+    # The site's order is downloaded to a file named for the site, so a
+    # partial download is only resumed for the same order.
+    #---------------------------------------------------------------------------
+    def getOrderFile(self):
+
+        return os.path.join(self.merraDir,
+                            wrangleOnePredictor.getZipName(self.siteID,
+                                                           GetMerra.PREDICTOR))
+
     #---------------------------------------------------------------------------
     # getPhase
     #---------------------------------------------------------------------------
@@ -96,61 +205,109 @@ class GetMerra(MmxApplication):
     # run
     #---------------------------------------------------------------------------
     def run(self):
+        GetMerra.runAll([self])
+
+    #---------------------------------------------------------------------------
+    # runAll
+    #
+    # This gets MERRA for several runs.  Runs without a zip file or a cached
+    # order are ordered from RECOVER together, and the orders waited for and
+    # downloaded concurrently.  Runs whose orders fail are reported after the
+    # others finish.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def runAll(getMerras):
         
-        if not os.path.exists(self.merraDir):
-            os.mkdir(self.merraDir)
+        orders  = []
+        ordered = []
+        
+        for getMerra in getMerras:
             
-        if not self.zipFile:
+            if not os.path.exists(getMerra.merraDir):
+                os.mkdir(getMerra.merraDir)
             
-            verbose  = False
+            if getMerra.zipFile or getMerra.getCachedOrder():
+                continue
+                
+            # A finished order is downloaded directly, resuming a partial
+            # download.
+            if getMerra.url:
+                
+                name    = os.path.basename(urlparse.urlparse(getMerra.url).path)
+                zipFile = os.path.join(getMerra.merraDir, name)
+                
+                Downloader(logger = getMerra.logger).download(getMerra.url,
+                                                              zipFile)
+                getMerra.setOrder(zipFile)
+                continue
+                
+            if not getMerra.siteID:
+                getMerra.createSite()
+                
+            orders.append((getMerra.siteID, 
+                           GetMerra.PREDICTOR, 
+                           getMerra.getOrderFile()))
+            
+            ordered.append(getMerra)
+            
+        zipFiles = []
         
-            if not self.siteID:
-
-                sDateStr = self.config.startDate.strftime('%Y-%m-%d')
-                eDateStr = self.config.endDate.strftime('%Y-%m-%d')
-
-                self.siteID = wrangleEmptySite.createEmptySite(self.config.ulx, 
-                                                               self.config.uly, 
-                                                               self.config.lrx, 
-                                                               self.config.lry, 
-                                                               self.config.epsg, 
-                                                               GetMerra.USER, 
-                                                               GetMerra.KEY,
-                                                               sDateStr, 
-                                                               eDateStr,
-                                                               GetMerra.SERVER, 
-                                                               verbose)
-                                 
-                self.logger.info('New site ID: ' + str(self.siteID))
-
-            zipFile = wrangleOnePredictor.wrangle(GetMerra.USER,
-                                                  GetMerra.KEY,
-                                                  self.siteID, 
-                                                  False, # disable GCPC 
-                                                  False, # disable Lsat, 
-                                                  False, # disable MERRA
-                                                  True,  # MERRA All
-                                                  False, # disable modis,
-                                                  GetMerra.SERVER,
-                                                  verbose)
+        if orders:
+            
+            zipFiles = wrangleOnePredictor.wrangleAll(GetMerra.USER,
+                                                      GetMerra.KEY,
+                                                      orders,
+                                                      GetMerra.SERVER)
+            
+        failedSites = []
         
-            name = os.path.basename(zipFile)
-            self.zipFile = os.path.join(self.merraDir, name)                                           
-            os.rename(zipFile, self.zipFile)
-                                                   
-        if self.zipFile:
+        for getMerra, zipFile in zip(ordered, zipFiles):
             
-            zf = zipfile.ZipFile(self.zipFile , 'r')
-            zf.extractall(self.merraDir)
+            if zipFile:
+                getMerra.setOrder(zipFile)
+                
+            else:
+                failedSites.append(str(getMerra.siteID))
+                
+        for getMerra in getMerras:
             
-        # Remove images comprised entirely of filler.
-        self.removeFiller()
+            if getMerra not in ordered or getMerra.zipFile:
+                getMerra.extractImages()
+                
+        if failedSites:
+            
+            raise RuntimeError('Unable to get MERRA for sites ' + \
+                               ', '.join(failedSites) + '.')
                                         
+    #---------------------------------------------------------------------------
+    # setOrder
+    #
+    # This uses a downloaded order, and caches it.
+    #---------------------------------------------------------------------------
+    def setOrder(self, zipFile):
+        
+        self.zipFile = zipFile
+
+        if self.merraCache:
+            
+            self.merraCache.put(GetMerra.PRODUCT,
+                                self.config.epsg,
+                                self.config.ulx, 
+                                self.config.uly, 
+                                self.config.lrx, 
+                                self.config.lry, 
+                                self.config.startDate, 
+                                self.config.endDate,
+                                self.zipFile)
+                                
+            self.merraCache.evict()
+                                                   
 #-------------------------------------------------------------------------------
 # main
 #
 # 1.  configureMmxRun
 # 2.  ./getMerra.py -c ~/Desktop/SystemTesting/Mmx/config.mmx -s 414
+#     ./getMerra.py -c ~/Desktop/SystemTesting/Mmx/*/config.mmx
 # 3.  prepareImages
 # 4.  prepareTrials
 # 5.  runTrials
@@ -160,21 +317,46 @@ class GetMerra(MmxApplication):
 def main():
 
     # Process command-line args. 
-    desc = 'This application retrieves MERRA files for a MERRA/Max run.'
+    desc = 'This application retrieves MERRA files for MERRA/Max runs.  ' + \
+           'Several runs are ordered and downloaded at once.'
 
     parser = argparse.ArgumentParser(description=desc)
     
     parser.add_argument('-c',
                         required = True, 
-                        help='path to MERRA-Max configuration file')
+                        nargs = '+',
+                        help='paths to MERRA-Max configuration files')
     
     parser.add_argument('-s',
                         help='site ID of an existing site; use this to continue a site that was already started')
     
+    parser.add_argument('-u',
+                        help = 'URL of a finished order\'s zip file; use ' + \
+                               'this to download it again, resuming a ' + \
+                               'partial download')
+    
+    parser.add_argument('--cache',
+                        help = 'directory of MERRA orders shared by runs')
+    
+    parser.add_argument('--cacheMB',
+                        type = int,
+                        default = MerraCache.DEFAULT_MB,
+                        help = 'largest size of the MERRA cache')
+    
+    parser.add_argument('--cacheDays',
+                        type = float,
+                        help = 'evict orders not used in this many days')
+    
     args = parser.parse_args()
     
-    gm = GetMerra(args.c, args.s)
-    gm.run()
+    if len(args.c) > 1 and (args.s or args.u):
+        parser.error('-s and -u apply to one configuration file.')
+        
+    getMerras = [GetMerra(configFile, args.s, args.cache, args.cacheMB, 
+                          args.cacheDays, args.u)
+                 for configFile in args.c]
+                 
+    GetMerra.runAll(getMerras)
     
 #-------------------------------------------------------------------------------
 # Invoke the main
@@ -10,7 +10,12 @@ from prepareImages   import PrepareImages
 from prepareTrials   import PrepareTrials
 from runTrials       import RunTrials
 from selector        import Selector
+from adaptiveSelector import AdaptiveSelector
+from tournamentSelector import TournamentSelector
 from modeler         import Modeler
+from MmxConfig       import MmxConfig
+
+SELECTIONS = ['all', 'adaptive', 'tournament']
 
 #-------------------------------------------------------------------------------
 # main
@@ -28,10 +33,12 @@ def main():
                         required = True, 
                         help = 'path to file of presence points')
     
+    parser.add_argument('-i', default = '.', help = 'path to input directory')
     parser.add_argument('-o', default = '.', help = 'path to output directory')
     
     parser.add_argument('-p', 
                         default = 10, 
+                        type = int,
                         help = 'number of concurrent processes to run')
     
     parser.add_argument('-s',
@@ -40,22 +47,59 @@ def main():
     
     parser.add_argument('-t',
                         default = 10,
+                        type = int,
                         help='number of trials for selecting top-ten predictors')
     
     parser.add_argument('--startDate', help = 'MM-DD-YYYY')
     parser.add_argument('--endDate', help = 'MM-DD-YYYY')
+    
+    parser.add_argument('--layerFormat',
+                        choices = MmxConfig.LAYER_FORMATS,
+                        default = MmxConfig.DEFAULT_LAYER_FORMAT,
+                        help = 'format of the layers given to MaxEnt')
+    
+    parser.add_argument('--trialMode',
+                        choices = MmxConfig.TRIAL_MODES,
+                        default = MmxConfig.DEFAULT_TRIAL_MODE,
+                        help = 'give trials full grids or samples with data')
+
+    parser.add_argument('--selection',
+                        choices = SELECTIONS,
+                        default = SELECTIONS[0],
+                        help = 'run all trials, run them in waves ' + \
+                               'until the top ten are stable, with -t ' + \
+                               'the most trials, or run a tournament ' + \
+                               'of successive halving')
+
+    parser.add_argument('--memoryBudget',
+                        type = int,
+                        help = 'megabytes of memory MaxEnt may use on a ' + \
+                               'node; defaults to most of its RAM')
 
     args = parser.parse_args()
     
     # Run the process.
-    c = ConfigureMmxRun(args.f, args.startDate, args.endDate, args.s, args.o, 
-                        args.p, args.t)
+    c = ConfigureMmxRun(args.f, args.startDate, args.endDate, args.s, args.i,
+                        args.o, args.p, args.t, args.layerFormat,
+                        args.trialMode, args.memoryBudget)
     
     GetMerra     (c.config.configFile).run()
     PrepareImages(c.config.configFile).run()
-    PrepareTrials(c.config.configFile).run()
-    RunTrials    (c.config.configFile).run()
-    Selector     (c.config.configFile).run()
+    
+    if args.selection == 'adaptive':
+        
+        AdaptiveSelector(c.config.configFile).run()
+        
+    elif args.selection == 'tournament':
+        
+        TournamentSelector(c.config.configFile).run()
+        
+    else:
+        
+        PrepareTrials(c.config.configFile).run()
+        RunTrials    (c.config.configFile).run()
+        Selector     (c.config.configFile).run()
+        
     Modeler      (c.config.configFile).run()
     
 #-------------------------------------------------------------------------------
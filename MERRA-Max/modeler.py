@@ -1,11 +1,13 @@
 #!/usr/bin/python
 
 import argparse
+import csv
 import os
 import shutil
 import sys
 
 from MaxEntHelper import MaxEntHelper
+from MemoryScheduler import MemoryScheduler
 from MmxApplication import MmxApplication
 from MmxConfig import MmxConfig
 
@@ -41,13 +43,74 @@ class Modeler(MmxApplication):
         if not os.path.exists(finalDir):
             os.mkdir(finalDir)
         
-        MaxEntHelper.copyAscFiles(self.config.topTen, finalDir)
+        MaxEntHelper.linkLayerFiles(self.config.topTen, 
+                                    finalDir, 
+                                    self.config.layerFormat)
         
-        samplesFile = MaxEntHelper.createSamplesFile(self.config.presFile, 
-                                                     self.config.species, 
-                                                     finalDir)
+        topNames = [os.path.splitext(os.path.basename(t))[0] 
+                    for t in self.config.topTen]
+                        
+        # SWD runs train on the shared background and project onto the grids.
+        if self.config.trialMode == 'swd':
+            
+            layers = os.path.join(self.swdDir, 
+                                  MmxApplication.SWD_BACKGROUND_FILE)
+            
+            with open(layers, 'r') as f:
+                layerNames = csv.reader(f).next()[3:]
+                
+            speciesFile = os.path.join(self.swdDir, 
+                                       MmxApplication.SWD_PRESENCE_FILE)
+            
+            toggles       = MaxEntHelper.getToggles(layerNames, topNames)
+            projectionDir = finalDir
+            sampleFiles   = [speciesFile, layers]
+            numPoints     = 0
+            
+        else:
+            
+            speciesFile = \
+                MaxEntHelper.createSamplesFile(self.config.presFile, 
+                                               self.config.species, 
+                                               finalDir)
 
-        MaxEntHelper.runMaxEnt(samplesFile, finalDir, finalDir, self.logger)
+            layers        = finalDir
+            toggles       = []
+            projectionDir = None
+            sampleFiles   = [speciesFile]
+            
+            # MaxEnt draws its background points from the grids.
+            numPoints = MaxEntHelper.MAX_BACKGROUND_POINTS
+            
+        for sampleFile in sampleFiles:
+            
+            with open(sampleFile) as f:
+                numPoints += sum(1 for line in f) - 1
+                
+        numCells = MaxEntHelper.getNumCells(os.path.join(self.finishedDir, 
+                                                         topNames[0] + '.tif'))
+        
+        heapMB = MaxEntHelper.estimateHeap(numCells, len(topNames), numPoints)
+        
+        runFunction = lambda heapMB: \
+            MaxEntHelper.runMaxEnt(speciesFile,
+                                   layers,
+                                   finalDir,
+                                   self.logger,
+                                   toggles,
+                                   projectionDir,
+                                   MaxEntHelper.FULL_PROFILE,
+                                   heapMB,
+                                   biasFile = self.getBiasGrid())
+        
+        scheduler = MemoryScheduler(self.config.memoryBudget, self.logger)
+        exitCode, heapMB = scheduler.run(runFunction, heapMB)
+        
+        if exitCode != 0:
+            
+            raise RuntimeError('The final model failed with exit code ' + \
+                               str(exitCode) + ', using ' + str(heapMB) + \
+                               ' MB of heap.')
         
 #-------------------------------------------------------------------------------
 # main
@@ -1,34 +1,54 @@
 #!/usr/bin/python
 
 import argparse
+import glob
 import os
 import sys
 
-from ISFS import clipReproject
-from ISFS import finishFolder
+from multiprocessing import Pool
+
+from ISFS import warpToGrid
 from ISFS.tif2asc import *
 
+from MaxEntHelper import MaxEntHelper
 from MmxApplication import MmxApplication
 from MmxConfig import MmxConfig
+from PredictorCache import PredictorCache
 from PresencePoints import PresencePoints
 
 #-------------------------------------------------------------------------------
 # class PrepareImages
 #
-# This clips and reprojects the images, then converts them to ASC format.
+# This clips, reprojects and squares the images in a single warp, then converts
+# them to the configured MaxEnt layer format.  With a predictor cache, images
+# prepared before for the same grid are linked from it instead.
 #-------------------------------------------------------------------------------
 class PrepareImages(MmxApplication):
     
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
-    def __init__(self, configFile, logger = None):
+    def __init__(self, configFile, numProcesses = None, cacheDir = None,
+                 cacheMB = PredictorCache.DEFAULT_MB, cacheDays = None,
+                 logger = None):
         
         mmxConfig = MmxConfig()
         mmxConfig.initializeFromFile(configFile)
         super(PrepareImages, self).__init__(mmxConfig, 'PrepareImages', logger)
     
         self.logHeader()
+        
+        # Default to the number of processes used for the trials.
+        self.numProcesses = int(numProcesses or self.config.numProcesses)
+        
+        self.predictorCache = None
+        
+        if cacheDir:
+            
+            self.predictorCache = PredictorCache(cacheDir, 
+                                                 cacheMB, 
+                                                 cacheDays, 
+                                                 self.logger)
 
     #---------------------------------------------------------------------------
     # getPhase
@@ -41,45 +61,177 @@ class PrepareImages(MmxApplication):
     #---------------------------------------------------------------------------
     def run(self):
         
-        # Clip and reproject.
-        if self.logger:
-            self.logger.info('Clipping and reprojecting to bounding box.')
-                             
         presPts = PresencePoints(self.config.presFile, self.config.species)
         
-        if not os.path.exists(self.clipReprojDir):
-            os.mkdir(self.clipReprojDir)
-            
-        clipReproject.clipReprojDir(self.merraDir,      \
-                                    self.clipReprojDir, \
-                                    presPts.epsg,       \
-                                    self.config.ulx,    \
-                                    self.config.uly,    \
-                                    self.config.lrx,    \
-                                    self.config.lry,    \
-                                    presPts.epsg)
-        
         if not os.path.exists(self.finishedDir):
             os.mkdir(self.finishedDir)
             
-        # Resample for square pixels.
+        #---
+        # MaxEnt converts ASC layers to its own .mxe format, so .mxe layers
+        # start as ASC layers.
+        #---
+        layerFormat = self.config.layerFormat
+        
+        if layerFormat == 'mxe':
+            layerFormat = 'asc'
+            
+        layerDir = os.path.join(self.finishedDir, layerFormat)
+        
+        if not os.path.exists(layerDir):
+            os.mkdir(layerDir)
+            
+        # Compute the grid shared by every predictor.
+        sourceImages = sorted(glob.glob(os.path.join(self.merraDir, '*.tif')))
+        
+        grid = warpToGrid.computeTargetGrid(sourceImages,    \
+                                            presPts.epsg,    \
+                                            self.config.ulx, \
+                                            self.config.uly, \
+                                            self.config.lrx, \
+                                            self.config.lry, \
+                                            presPts.epsg)
+        
         if self.logger:
-            self.logger.info('Resampling to square pixels.')
+            self.logger.info('Target grid (ulx, uly, lrx, lry, scale): ' + \
+                             str(grid))
             
-        finishFolder.resampleForTemplate(self.clipReprojDir, self.finishedDir)
-
-        # Convert to ASC format.
+        # Predictors prepared before for this grid are linked from the cache.
+        cacheKeys = {}
+        toPrepare = []
+        
+        for sourceImage in sourceImages:
+            
+            finishedImage = os.path.join(self.finishedDir, 
+                                         os.path.basename(sourceImage))
+                                         
+            if self.predictorCache:
+                
+                key = self.predictorCache.getKey(sourceImage, 
+                                                 presPts.epsg, 
+                                                 grid, 
+                                                 layerFormat)
+                                                 
+                if self.predictorCache.get(key, finishedImage, layerFormat):
+                    continue
+                    
+                cacheKeys[sourceImage] = key
+                
+            # Files from an earlier run may be links into the cache, so they
+            # are removed rather than written over.
+            for oldFile in [finishedImage] + \
+                           MaxEntHelper.getLayerFiles(finishedImage, 
+                                                      layerFormat):
+                
+                if os.path.lexists(oldFile):
+                    os.remove(oldFile)
+                    
+            toPrepare.append(sourceImage)
+            
+        if self.predictorCache and self.logger:
+            
+            self.logger.info('Found ' + \
+                             str(len(sourceImages) - len(toPrepare)) + \
+                             ' of ' + str(len(sourceImages)) + \
+                             ' predictors in the predictor cache.')
+            
+        #---
+        # Clip, reproject and resample to square pixels, then convert to the
+        # layer format, one predictor per task.
+        #---
+        numWorkers = max(min(self.numProcesses, len(toPrepare)), 1)
+        
         if self.logger:
-            self.logger.info('Converting images to ASC format.')
             
-        ascDir = createAsc(self.finishedDir)
+            self.logger.info('Preparing ' + str(len(toPrepare)) + \
+                             ' predictors with ' + str(numWorkers) + \
+                             ' processes.')
+            
+        tasks = [(sourceImage, self.finishedDir, layerDir, layerFormat, 
+                  presPts.epsg, grid) for sourceImage in toPrepare]
+                 
+        pool = Pool(numWorkers)
         
-        # Fix NaNs in ASC files.
+        try:
+            results = pool.map(preparePredictor, tasks, chunksize = 1)
+            
+        finally:
+            
+            pool.close()
+            pool.join()
+            
+        for image, error in results:
+            
+            if image in cacheKeys and not error:
+                
+                self.predictorCache.put(cacheKeys[image],
+                                        os.path.join(self.finishedDir,
+                                                     os.path.basename(image)),
+                                        layerFormat,
+                                        grid)
+                                        
+        if self.predictorCache:
+            self.predictorCache.evict()
+            
+        # Report each failure.
+        failures = [(image, error) for image, error in results if error]
+        
+        for image, error in failures:
+            
+            if self.logger:
+                self.logger.error('Unable to prepare ' + image + ': ' + error)
+                
         if self.logger:
-            self.logger.info('Converting NaNs to the no-data value.')
             
-        fixAscNan(ascDir)
+            self.logger.info('Prepared ' + \
+                             str(len(results) - len(failures)) + ' of ' + \
+                             str(len(results)) + ' predictors.')
+            
+        if len(failures) == len(sourceImages):
+            raise RuntimeError('No predictors were prepared.')
+            
+        if self.config.layerFormat == 'mxe':
+            
+            MaxEntHelper.convertLayers(layerDir, 
+                                       'asc',
+                                       os.path.join(self.finishedDir, 'mxe'),
+                                       'mxe',
+                                       self.logger)
+            
+        return failures
+        
+#-------------------------------------------------------------------------------
+# preparePredictor
+#
+# This runs in a worker process, so it is a module-level function that returns
+# its error, instead of raising it, for the parent to report.
+#-------------------------------------------------------------------------------
+def preparePredictor(task):
+    
+    sourceImage, finishedDir, layerDir, layerFormat, epsg, grid = task
+    finishedImage = os.path.join(finishedDir, os.path.basename(sourceImage))
+    
+    try:
+        warpToGrid.warpFile(sourceImage, finishedImage, epsg, grid)
+        # warpToGrid writes square pixels.
+        layerFile = createLayerFile(finishedImage, layerDir, layerFormat, True)
+        
+        if not layerFile:
+            raise RuntimeError('Unable to create a ' + layerFormat + ' file.')
+            
+    except (Exception, SystemExit), e:
+        
+        # Do not leave a partial predictor, or a .bil's header, for the trials
+        # to find.
+        for partial in [finishedImage] + \
+                       MaxEntHelper.getLayerFiles(finishedImage, layerFormat):
+            
+            if os.path.lexists(partial):
+                os.remove(partial)
+            
+        return sourceImage, str(e) or e.__class__.__name__
         
+    return sourceImage, None
+    
 #-------------------------------------------------------------------------------
 # main
 #
@@ -103,9 +255,33 @@ def main():
                         required = True, 
                         help='path to MERRA-Max configuration file')
     
+    parser.add_argument('-p',
+                        type = int,
+                        help = 'number of concurrent processes to run; ' + \
+                               'defaults to the configuration\'s')
+    
+    parser.add_argument('--cache',
+                        help = 'directory of a predictor cache shared by ' + \
+                               'runs; predictors found in it are not ' + \
+                               'prepared again')
+    
+    parser.add_argument('--cacheMB',
+                        type = int,
+                        default = PredictorCache.DEFAULT_MB,
+                        help = 'evict the least recently used predictors ' + \
+                               'beyond this size')
+    
+    parser.add_argument('--cacheDays',
+                        type = float,
+                        help = 'evict predictors not used in this many days')
+    
     args = parser.parse_args()
     
-    prepareImages = PrepareImages(args.c)
+    prepareImages = PrepareImages(args.c, 
+                                  args.p, 
+                                  args.cache, 
+                                  args.cacheMB, 
+                                  args.cacheDays)
     prepareImages.run()
     
 #-------------------------------------------------------------------------------
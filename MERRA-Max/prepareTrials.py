@@ -8,35 +8,216 @@ import random
 import shutil
 import sys
 
+from ISFS import mdsBuilder
+from ISFS import tif2asc
+
+from BackgroundSampler import BackgroundSampler
 from MaxEntHelper import MaxEntHelper
 from MmxApplication import MmxApplication
 from MmxConfig import MmxConfig
+from TrialManifest import TrialManifest
+from TrialStore import TrialStore
 
 #-------------------------------------------------------------------------------
 # class PrepareTrials
 #-------------------------------------------------------------------------------
 class PrepareTrials(MmxApplication):
     
+    BACKGROUND_CACHE_FILE = 'background.npz'
+    
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
-    def __init__(self, configFile, logger = None):
+    def __init__(self, configFile, 
+                 numBackground = BackgroundSampler.DEFAULT_POINTS,
+                 bufferDistance = None, biasFile = None, logger = None):
         
         mmxConfig = MmxConfig()
         mmxConfig.initializeFromFile(configFile)
         super(PrepareTrials, self).__init__(mmxConfig, 'PrepareTrials', logger)
     
+        if biasFile and not os.path.isfile(biasFile):
+            
+            raise RuntimeError('Bias file, ' + str(biasFile) + \
+                               ', does not exist.')
+            
+        self.numBackground  = numBackground
+        self.bufferDistance = bufferDistance
+        self.biasFile       = biasFile
+        
         self.logHeader()
 
+    #---------------------------------------------------------------------------
+    # addPredictorTrials
+    #
+    # This adds a trial for each list of predictors, numbered from firstTrial,
+    # and returns their numbers.  By default, they follow the trials already
+    # in the store.
+    #---------------------------------------------------------------------------
+    def addPredictorTrials(self, predictorLists, firstTrial = None):
+        
+        store = TrialStore(self.trialsDir)
+        
+        if firstTrial == None:
+            firstTrial = max([t['id'] for t in store.getTrials()] or [-1]) + 1
+        
+        trialNums = range(firstTrial, firstTrial + len(predictorLists))
+        
+        for i in range(len(predictorLists)):
+            
+            # Create a directory for this trial.
+            TRIAL_NAME = TrialStore.getTrialName(trialNums[i])
+            TRIAL_DIR  = os.path.join(self.trialsDir, TRIAL_NAME)
+            
+            if not os.path.exists(TRIAL_DIR):
+                os.mkdir(TRIAL_DIR)
+            
+            if self.logger:
+                self.logger.info('\nPreparing ' + TRIAL_NAME)
+
+            trialPredictors = predictorLists[i]
+            
+            if self.logger:
+                
+                baseNames = [str(os.path.basename(t)) for t in trialPredictors]
+                self.logger.info('Trial predictors: ' + str(baseNames))
+                
+            # The trial is the list of its predictors.
+            TrialManifest(TRIAL_DIR, trialPredictors).write()
+            
+            # Set the state to pending, now that the trial is ready.
+            store.addTrial(trialNums[i], trialPredictors)
+            
+        return trialNums
+        
+    #---------------------------------------------------------------------------
+    # addTrials
+    #
+    # This adds trials of random predictors.
+    #---------------------------------------------------------------------------
+    def addTrials(self, numTrials, firstTrial = None):
+        
+        # Get a list of the predictors.
+        tifFiles = glob.glob(os.path.join(self.finishedDir, '*.tif'))
+        
+        # Generate lists of random indexes in the files.
+        trialConstituents = self.generateFileIndexes(len(tifFiles), numTrials)
+
+        predictorLists = [[tifFiles[c] for c in constituents]
+                          for constituents in trialConstituents]
+                          
+        return self.addPredictorTrials(predictorLists, firstTrial)
+        
+    #---------------------------------------------------------------------------
+    # createBiasGrid
+    #
+    # Grid trials let MaxEnt draw their background points, so they receive
+    # the cells SWD trials draw from, and their weights, as a bias grid.
+    #---------------------------------------------------------------------------
+    def createBiasGrid(self, tifFiles):
+        
+        if self.logger:
+            self.logger.info('Creating the background bias grid.')
+            
+        presData   = mdsBuilder.readFieldData(self.config.presFile)
+        presPoints = [row[:2] for row in presData[1:]]
+        
+        sampler = BackgroundSampler(tifFiles, 
+                                    self.numBackground,
+                                    presPoints,
+                                    self.bufferDistance,
+                                    self.biasFile,
+                                    self.logger)
+        
+        biasTif = os.path.join(self.trialsDir, 
+                               MmxApplication.BIAS_GRID + '.tif')
+        
+        sampler.writeBiasGrid(biasTif)
+        
+        # MaxEnt reads an ASC bias grid beside .mxe layers.
+        layerFormat = self.config.layerFormat
+        
+        if layerFormat == 'mxe':
+            layerFormat = 'asc'
+            
+        biasGrid = tif2asc.createLayerFile(biasTif, 
+                                           self.trialsDir, 
+                                           layerFormat)
+        
+        if not biasGrid:
+            raise RuntimeError('Unable to create a layer from ' + biasTif + '.')
+            
+        return biasGrid
+        
+    #---------------------------------------------------------------------------
+    # createSwdFiles
+    #
+    # This samples every predictor at the presence points and at a set of
+    # background points, writing the two tables that SWD trials share.
+    #---------------------------------------------------------------------------
+    def createSwdFiles(self, tifFiles):
+        
+        if self.logger:
+            self.logger.info('Creating samples-with-data files.')
+            
+        if not os.path.exists(self.swdDir):
+            os.mkdir(self.swdDir)
+            
+        # Presence points
+        presData = mdsBuilder.readFieldData(self.config.presFile)
+        presData[0] = ['x', 'y']
+        presData = mdsBuilder.loadValues(tifFiles, presData)
+        
+        presRows = [['species'] + presData[0]] + \
+                   [[self.config.species] + row for row in presData[1:]]
+        
+        mdsBuilder.writeFieldData(presRows, 
+                                  os.path.join(self.swdDir, 
+                                               MmxApplication.SWD_PRESENCE_FILE))
+        
+        # Background points, drawn once per run and reused while current
+        presPoints = [row[:2] for row in presData[1:]]
+        
+        sampler = BackgroundSampler(tifFiles, 
+                                    self.numBackground,
+                                    presPoints,
+                                    self.bufferDistance,
+                                    self.biasFile,
+                                    self.logger)
+        
+        cacheFile = os.path.join(self.swdDir, 
+                                 PrepareTrials.BACKGROUND_CACHE_FILE)
+        
+        if sampler.isCacheCurrent(cacheFile):
+            
+            if self.logger:
+                self.logger.info('Reusing background points in ' + cacheFile)
+                
+            sampler.readCache(cacheFile)
+            
+        else:
+            
+            sampler.sample()
+            sampler.writeCache(cacheFile)
+        
+        sampler.writeSwdFile(os.path.join(self.swdDir,
+                                          MmxApplication.SWD_BACKGROUND_FILE))
+        
+        if self.logger:
+            
+            self.logger.info('Sampled ' + str(len(presRows) - 1) + \
+                             ' presence and ' + str(len(sampler.xs)) + \
+                             ' background points.')
+        
     #---------------------------------------------------------------------------
     # generateFileIndexes
     #---------------------------------------------------------------------------
-    def generateFileIndexes(self, maxIndex):
+    def generateFileIndexes(self, maxIndex, numTrials):
         
         listOfIndexLists = []
         PREDICTORS_PER_TRIAL = 10
         
-        for i in range(1, self.config.numTrials + 1):
+        for i in range(1, numTrials + 1):
             
             listOfIndexLists.append(random.sample(range(0, maxIndex - 1), 
                                                   PREDICTORS_PER_TRIAL))
@@ -49,6 +230,39 @@ class PrepareTrials(MmxApplication):
     def getPhase(self):
         return 'PREPARE_TRIALS'
 
+    #---------------------------------------------------------------------------
+    # prepareInputs
+    #
+    # This prepares the inputs that trials share.
+    #---------------------------------------------------------------------------
+    def prepareInputs(self):
+        
+        if not os.path.exists(self.trialsDir):
+            os.mkdir(self.trialsDir)
+
+        # Remove absence points.
+        self.removeAbsencePoints()
+            
+        # SWD trials share one table of presence and one of background values.
+        # Grid trials share one samples file, the FINISHED layers and a bias
+        # grid of the cells their background may come from.
+        tifFiles = glob.glob(os.path.join(self.finishedDir, '*.tif'))
+        
+        if self.config.trialMode == 'swd':
+            self.createSwdFiles(tifFiles)
+            
+        else:
+            
+            self.createBiasGrid(tifFiles)
+            
+            samplesFile = \
+                MaxEntHelper.createSamplesFile(self.config.presFile, 
+                                               self.config.species, 
+                                               self.trialsDir)
+
+            if self.logger:
+                self.logger.info('Created samples file ' + str(samplesFile))
+            
     #---------------------------------------------------------------------------
     # removeAbsencePoints
     #---------------------------------------------------------------------------
@@ -102,61 +316,9 @@ class PrepareTrials(MmxApplication):
     #---------------------------------------------------------------------------
     def run(self):
         
-        # Get a list of the predictors.
-        tifFiles = glob.glob(os.path.join(self.finishedDir, '*.tif'))
+        self.prepareInputs()
+        self.addTrials(self.config.numTrials, 0)
         
-        # Generate lists of random indexes in the files.
-        trialConstituents = self.generateFileIndexes(len(tifFiles))
-
-        if not os.path.exists(self.trialsDir):
-            os.mkdir(self.trialsDir)
-
-        # Remove absence points.
-        self.removeAbsencePoints()
-            
-        # Run MaxEnt for each trial constituent.
-        for i in range(len(trialConstituents)):
-            
-            # Create a directory for this trial.
-            TRIAL_NAME = 'trial-' + str(i)
-            TRIAL_DIR  = os.path.join(self.trialsDir, TRIAL_NAME)
-            
-            if not os.path.exists(TRIAL_DIR):
-                os.mkdir(TRIAL_DIR)
-            
-            if self.logger:
-                self.logger.info('\nPreparing ' + TRIAL_NAME)
-
-            # Get this trial's constituents.
-            constituents    = trialConstituents[i]
-            trialPredictors = [tifFiles[c] for c in constituents]
-            
-            if self.logger:
-                
-                baseNames = [str(os.path.basename(t)) for t in trialPredictors]
-                self.logger.info('Trial predictors: ' + str(baseNames))
-                
-            # Set the state to pending.
-            os.system('touch "' + \
-                      os.path.join(TRIAL_DIR, MmxApplication.PENDING_FILE) + \
-                      '"')
-            
-            # Create the field data samples file for the trial.
-            samplesFile = MaxEntHelper.createSamplesFile(self.config.presFile, 
-                                                         self.config.species, 
-                                                         TRIAL_DIR)
-
-            if self.logger:
-                self.logger.info('Created samples file ' + str(samplesFile))
-            
-            # Copy the ASC files to the trial.
-            ascDir = os.path.join(TRIAL_DIR, 'asc')
-            
-            if not os.path.exists(ascDir):
-                os.mkdir(ascDir)
-            
-            MaxEntHelper.copyAscFiles(trialPredictors, ascDir)
-            
 #-------------------------------------------------------------------------------
 # main
 #
@@ -179,9 +341,27 @@ def main():
                         required = True, 
                         help='path to MERRA-Max configuration file')
     
+    parser.add_argument('--numBackground',
+                        type = int,
+                        default = BackgroundSampler.DEFAULT_POINTS,
+                        help = 'number of background points for SWD trials')
+    
+    parser.add_argument('--buffer',
+                        type = float,
+                        help = 'draw background points only within this ' + \
+                               'distance of a presence point, in the ' + \
+                               'predictors\' units')
+    
+    parser.add_argument('--biasFile',
+                        help = 'grid on the predictors\' grid weighting ' + \
+                               'the background draw')
+    
     args = parser.parse_args()
     
-    prepTrials = PrepareTrials(args.c)
+    prepTrials = PrepareTrials(args.c, 
+                               args.numBackground, 
+                               args.buffer, 
+                               args.biasFile)
     prepTrials.run()
     
 #-------------------------------------------------------------------------------
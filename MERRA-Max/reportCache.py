@@ -0,0 +1,70 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import sys
+
+from MerraCache import MerraCache
+from PredictorCache import PredictorCache
+from ResultCache import ResultCache
+
+#-------------------------------------------------------------------------------
+# main
+#
+# ./reportCache.py -d ~/Desktop/SystemTesting/MmxCache
+#
+# This reports on the caches in a directory shared by runs, as given to
+# getMerra.py, prepareImages.py and runTrials.py with --cache.  With --evict,
+# entries beyond the given size or age are evicted first.
+#-------------------------------------------------------------------------------
+def main():
+
+    # Process command-line args.
+    desc = 'This application reports on the caches shared by MERRA/Max runs.'
+    parser = argparse.ArgumentParser(description = desc)
+
+    parser.add_argument('-d',
+                        required = True,
+                        help = 'path to the cache directory')
+
+    parser.add_argument('--evict',
+                        action = 'store_true',
+                        help = 'evict entries beyond --cacheMB or ' + \
+                               '--cacheDays first')
+
+    parser.add_argument('--cacheMB',
+                        type = int,
+                        help = 'largest size of each cache; defaults to ' + \
+                               'each cache\'s default')
+
+    parser.add_argument('--cacheDays',
+                        type = float,
+                        help = 'evict entries not used in this many days')
+
+    args = parser.parse_args()
+    found = False
+
+    for cacheClass in [MerraCache, PredictorCache, ResultCache]:
+
+        if not os.path.exists(os.path.join(args.d, cacheClass.CACHE_FILE)):
+            continue
+
+        found = True
+        cache = cacheClass(args.d,
+                           args.cacheMB or cacheClass.DEFAULT_MB,
+                           args.cacheDays)
+
+        if args.evict:
+            print 'Evicted ' + str(cache.evict()) + ' entries.'
+
+        for line in cache.getReport():
+            print line
+
+    if not found:
+        print 'No caches found in ' + args.d
+
+#-------------------------------------------------------------------------------
+# Invoke the main
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
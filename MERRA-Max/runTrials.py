@@ -1,14 +1,24 @@
 #!/usr/bin/python
 
 import argparse
+import csv
 import glob
 import os
 import shutil
 import sys
+import threading
+import time
 
+from multiprocessing.pool import ThreadPool
+
+from CostModel import CostModel
 from MaxEntHelper import MaxEntHelper
+from MaxEntWorkerPool import MaxEntWorkerPool
+from MemoryScheduler import MemoryScheduler
 from MmxApplication import MmxApplication
 from MmxConfig import MmxConfig
+from ResultCache import ResultCache
+from TrialStore import TrialStore
 
 #-------------------------------------------------------------------------------
 # class RunTrials
@@ -17,10 +27,27 @@ from MmxConfig import MmxConfig
 #-------------------------------------------------------------------------------
 class RunTrials(MmxApplication):
     
+    # Runs a trial may have, when its failures may be transient.
+    MAX_ATTEMPTS = TrialStore.MAX_ATTEMPTS
+    
+    # A trial running this many times the median trial's time is copied.
+    SPECULATION_FACTOR = 2.0
+    
+    # Trials to complete before their median time is meaningful
+    MIN_RUNTIMES = 3
+    
+    # Successful trials between fits of the cost model
+    REFIT_INTERVAL = 10
+    
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
-    def __init__(self, configFile, trialsToRun = None, logger = None):
+    def __init__(self, configFile, trialsToRun = None, useWorkers = False,
+                 queue = False, leaseSeconds = TrialStore.DEFAULT_LEASE,
+                 maxAttempts = MAX_ATTEMPTS, timeoutSeconds = None,
+                 speculation = SPECULATION_FACTOR, cacheDir = None,
+                 cacheMB = ResultCache.DEFAULT_MB, cacheDays = None,
+                 logger = None):
         
         mmxConfig = MmxConfig()
         mmxConfig.initializeFromFile(configFile)
@@ -28,9 +55,281 @@ class RunTrials(MmxApplication):
     
         self.logHeader()
         
+        self.store   = TrialStore(self.trialsDir, maxAttempts)
+        numRecovered = self.store.recoverTrials()
+        
+        if numRecovered and self.logger:
+            
+            self.logger.info('Recovered ' + str(numRecovered) + \
+                             ' trials left running by ended processes.')
+            
         # Configure the trials to run.
-        self.trialDirs = self.getTrialDirs(trialsToRun)
+        self.trialRange = None
+        self.trials     = self.getTrials(trialsToRun)
+        
+        # Claims are leases, renewed while their trials run.  Held trials and
+        # their MaxEnt processes are keyed by their claims' tokens.
+        self.queue         = queue
+        self.leaseSeconds  = leaseSeconds
+        self.heldTrials    = {}
+        self.heldProcesses = {}
+        self.heldLock      = threading.Lock()
+        
+        # Idle workers copy stragglers, when speculation is not zero.
+        self.speculation = speculation
+        
+        # Trials that time out, or fail for unknown reasons, are retried.
+        self.maxAttempts    = maxAttempts
+        self.timeoutSeconds = timeoutSeconds
+        
+        # Results of trials run before, in any run, are reused from the cache.
+        self.resultCache = None
+        self.cacheCounts = {'hits': 0, 'misses': 0}
+        self.cacheLock   = threading.Lock()
+        
+        if cacheDir:
+            
+            self.resultCache = ResultCache(cacheDir, 
+                                           cacheMB, 
+                                           cacheDays, 
+                                           self.logger)
+        
+        # Trials select their predictors from the shared layers, by toggling.
+        # Grid trials draw their background from the bias grid's cells.
+        self.layerDir = os.path.join(self.finishedDir, self.config.layerFormat)
+        self.biasGrid = self.getBiasGrid()
+        
+        if self.config.trialMode == 'swd':
+            
+            self.layerDir = os.path.join(self.swdDir, 
+                                         MmxApplication.SWD_BACKGROUND_FILE)
+                                    
+            with open(self.layerDir) as f:
+                
+                # Skip the species, x and y columns.
+                self.layerNames = csv.reader(f).next()[3:]
+                
+        else:
+            
+            layerFiles = glob.glob(os.path.join(self.layerDir, 
+                                                '*.' + self.config.layerFormat))
+            
+            self.layerNames = [os.path.splitext(os.path.basename(f))[0]
+                               for f in layerFiles]
     
+        # JVMs are admitted against the node's memory budget.
+        self.scheduler  = MemoryScheduler(self.config.memoryBudget, self.logger)
+        self.useWorkers = useWorkers
+        self.workerPool = None
+        
+        if self.config.trialMode == 'swd':
+            
+            self.numCells  = 0
+            self.numPoints = 0
+            
+            sampleFiles = [os.path.join(self.swdDir, 
+                                        MmxApplication.SWD_PRESENCE_FILE),
+                           self.layerDir]
+            
+        else:
+            
+            tifFiles      = glob.glob(os.path.join(self.finishedDir, '*.tif'))
+            self.numCells = MaxEntHelper.getNumCells(tifFiles[0])
+            
+            # MaxEnt draws its background points from the grids.
+            self.numPoints = MaxEntHelper.MAX_BACKGROUND_POINTS
+            
+            sampleFiles = [os.path.join(self.trialsDir, 
+                                        os.path.basename(self.config.presFile))]
+            
+        for sampleFile in sampleFiles:
+            
+            if os.path.exists(sampleFile):
+                
+                with open(sampleFile) as f:
+                    self.numPoints += sum(1 for line in f) - 1
+        
+        # Trials run longest expected first, by the run's cost model.
+        self.costModel = CostModel(self.trialsDir, 
+                                   self.layerNames, 
+                                   self.numPoints, 
+                                   self.numCells, 
+                                   self.logger)
+                                   
+        self.costLock    = threading.Lock()
+        self.expected    = {}
+        self.numRuntimes = 0
+        self.updateCostModel()
+        
+    #---------------------------------------------------------------------------
+    # claimStraggler
+    #
+    # This claims a speculative copy of a trial running longer than the
+    # speculation factor times the median time of the successful trials.  It
+    # returns the copy, or None.
+    #---------------------------------------------------------------------------
+    def claimStraggler(self):
+        
+        if not self.speculation:
+            return None
+            
+        first, last = self.trialRange or (None, None)
+        runtimes    = []
+        
+        for trial in self.store.getTrials([TrialStore.COMPLETE]):
+            
+            if trial['outcome'] == MaxEntHelper.SUCCESS and \
+               (first == None or first <= trial['id'] <= last):
+                
+                runtimes.append(trial['finished'] - trial['started'])
+                
+        if len(runtimes) < RunTrials.MIN_RUNTIMES:
+            return None
+            
+        median = sorted(runtimes)[len(runtimes) // 2]
+        
+        trial = self.store.claimSpeculation(self.speculation * median,
+                                            self.leaseSeconds,
+                                            first,
+                                            last)
+        
+        if trial and self.logger:
+            
+            self.logger.info('Copying ' + trial['name'] + ', which has ' + \
+                             'run ' + \
+                             '%.1f' % (time.time() - trial['started']) + \
+                             ' seconds, against a median of ' + \
+                             '%.1f' % median + ' seconds.')
+            
+        return trial
+        
+    #---------------------------------------------------------------------------
+    # estimateTrialHeap
+    #
+    # A trial never starts with less heap than it last used.
+    #---------------------------------------------------------------------------
+    def estimateTrialHeap(self, trial):
+        
+        if trial['predictors']:
+            numLayers = len(trial['predictors'])
+            
+        else:
+            
+            numLayers = len(glob.glob(os.path.join(self.getTrialDir(trial), 
+                                                   self.config.layerFormat, 
+                                                   '*.' + \
+                                                   self.config.layerFormat)))
+            
+        heapMB = MaxEntHelper.estimateHeap(self.numCells, 
+                                           numLayers, 
+                                           self.numPoints)
+        
+        return max(heapMB, trial['heapMB'] or 0)
+        
+    #---------------------------------------------------------------------------
+    # finishTrial
+    #
+    # This releases a claimed trial and records its outcome.  A transient
+    # failure is made pending again, until the trial has had maxAttempts runs.
+    # When a trial has two copies, the first to succeed keeps its results, and
+    # the other is stopped and its results removed.  The run time, in seconds,
+    # of a successful trial is recorded for the cost model, and its results
+    # are cached.  This returns True when the trial is to be retried.
+    #---------------------------------------------------------------------------
+    def finishTrial(self, trial, outcome, exitCode, heapMB, seconds = None):
+        
+        with self.heldLock:
+            
+            del self.heldTrials[trial['token']]
+            self.heldProcesses.pop(trial['token'], None)
+            
+        retry = outcome in MaxEntHelper.TRANSIENT_OUTCOMES and \
+                trial['attempts'] < self.maxAttempts
+                
+        resultsDir = self.getResultsDir(trial)
+        
+        # The heap is recorded, so a reset gives a trial that ran out of
+        # memory twice as much.
+        state = self.store.completeTrial(trial, outcome, exitCode, heapMB, 
+                                         retry)
+                                         
+        if state == None:
+            
+            kept = self.store.getTrial(trial['id'])
+            
+            if kept['state'] == TrialStore.COMPLETE and \
+               (kept['resultsName'] or TrialStore.RESULTS_NAME) != \
+               TrialStore.getResultsName(trial):
+                
+                shutil.rmtree(resultsDir, ignore_errors = True)
+                
+                if self.logger:
+                    
+                    self.logger.info('Another copy of ' + trial['name'] + \
+                                     ' finished first, so ' + resultsDir + \
+                                     ' was removed.')
+                
+            elif self.logger:
+                
+                self.logger.warning('The lease on ' + trial['name'] + \
+                                    ' expired, so its outcome was not ' + \
+                                    'recorded.')
+            
+            return False
+        
+        if state == TrialStore.COMPLETE:
+            
+            self.stopCopies(trial)
+            
+            otherName = TrialStore.RESULTS_NAME \
+                        if trial['speculative'] \
+                        else TrialStore.SPECULATIVE_RESULTS_NAME
+                        
+            shutil.rmtree(os.path.join(self.getTrialDir(trial), otherName),
+                          ignore_errors = True)
+            
+            if trial['speculative'] and self.logger:
+                
+                self.logger.info('The copy of ' + trial['name'] + \
+                                 ' finished first.')
+                
+            if seconds != None and trial['predictors']:
+                self.recordRuntime(trial, seconds)
+                
+            if trial.get('cacheKey'):
+                self.resultCache.put(trial['cacheKey'], resultsDir)
+                
+            self.logEstimate()
+                
+            return False
+            
+        if state == TrialStore.RUNNING:
+            
+            if self.logger:
+                
+                self.logger.warning(resultsDir + ' failed (' + outcome + \
+                                    '), so the trial\'s other copy ' + \
+                                    'finishes it.')
+                
+            return False
+            
+        if outcome != MaxEntHelper.SUCCESS and self.logger:
+            
+            self.logger.error(self.getTrialDir(trial) + ' failed (' + \
+                              outcome + ') with exit code ' + \
+                              str(exitCode) + ' on attempt ' + \
+                              str(trial['attempts']) + \
+                              ('.  Retrying.' if retry else '.'))
+            
+        return retry
+        
+    #---------------------------------------------------------------------------
+    # getNumWorkers
+    #---------------------------------------------------------------------------
+    def getNumWorkers(self):
+        
+        return max(min(int(self.config.numProcesses), len(self.trials)), 1)
+        
     #---------------------------------------------------------------------------
     # getPhase
     #---------------------------------------------------------------------------
@@ -38,79 +337,614 @@ class RunTrials(MmxApplication):
         return 'RUN_TRIALS'
 
     #---------------------------------------------------------------------------
-    # getTrialDirs
+    # getResultsDir
+    #
+    # This returns the directory of a claimed copy's results.
+    #---------------------------------------------------------------------------
+    def getResultsDir(self, trial):
+        
+        return os.path.join(self.getTrialDir(trial), 
+                            TrialStore.getResultsName(trial))
+        
+    #---------------------------------------------------------------------------
+    # getTrialDir
+    #---------------------------------------------------------------------------
+    def getTrialDir(self, trial):
+        return os.path.join(self.trialsDir, trial['name'])
+        
+    #---------------------------------------------------------------------------
+    # getTrialInputs
+    #
+    # This returns the species file, layers and layer toggles for MaxEnt.
+    #---------------------------------------------------------------------------
+    def getTrialInputs(self, trial):
+        
+        trialDir = self.getTrialDir(trial)
+        
+        # Trials prepared before manifests have their own samples and layers.
+        if not trial['predictors']:
+            
+            speciesFile = os.path.basename(self.config.presFile)
+        
+            return os.path.join(trialDir, speciesFile), \
+                   os.path.join(trialDir, self.config.layerFormat), \
+                   []
+        
+        predNames = [os.path.splitext(os.path.basename(p))[0]
+                     for p in trial['predictors']]
+                     
+        toggles = MaxEntHelper.getToggles(self.layerNames, predNames)
+            
+        if self.config.trialMode == 'swd':
+            
+            speciesFile = os.path.join(self.swdDir, 
+                                       MmxApplication.SWD_PRESENCE_FILE)
+            
+        else:
+            
+            speciesFile = os.path.join(self.trialsDir, 
+                                       os.path.basename(self.config.presFile))
+        
+        return speciesFile, self.layerDir, toggles
+        
+    #---------------------------------------------------------------------------
+    # getTrialOrder
+    #
+    # This returns the trials, longest expected first.  Trials without an
+    # expected time are last.
+    #---------------------------------------------------------------------------
+    def getTrialOrder(self):
+        
+        return sorted(self.trials, 
+                      key = lambda t: self.expected.get(t['id'], -1.0), 
+                      reverse = True)
+        
+    #---------------------------------------------------------------------------
+    # getTrials
+    #
+    # trialsToRun is a range of trial numbers, like "1-10", or None for every
+    # trial.
     #---------------------------------------------------------------------------
-    def getTrialDirs(self, trialsToRun):
+    def getTrials(self, trialsToRun):
         
-        trialDirs = []
+        trials = self.store.getTrials()
         
         if trialsToRun:
             
             startStr, endStr = trialsToRun.split('-')
             start            = int(startStr.strip())
-            end              = int(endStr.strip()) + 1
-            trialsToRun      = range(start, end)
+            end              = int(endStr.strip())
+            trialNums        = [t['id'] for t in trials]
             
-            for trialNum in trialsToRun:
+            for trialNum in range(start, end + 1):
                 
-                trialDir = os.path.join(self.trialsDir, \
-                                        'trial-' + str(trialNum))
-
-                if not os.path.exists(trialDir):
+                if trialNum not in trialNums:
                     
-                    raise RuntimeError('Trial directory, ' + \
-                                       trialDir + \
+                    raise RuntimeError('Trial ' + str(trialNum) + \
                                        ' does not exist.')
                                        
-                trialDirs.append(trialDir)
+            trials          = [t for t in trials if start <= t['id'] <= end]
+            self.trialRange = (start, end)
+                
+        if len(trials) == 0:
+            raise RuntimeError('No trials found in ' + str(self.trialsDir))
+            
+        return trials
+            
+    #---------------------------------------------------------------------------
+    # holdTrial
+    #---------------------------------------------------------------------------
+    def holdTrial(self, trial):
+        
+        with self.heldLock:
+            self.heldTrials[trial['token']] = trial
+            
+    #---------------------------------------------------------------------------
+    # isQueueDrained
+    #
+    # The queue is drained when none of its trials is pending or running, here
+    # or elsewhere.
+    #---------------------------------------------------------------------------
+    def isQueueDrained(self):
+        
+        trials = self.store.getTrials([TrialStore.PENDING, TrialStore.RUNNING])
+        
+        if self.trialRange:
+            
+            start, end = self.trialRange
+            trials     = [t for t in trials if start <= t['id'] <= end]
+            
+        return len(trials) == 0
+        
+    #---------------------------------------------------------------------------
+    # logCacheHits
+    #---------------------------------------------------------------------------
+    def logCacheHits(self):
+        
+        numLookups = self.cacheCounts['hits'] + self.cacheCounts['misses']
+        
+        if not self.logger or not numLookups:
+            return
+            
+        self.logger.info('Found ' + str(self.cacheCounts['hits']) + \
+                         ' of ' + str(numLookups) + ' trials in the ' + \
+                         'result cache, a hit rate of ' + \
+                         '%.1f' % (100.0 * self.cacheCounts['hits'] / \
+                                   numLookups) + '%.')
+        
+    #---------------------------------------------------------------------------
+    # logEstimate
+    #
+    # This logs when the trials are expected to finish.  Their remaining
+    # times are assigned, longest first, to whichever worker is free first.
+    # Workers elsewhere, sharing the queue, are counted by the trials running.
+    #---------------------------------------------------------------------------
+    def logEstimate(self):
+        
+        expected = self.expected
+        
+        if not self.logger or not expected:
+            return
+            
+        now        = time.time()
+        numRunning = 0
+        numDone    = 0
+        remaining  = []
+        
+        for trial in self.store.getTrials():
+            
+            if trial['id'] not in expected:
+                continue
+                
+            if trial['state'] == TrialStore.PENDING:
+                remaining.append(expected[trial['id']])
                 
+            elif trial['state'] == TrialStore.RUNNING:
+                
+                numRunning += 1
+                
+                remaining.append(max(expected[trial['id']] - \
+                                     (now - trial['started']), 0.0))
+                
+            else:
+                numDone += 1
+                
+        if not remaining:
+            return
+            
+        loads = [0.0] * max(self.getNumWorkers(), numRunning)
+        
+        for seconds in sorted(remaining, reverse = True):
+            loads[loads.index(min(loads))] += seconds
+            
+        self.logger.info(str(numDone) + ' of ' + str(len(expected)) + \
+                         ' trials are done.  The rest should take ' + \
+                         '%.1f' % (max(loads) / 60.0) + ' minutes, ' + \
+                         'finishing about ' + \
+                         time.strftime('%Y-%m-%d %H:%M', 
+                                       time.localtime(now + max(loads))) + \
+                         '.')
+        
+    #---------------------------------------------------------------------------
+    # logOutcomes
+    #
+    # This logs how many of the trials had each outcome.
+    #---------------------------------------------------------------------------
+    def logOutcomes(self):
+        
+        if not self.logger:
+            return
+            
+        trialNums = [t['id'] for t in self.trials]
+        counts    = {}
+        
+        for trial in self.store.getTrials():
+            
+            if trial['id'] in trialNums and trial['outcome']:
+                
+                counts[trial['outcome']] = \
+                    counts.get(trial['outcome'], 0) + 1
+        
+        self.logger.info('Trial outcomes: ' + \
+                         ', '.join([str(n) + ' ' + outcome 
+                                    for outcome, n in sorted(counts.items())]))
+            
+    #---------------------------------------------------------------------------
+    # lookUpResults
+    #
+    # This writes a trial's results from the result cache, and returns True,
+    # when they are there.  Otherwise, the trial's key is kept with it, so its
+    # results are cached when it succeeds.  Copies of trials are not looked
+    # up.
+    #---------------------------------------------------------------------------
+    def lookUpResults(self, trial, speciesFile, layers, toggles, resultsDir):
+        
+        if not self.resultCache or trial['speculative']:
+            return False
+            
+        # Toggles are sorted, so the order of the layers does not matter.
+        args = MaxEntHelper.getMaxEntArgs(speciesFile,
+                                          layers,
+                                          resultsDir,
+                                          sorted(toggles),
+                                          None,
+                                          MaxEntHelper.SCREENING_PROFILE,
+                                          self.biasGrid)
+                                          
+        # Only the layers MaxEnt uses are keyed by their contents.
+        if os.path.isdir(layers):
+            
+            inputFiles = \
+                [f for f in sorted(glob.glob(os.path.join(layers, '*.' + \
+                                                self.config.layerFormat)))
+                 if os.path.splitext(os.path.basename(f))[0] not in toggles]
+                 
+        else:
+            inputFiles = [layers]
+            
+        if self.biasGrid:
+            inputFiles.append(self.biasGrid)
+            
+        inputFiles = [speciesFile, MaxEntHelper.getMaxEntJar()] + inputFiles
+        key        = self.resultCache.getKey(inputFiles, args)
+        found      = self.resultCache.get(key, resultsDir)
+        
+        with self.cacheLock:
+            self.cacheCounts['hits' if found else 'misses'] += 1
+            
+        if found:
+            
+            if self.logger:
+                
+                self.logger.info(self.getTrialDir(trial) + \
+                                 ' was found in the result cache.')
+                                 
         else:
+            trial['cacheKey'] = key
             
-            trialDirs = glob.glob(os.path.join(self.trialsDir, 'trial-*'))
+        return found
+        
+    #---------------------------------------------------------------------------
+    # recordRuntime
+    #
+    # This records a successful trial's run time, and refits the cost model
+    # after every REFIT_INTERVAL of them, or once there are enough for a first
+    # fit.
+    #---------------------------------------------------------------------------
+    def recordRuntime(self, trial, seconds):
+        
+        self.store.addRuntime(trial['id'],
+                              self.costModel.getFeatures(trial['predictors']),
+                              seconds)
+                              
+        with self.costLock:
             
-            if len(trialDirs) == 0:
-                raise RuntimeError('No trials found in ' + str(trialDirs))
+            self.numRuntimes += 1
             
-        return trialDirs
+            refit = self.numRuntimes % RunTrials.REFIT_INTERVAL == 0 or \
+                    (not self.costModel.isFitted() and \
+                     self.numRuntimes >= CostModel.MIN_SAMPLES)
+                     
+        if refit:
+            self.updateCostModel()
+            
+    #---------------------------------------------------------------------------
+    # renewLeases
+    #
+    # This renews the leases of the trials this process is running, until
+    # stopped.  A trial whose claim was lost, to another holder or copy, is
+    # stopped.
+    #---------------------------------------------------------------------------
+    def renewLeases(self, stopEvent):
+        
+        while not stopEvent.wait(self.leaseSeconds / 3.0):
             
+            with self.heldLock:
+                heldTrials = self.heldTrials.values()
+                
+            for trial in heldTrials:
+                
+                if self.store.renewLease(trial, self.leaseSeconds):
+                    continue
+                
+                # A trial completing since the copy was made is not lost.
+                with self.heldLock:
+                    
+                    lost    = trial['token'] in self.heldTrials
+                    process = self.heldProcesses.get(trial['token'])
+                    
+                if not lost:
+                    continue
+                    
+                if self.logger:
+                    self.logger.warning('Lost the lease on ' + trial['name'])
+                    
+                if process:
+                    MaxEntHelper.stopProcess(process, threading.Event())
+                    
     #---------------------------------------------------------------------------
     # run
     #---------------------------------------------------------------------------
     def run(self):
         
-        speciesFile = os.path.basename(self.config.presFile)
-    
-        for trialDir in self.trialDirs:
-
-            if os.path.exists(os.path.join(trialDir, \
-                              MmxApplication.PENDING_FILE)):
-    
-                if self.logger:
-                    self.logger.info('Running ' + trialDir)
+        numWorkers = self.getNumWorkers()
+        
+        if self.logger:
+            
+            mode = ' from the shared queue' if self.queue else ''
+            
+            self.logger.info('Running ' + str(len(self.trials)) + \
+                             ' trials' + mode + ' with ' + str(numWorkers) + \
+                             ' workers.')
+        
+        # Persistent workers are sized for the largest trial.
+        if self.useWorkers:
+            
+            heapMB = max([self.estimateTrialHeap(t) for t in self.trials])
+            
+            self.workerPool = MaxEntWorkerPool(numWorkers, 
+                                               heapMB, 
+                                               self.scheduler, 
+                                               self.logger)
+            
+        self.logEstimate()
+        
+        stopEvent, renewer = self.startRenewer()
+        pool               = ThreadPool(numWorkers)
+        
+        try:
+            if self.queue:
+                
+                workerOutcomes = pool.map(self.runQueue, range(numWorkers), 
+                                          chunksize = 1)
+                                       
+                outcomes = [outcome for workerOutcome in workerOutcomes 
+                            for outcome in workerOutcome]
                 
-                resultsDir = os.path.join(trialDir, 'results')
+            else:
+                
+                outcomes = pool.map(self.runTrial, self.getTrialOrder(), 
+                                    chunksize = 1)
             
-                if not os.path.exists(resultsDir):
-                    os.mkdir(resultsDir)
+        finally:
             
-                # Set the state to running and remove pending file.
-                os.system('touch "' + \
-                          os.path.join(trialDir, MmxApplication.RUNNING_FILE) +\
-                          '"')
-                      
-                os.remove(os.path.join(trialDir, MmxApplication.PENDING_FILE))
+            pool.close()
+            pool.join()
+            stopEvent.set()
+            renewer.join()
             
-                MaxEntHelper.runMaxEnt(os.path.join(trialDir, speciesFile),
-                                       os.path.join(trialDir, 'asc'),
-                                       resultsDir,
-                                       self.logger)
-
-                # Set the state back to pending.
-                os.remove(os.path.join(trialDir, MmxApplication.RUNNING_FILE))
-
-                os.system('touch "' + \
-                          os.path.join(trialDir, MmxApplication.PENDING_FILE) +\
-                          '"')
+            if self.workerPool:
+                
+                self.workerPool.close()
+                self.workerPool = None
+            
+        self.logOutcomes()
+        self.logCacheHits()
+        
+        if self.numRuntimes:
+            self.updateCostModel()
+            
+        if self.resultCache:
+            self.resultCache.evict()
+            
+        return outcomes
+        
+    #---------------------------------------------------------------------------
+    # runClaimedTrial
+    #
+    # Returns the trial's outcome.
+    #---------------------------------------------------------------------------
+    def runClaimedTrial(self, trial):
+        
+        self.holdTrial(trial)
+        
+        trialDir = self.getTrialDir(trial)
+        
+        if self.logger:
+            self.logger.info('Running ' + trialDir)
+            
+        resultsDir = self.getResultsDir(trial)
+        onStart    = lambda process: self.trackProcess(trial, process)
+        startTime  = time.time()
+        cached     = False
+        outcome    = MaxEntHelper.UNKNOWN
+        exitCode   = None
+        heapMB     = None
+        
+        try:
+            # Results left by an earlier attempt, or earlier predictors, would
+            # pass for this run's.
+            shutil.rmtree(resultsDir, ignore_errors = True)
+            os.mkdir(resultsDir)
+            
+            speciesFile, layers, toggles = self.getTrialInputs(trial)
+            
+            if self.lookUpResults(trial, 
+                                  speciesFile, 
+                                  layers, 
+                                  toggles, 
+                                  resultsDir):
+                
+                cached   = True
+                exitCode = 0
+                
+            elif self.workerPool:
+                
+                args = \
+                    MaxEntHelper.getMaxEntArgs(speciesFile,
+                                               layers,
+                                               resultsDir,
+                                               toggles,
+                                               None,
+                                               MaxEntHelper.SCREENING_PROFILE,
+                                               self.biasGrid)
+                                                  
+                exitCode = self.workerPool.run(args, 
+                                               self.timeoutSeconds, 
+                                               onStart)
+                heapMB   = self.workerPool.heapMB
+                
+            else:
+                
+                runFunction = lambda heapMB: \
+                    MaxEntHelper.runMaxEnt(speciesFile,
+                                           layers,
+                                           resultsDir,
+                                           self.logger,
+                                           toggles,
+                                           None,
+                                           MaxEntHelper.SCREENING_PROFILE,
+                                           heapMB,
+                                           self.timeoutSeconds,
+                                           onStart,
+                                           self.biasGrid)
+            
+                heapMB           = self.estimateTrialHeap(trial)
+                exitCode, heapMB = self.scheduler.run(runFunction, heapMB)
+                
+            outcome = MaxEntHelper.classifyOutcome(exitCode, resultsDir)
+                                              
+        except RuntimeError as e:
+            
+            # MaxEnt's inputs are checked before it runs.
+            outcome = MaxEntHelper.BAD_INPUT
+            
+            if self.logger:
+                self.logger.error(trialDir + ' has bad input: ' + str(e))
+            
+        finally:
+            
+            # Cached results say nothing about the time to run a trial.
+            self.finishTrial(trial, 
+                             outcome, 
+                             exitCode, 
+                             heapMB, 
+                             None if cached else time.time() - startTime)
+            
+        return outcome
+            
+    #---------------------------------------------------------------------------
+    # runQueue
+    #
+    # This claims and runs trials until the queue is drained, and returns their
+    # outcomes.  While other workers' trials run, it copies stragglers, and
+    # waits to claim trials whose leases expire.
+    #---------------------------------------------------------------------------
+    def runQueue(self, workerNum):
+        
+        first, last = self.trialRange or (None, None)
+        outcomes    = []
+        
+        while True:
+            
+            trial = self.store.claimNextTrial(self.leaseSeconds, first, last)
+            
+            if trial:
+                
+                outcomes.append(self.runClaimedTrial(trial))
+                
+            elif self.isQueueDrained():
+                
+                break
+                
+            else:
+                
+                trial = self.claimStraggler()
+                
+                if trial:
+                    outcomes.append(self.runClaimedTrial(trial))
+                    
+                else:
+                    time.sleep(min(self.leaseSeconds / 3.0, 30))
+                
+        return outcomes
+        
+    #---------------------------------------------------------------------------
+    # runTrial
+    #
+    # Returns the trial's last outcome, or None when the trial was not
+    # pending.  A trial to be retried is pending again, so it is claimed again.
+    #---------------------------------------------------------------------------
+    def runTrial(self, trial):
+        
+        outcome      = None
+        claimedTrial = self.store.claimTrial(trial['id'], self.leaseSeconds)
+        
+        while claimedTrial:
+            
+            outcome      = self.runClaimedTrial(claimedTrial)
+            claimedTrial = self.store.claimTrial(trial['id'], 
+                                                 self.leaseSeconds)
+            
+        return outcome
+            
+    #---------------------------------------------------------------------------
+    # startRenewer
+    #
+    # This starts the thread renewing held leases, and returns the event that
+    # stops it and the thread.
+    #---------------------------------------------------------------------------
+    def startRenewer(self):
+        
+        stopEvent = threading.Event()
+        renewer   = threading.Thread(target = self.renewLeases, 
+                                     args = (stopEvent,))
+                                     
+        renewer.daemon = True
+        renewer.start()
+        
+        return stopEvent, renewer
+        
+    #---------------------------------------------------------------------------
+    # stopCopies
+    #
+    # This stops this process's other copies of a trial.
+    #---------------------------------------------------------------------------
+    def stopCopies(self, trial):
+        
+        with self.heldLock:
+            
+            processes = [self.heldProcesses.get(token)
+                         for token, held in self.heldTrials.items()
+                         if held['id'] == trial['id']]
+                         
+        for process in processes:
+            
+            if process:
+                MaxEntHelper.stopProcess(process, threading.Event())
+                
+    #---------------------------------------------------------------------------
+    # trackProcess
+    #
+    # This keeps the process running a held trial, so it can be stopped.
+    #---------------------------------------------------------------------------
+    def trackProcess(self, trial, process):
+        
+        with self.heldLock:
+            
+            if trial['token'] in self.heldTrials:
+                self.heldProcesses[trial['token']] = process
+                
+    #---------------------------------------------------------------------------
+    # updateCostModel
+    #
+    # This fits the cost model to the run times recorded so far, when there
+    # are enough, and sets the trials' expected times from it.
+    #---------------------------------------------------------------------------
+    def updateCostModel(self):
+        
+        with self.costLock:
+            
+            self.costModel.fit(self.store.getRuntimes())
+            
+            if not self.costModel.isFitted():
+                return
+                
+            self.expected = dict([(t['id'], 
+                                   self.costModel.predict(t['predictors']))
+                                  for t in self.trials if t['predictors']])
+                                  
+            self.store.setExpectedSeconds(self.expected)
             
 #-------------------------------------------------------------------------------
 # main
@@ -137,6 +971,56 @@ def main():
     parser.add_argument('--range',
                         help = 'Range of trial numbers to run, like "--range 1-10".  Defaults all trials.')
     
+    parser.add_argument('--workers',
+                        action = 'store_true',
+                        help = 'Run the trials in persistent MaxEnt JVMs, ' + \
+                               'instead of a JVM for each trial.')
+    
+    parser.add_argument('--queue',
+                        action = 'store_true',
+                        help = 'Claim trials from the run\'s shared queue ' + \
+                               'until it drains.  Start any number of ' + \
+                               'these, on any nodes sharing the run ' + \
+                               'directory.')
+    
+    parser.add_argument('--lease',
+                        type = float,
+                        default = TrialStore.DEFAULT_LEASE,
+                        help = 'seconds after which a dead worker\'s ' + \
+                               'trial is claimed again')
+    
+    parser.add_argument('--attempts',
+                        type = int,
+                        default = RunTrials.MAX_ATTEMPTS,
+                        help = 'most runs of a trial that times out or ' + \
+                               'fails for unknown reasons')
+    
+    parser.add_argument('--timeout',
+                        type = float,
+                        help = 'seconds after which a trial is stopped; ' + \
+                               'defaults to none')
+    
+    parser.add_argument('--speculation',
+                        type = float,
+                        default = RunTrials.SPECULATION_FACTOR,
+                        help = 'in queue mode, copy trials running this ' + \
+                               'many times the median trial\'s time; 0 ' + \
+                               'for none')
+    
+    parser.add_argument('--cache',
+                        help = 'directory of a result cache shared by ' + \
+                               'runs; trials found in it are not run')
+    
+    parser.add_argument('--cacheMB',
+                        type = int,
+                        default = ResultCache.DEFAULT_MB,
+                        help = 'evict the least recently used results ' + \
+                               'beyond this size')
+    
+    parser.add_argument('--cacheDays',
+                        type = float,
+                        help = 'evict results not used in this many days')
+    
     parser.add_argument('--reset',
                         action = 'store_true', 
                         help = 'Reset trials to be run again.  ' + \
@@ -144,27 +1028,39 @@ def main():
     
     args = parser.parse_args()
     
-    # Reset the trials directories, if requested.
+    # Reset the trials, if requested.
     if args.reset:
         
         config = MmxConfig()
         config.initializeFromFile(args.c)
-        allTrialDirs = glob.glob(os.path.join(config.outDir, 'TRIALS/trial-*'))
-
-        for trialDir in allTrialDirs:
-
-            try:
-                shutil.rmtree(os.path.join(trialDir, 'results'))
+        trialsDir = os.path.join(config.outDir, 'TRIALS')
+        store     = TrialStore(trialsDir)
+        
+        for trial in store.getTrials():
 
-            except OSError:
-                pass
+            for resultsName in [TrialStore.RESULTS_NAME, 
+                                TrialStore.SPECULATIVE_RESULTS_NAME]:
+                                
+                shutil.rmtree(os.path.join(trialsDir, 
+                                           trial['name'], 
+                                           resultsName),
+                              ignore_errors = True)
 
-            os.system('touch ' + \
-                      os.path.join(trialDir, MmxApplication.PENDING_FILE))
+        store.resetTrials()
 
     else:
 
-        runTrials = RunTrials(args.c, args.range)
+        runTrials = RunTrials(args.c, 
+                              args.range, 
+                              args.workers, 
+                              args.queue,
+                              args.lease,
+                              args.attempts,
+                              args.timeout,
+                              args.speculation,
+                              args.cache,
+                              args.cacheMB,
+                              args.cacheDays)
         runTrials.run()
     
 #-------------------------------------------------------------------------------
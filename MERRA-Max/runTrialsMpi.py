@@ -0,0 +1,540 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import shutil
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from mpi4py import MPI
+
+from MaxEntHelper import MaxEntHelper
+from MemoryScheduler import MemoryScheduler
+from MmxConfig import MmxConfig
+from ResultCache import ResultCache
+from TrialStore import TrialStore
+from runTrials import RunTrials
+from selector import Selector
+
+#-------------------------------------------------------------------------------
+# class RunTrialsMpi
+#
+# This runs the trials as one MPI job.  Rank 0 claims the trials and hands
+# them, one at a time, to whichever worker rank is idle, so fast and slow
+# trials balance across the job.  Worker ranks run MaxEnt and return its exit
+# code and run time, and rank 0 records them in the trial store.  The run
+# directory must be on a file system every rank shares.
+#
+# This needs mpi4py, which the rest of MERRA-Max does not.
+#-------------------------------------------------------------------------------
+class RunTrialsMpi(RunTrials):
+
+    # Message tags
+    TASK_TAG   = 1
+    RESULT_TAG = 2
+    STOP_TAG   = 3
+    CANCEL_TAG = 4
+
+    # Seconds between checks for stragglers, while ranks are idle
+    POLL_SECONDS = 1.0
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, configFile, comm = MPI.COMM_WORLD, trialsToRun = None,
+                 leaseSeconds = TrialStore.DEFAULT_LEASE,
+                 maxAttempts = RunTrials.MAX_ATTEMPTS, timeoutSeconds = None,
+                 speculation = RunTrials.SPECULATION_FACTOR, cacheDir = None,
+                 cacheMB = ResultCache.DEFAULT_MB, cacheDays = None,
+                 logger = None):
+
+        super(RunTrialsMpi, self).__init__(configFile,
+                                           trialsToRun,
+                                           False,
+                                           False,
+                                           leaseSeconds,
+                                           maxAttempts,
+                                           timeoutSeconds,
+                                           speculation,
+                                           cacheDir,
+                                           cacheMB,
+                                           cacheDays,
+                                           logger)
+
+        # The trial each busy worker rank is running
+        self.comm      = comm
+        self.busyRanks = {}
+
+        if self.comm.Get_size() < 2:
+
+            raise RuntimeError('Running trials with MPI needs at least two ' + \
+                               'ranks, like "mpirun -n 4".')
+
+    #---------------------------------------------------------------------------
+    # dispatchTrial
+    #
+    # This sends a claimed trial, or a copy of one, to a worker rank.  A trial
+    # whose inputs are bad, or whose results are cached, is finished without
+    # one, and its outcome returned.  Otherwise, this returns None.
+    #---------------------------------------------------------------------------
+    def dispatchTrial(self, trial, rank):
+
+        self.holdTrial(trial)
+
+        # MaxEnt's inputs are checked before it runs.
+        try:
+            task = self.getTask(trial)
+
+            if self.lookUpResults(trial,
+                                  task['speciesFile'],
+                                  task['layers'],
+                                  task['toggles'],
+                                  task['resultsDir']):
+
+                outcome = MaxEntHelper.classifyOutcome(0, task['resultsDir'])
+                self.finishTrial(trial, outcome, 0, None)
+                return outcome
+
+        except RuntimeError as e:
+
+            if self.logger:
+
+                self.logger.error(self.getTrialDir(trial) + \
+                                  ' has bad input: ' + str(e))
+
+            self.finishTrial(trial, MaxEntHelper.BAD_INPUT, None, None)
+            return MaxEntHelper.BAD_INPUT
+
+        self.comm.send(task, dest = rank, tag = RunTrialsMpi.TASK_TAG)
+        self.busyRanks[rank] = trial
+
+        if self.logger:
+
+            self.logger.info('Running ' + self.getResultsDir(trial) + \
+                             ' on rank ' + str(rank))
+
+        return None
+
+    #---------------------------------------------------------------------------
+    # getNumWorkers
+    #---------------------------------------------------------------------------
+    def getNumWorkers(self):
+        return max(self.comm.Get_size() - 1, 1)
+
+    #---------------------------------------------------------------------------
+    # getRankBudget
+    #
+    # This divides a node's memory budget among the worker ranks on the node.
+    # Every rank must call it.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getRankBudget(comm, budgetMB = None):
+
+        if not budgetMB:
+
+            budgetMB = int(MemoryScheduler.getPhysicalMemory() * \
+                           MemoryScheduler.RAM_FRACTION)
+
+        nodeComm   = comm.Split_type(MPI.COMM_TYPE_SHARED)
+        numWorkers = nodeComm.allreduce(1 if comm.Get_rank() else 0)
+        nodeComm.Free()
+
+        return max(budgetMB // max(numWorkers, 1), MmxConfig.MINIMUM_MEMORY)
+
+    #---------------------------------------------------------------------------
+    # getTask
+    #
+    # This returns what a worker rank needs to run a trial.
+    #---------------------------------------------------------------------------
+    def getTask(self, trial):
+
+        resultsDir = self.getResultsDir(trial)
+
+        # Results left by an earlier attempt, or earlier predictors, would
+        # pass for this run's.
+        shutil.rmtree(resultsDir, ignore_errors = True)
+        os.mkdir(resultsDir)
+
+        speciesFile, layers, toggles = self.getTrialInputs(trial)
+
+        return {'id': trial['id'],
+                'token': trial['token'],
+                'speciesFile': speciesFile,
+                'layers': layers,
+                'resultsDir': resultsDir,
+                'toggles': toggles,
+                'biasFile': self.biasGrid,
+                'heapMB': self.estimateTrialHeap(trial),
+                'timeoutSeconds': self.timeoutSeconds}
+
+    #---------------------------------------------------------------------------
+    # run
+    #
+    # This dispatches the trials to the worker ranks, then stops them.  Trials
+    # to be retried are dispatched again.  Once every trial has been
+    # dispatched, idle ranks run copies of stragglers.  It returns the outcome
+    # of each run, with None for trials that were not pending.
+    #---------------------------------------------------------------------------
+    def run(self):
+
+        idleRanks = range(1, self.comm.Get_size())
+
+        if self.logger:
+
+            self.logger.info('Running ' + str(len(self.trials)) + \
+                             ' trials on ' + str(len(idleRanks)) + \
+                             ' MPI worker ranks.')
+
+        self.logEstimate()
+
+        stopEvent, renewer = self.startRenewer()
+        toRun              = self.getTrialOrder()
+        outcomes           = []
+        trialSeconds       = []
+        startTime          = time.time()
+        self.busyRanks     = {}
+
+        try:
+            while toRun or self.busyRanks:
+
+                while toRun and idleRanks:
+
+                    trial = self.store.claimTrial(toRun.pop(0)['id'],
+                                                  self.leaseSeconds)
+
+                    if not trial:
+
+                        outcomes.append(None)
+                        continue
+
+                    outcome = self.dispatchTrial(trial, idleRanks[-1])
+
+                    if outcome:
+                        outcomes.append(outcome)
+
+                    else:
+                        idleRanks.pop()
+
+                if not self.busyRanks:
+                    break
+
+                # Idle ranks at the end copy stragglers, as they appear.
+                while idleRanks and not toRun and \
+                      not self.comm.Iprobe(source = MPI.ANY_SOURCE,
+                                           tag = RunTrialsMpi.RESULT_TAG):
+
+                    trial = self.claimStraggler()
+
+                    if not trial:
+                        time.sleep(RunTrialsMpi.POLL_SECONDS)
+
+                    elif self.dispatchTrial(trial, idleRanks[-1]) == None:
+                        idleRanks.pop()
+
+                status = MPI.Status()
+
+                result = self.comm.recv(source = MPI.ANY_SOURCE,
+                                        tag = RunTrialsMpi.RESULT_TAG,
+                                        status = status)
+
+                rank  = status.Get_source()
+                trial = self.busyRanks.pop(rank)
+                idleRanks.append(rank)
+
+                if result['error'] and self.logger:
+
+                    self.logger.error(trial['name'] + ' raised an error ' + \
+                                      'on rank ' + str(rank) + ': ' + \
+                                      result['error'])
+
+                if self.logger:
+
+                    self.logger.info(self.getResultsDir(trial) + \
+                                     ' finished on rank ' + str(rank) + \
+                                     ' (' + result['host'] + ') in ' + \
+                                     '%.1f' % result['seconds'] + \
+                                     ' seconds: ' + result['outcome'])
+
+                if self.finishTrial(trial,
+                                    result['outcome'],
+                                    result['exitCode'],
+                                    result['heapMB'],
+                                    result['seconds']):
+
+                    toRun.append(trial)
+
+                outcomes.append(result['outcome'])
+                trialSeconds.append(result['seconds'])
+
+        finally:
+
+            # A stop waits behind a task already sent, so workers finish it.
+            for rank in range(1, self.comm.Get_size()):
+                self.comm.send(None, dest = rank, tag = RunTrialsMpi.STOP_TAG)
+
+            stopEvent.set()
+            renewer.join()
+
+        self.logOutcomes()
+        self.logCacheHits()
+
+        if self.numRuntimes:
+            self.updateCostModel()
+
+        if self.resultCache:
+            self.resultCache.evict()
+
+        if self.logger:
+
+            self.logger.info('Ran the trials in ' + \
+                             '%.1f' % (time.time() - startTime) + ' seconds.')
+
+            if trialSeconds:
+
+                self.logger.info('Trials took ' + \
+                                 '%.1f' % (sum(trialSeconds) / \
+                                           len(trialSeconds)) + \
+                                 ' seconds on average, and at most ' + \
+                                 '%.1f' % max(trialSeconds) + ' seconds.')
+
+        return outcomes
+
+    #---------------------------------------------------------------------------
+    # runTask
+    #
+    # This runs a trial's MaxEnt on a worker rank and returns its outcome.
+    # onStart is called with the MaxEnt process.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def runTask(task, scheduler, onStart = None):
+
+        result = {'id': task['id'],
+                  'outcome': MaxEntHelper.UNKNOWN,
+                  'exitCode': None,
+                  'heapMB': None,
+                  'host': socket.gethostname(),
+                  'error': None}
+
+        runFunction = lambda heapMB: \
+            MaxEntHelper.runMaxEnt(task['speciesFile'],
+                                   task['layers'],
+                                   task['resultsDir'],
+                                   None,
+                                   task['toggles'],
+                                   None,
+                                   MaxEntHelper.SCREENING_PROFILE,
+                                   heapMB,
+                                   task['timeoutSeconds'],
+                                   onStart,
+                                   task['biasFile'])
+
+        startTime = time.time()
+
+        try:
+            result['exitCode'], result['heapMB'] = \
+                scheduler.run(runFunction, task['heapMB'])
+
+            result['outcome'] = \
+                MaxEntHelper.classifyOutcome(result['exitCode'],
+                                             task['resultsDir'])
+
+        except RuntimeError as e:
+
+            # MaxEnt's inputs are checked before it runs.
+            result['outcome'] = MaxEntHelper.BAD_INPUT
+            result['error']   = str(e)
+
+        except Exception as e:
+            result['error'] = str(e)
+
+        result['seconds'] = time.time() - startTime
+
+        return result
+
+    #---------------------------------------------------------------------------
+    # serve
+    #
+    # Worker ranks run tasks from rank 0 until it stops them.  A task runs in
+    # a thread, so the rank can stop its MaxEnt when rank 0 cancels it, as
+    # when another copy of its trial finished first.  Only this thread uses
+    # MPI.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def serve(comm, budgetMB):
+
+        scheduler = MemoryScheduler(budgetMB)
+        status    = MPI.Status()
+
+        while True:
+
+            task = comm.recv(source = 0, tag = MPI.ANY_TAG, status = status)
+
+            if status.Get_tag() == RunTrialsMpi.STOP_TAG:
+                break
+
+            # A cancellation for a task that already finished is ignored.
+            if status.Get_tag() == RunTrialsMpi.CANCEL_TAG:
+                continue
+
+            results   = []
+            processes = []
+            cancelled = threading.Event()
+
+            def onStart(process):
+
+                processes.append(process)
+
+                if cancelled.is_set():
+                    MaxEntHelper.stopProcess(process, threading.Event())
+
+            runner = threading.Thread(target = lambda: results.append(
+                RunTrialsMpi.runTask(task, scheduler, onStart)))
+
+            runner.start()
+
+            while runner.is_alive():
+
+                if comm.Iprobe(source = 0, tag = RunTrialsMpi.CANCEL_TAG):
+
+                    token = comm.recv(source = 0,
+                                      tag = RunTrialsMpi.CANCEL_TAG)
+
+                    if token == task['token']:
+
+                        cancelled.set()
+
+                        for process in processes:
+                            MaxEntHelper.stopProcess(process, threading.Event())
+
+                runner.join(RunTrialsMpi.POLL_SECONDS)
+
+            comm.send(results[0], dest = 0, tag = RunTrialsMpi.RESULT_TAG)
+
+    #---------------------------------------------------------------------------
+    # stopCopies
+    #
+    # This cancels the other copies of a trial, on the ranks running them.
+    #---------------------------------------------------------------------------
+    def stopCopies(self, trial):
+
+        for rank, busyTrial in self.busyRanks.items():
+
+            if busyTrial['id'] == trial['id']:
+
+                self.comm.send(busyTrial['token'],
+                               dest = rank,
+                               tag = RunTrialsMpi.CANCEL_TAG)
+
+#-------------------------------------------------------------------------------
+# main
+#
+# 5.  mpirun -n 4 ./runTrialsMpi.py -c ~/Desktop/SystemTesting/Mmx/config.mmx
+#
+# This replaces steps 5 and 6, runTrials and selector.  Selection starts as
+# soon as the last trial finishes, unless trials remain to be run.
+#-------------------------------------------------------------------------------
+def main():
+
+    # Process command-line args.
+    desc = 'This application runs the trials for a MERRA/Max run as an ' + \
+           'MPI job, then selects the top ten predictors.'
+
+    parser = argparse.ArgumentParser(description = desc)
+
+    parser.add_argument('-c',
+                        required = True,
+                        help = 'Path to MERRA-Max configuration file')
+
+    parser.add_argument('--range',
+                        help = 'Range of trial numbers to run, like ' + \
+                               '"--range 1-10".  Defaults all trials.')
+
+    parser.add_argument('--lease',
+                        type = float,
+                        default = TrialStore.DEFAULT_LEASE,
+                        help = 'seconds after which a dead job\'s trial ' + \
+                               'is claimed again')
+
+    parser.add_argument('--speculation',
+                        type = float,
+                        default = RunTrials.SPECULATION_FACTOR,
+                        help = 'copy trials running this many times the ' + \
+                               'median trial\'s time to idle ranks; 0 for ' + \
+                               'none')
+
+    parser.add_argument('--attempts',
+                        type = int,
+                        default = RunTrials.MAX_ATTEMPTS,
+                        help = 'most runs of a trial that times out or ' + \
+                               'fails for unknown reasons')
+
+    parser.add_argument('--timeout',
+                        type = float,
+                        help = 'seconds after which a trial is stopped; ' + \
+                               'defaults to none')
+
+    parser.add_argument('--cache',
+                        help = 'directory of a result cache shared by ' + \
+                               'runs; trials found in it are not run')
+
+    parser.add_argument('--cacheMB',
+                        type = int,
+                        default = ResultCache.DEFAULT_MB,
+                        help = 'evict the least recently used results ' + \
+                               'beyond this size')
+
+    parser.add_argument('--cacheDays',
+                        type = float,
+                        help = 'evict results not used in this many days')
+
+    args = parser.parse_args()
+    comm = MPI.COMM_WORLD
+
+    config = MmxConfig()
+    config.initializeFromFile(args.c)
+    budgetMB = RunTrialsMpi.getRankBudget(comm, config.memoryBudget)
+
+    if comm.Get_rank() != 0:
+
+        RunTrialsMpi.serve(comm, budgetMB)
+        return
+
+    try:
+        runTrials = RunTrialsMpi(args.c,
+                                 comm,
+                                 args.range,
+                                 args.lease,
+                                 args.attempts,
+                                 args.timeout,
+                                 args.speculation,
+                                 args.cache,
+                                 args.cacheMB,
+                                 args.cacheDays)
+
+    except Exception:
+
+        # Without rank 0, the workers would wait forever.
+        traceback.print_exc()
+        comm.Abort(1)
+
+    runTrials.run()
+
+    store     = TrialStore(runTrials.trialsDir)
+    remaining = store.getTrials([TrialStore.PENDING, TrialStore.RUNNING])
+
+    if remaining:
+
+        runTrials.logger.info(str(len(remaining)) + ' trials remain to ' + \
+                              'be run, so predictors were not selected.')
+
+    else:
+        Selector(args.c, runTrials.logger).run()
+
+#-------------------------------------------------------------------------------
+# Invoke the main
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+        sys.exit(main())
@@ -2,12 +2,12 @@
 
 import argparse
 import csv
-import glob
 import os
 import sys
 
 from MmxApplication import MmxApplication
 from MmxConfig import MmxConfig
+from TrialStore import TrialStore
 
 #-------------------------------------------------------------------------------
 # class Selector
@@ -27,21 +27,44 @@ class Selector(MmxApplication):
     
     #---------------------------------------------------------------------------
     # compileContributions
+    #
+    # This compiles the contributions from the given trials, or from all.
     #---------------------------------------------------------------------------
-    def compileContributions(self):
+    def compileContributions(self, trialNums = None):
         
         #---
         # Loop through the trials creating a dictionary like:
         # {predictor: [contribution, contribution, ...],
         #  predictor: [contribution, contribution, ...]} 
         #---
+        store = TrialStore(self.trialsDir)
         contributions = {}
-        allTrialDirs  = glob.glob(os.path.join(self.trialsDir, 'trial-*'))
+        allTrials     = [t for t in store.getTrials() 
+                         if trialNums == None or t['id'] in trialNums]
         CONTRIB_KWD   = 'permutation'
+        numUsed       = 0
+        unused        = {}
         
-        for trialDir in allTrialDirs:
+        for trial in allTrials:
+            
+            # A trial's results may be from a speculative copy of it.
+            resultsName = trial['resultsName'] or TrialStore.RESULTS_NAME
+            
+            resultsFile = os.path.join(self.trialsDir, 
+                                       trial['name'], 
+                                       resultsName,
+                                       'maxentResults.csv')
+                                       
+            # Only successful trials are used.
+            if trial['state'] != TrialStore.COMPLETE or \
+               not os.path.exists(resultsFile):
+                
+                reason         = trial['outcome'] or trial['state']
+                unused[reason] = unused.get(reason, 0) + 1
+                continue
+                
+            numUsed += 1
             
-            resultsFile = os.path.join(trialDir, 'results/maxentResults.csv')
             results     = csv.reader(open(resultsFile))
             header      = results.next()
 
@@ -60,6 +83,21 @@ class Selector(MmxApplication):
 
                         contributions[newKey].append(float(rowDict[key]))
 
+        if self.logger:
+            
+            self.logger.info('Selecting from ' + str(numUsed) + ' of ' + \
+                             str(len(allTrials)) + ' trials.')
+                             
+            if unused:
+                
+                self.logger.info('Trials not used: ' + \
+                                 ', '.join([str(n) + ' ' + reason 
+                                            for reason, n in 
+                                            sorted(unused.items())]))
+
+        if numUsed == 0:
+            raise RuntimeError('No trials succeeded in ' + self.trialsDir)
+            
         return contributions
         
     #---------------------------------------------------------------------------
@@ -69,11 +107,13 @@ class Selector(MmxApplication):
         return 'SELECTOR'
 
     #---------------------------------------------------------------------------
-    # run
+    # rankPredictors
+    #
+    # This returns every predictor with its average contribution, highest
+    # first.
     #---------------------------------------------------------------------------
-    def run(self):
-        
-        contributions = self.compileContributions()
+    @staticmethod
+    def rankPredictors(contributions):
         
         averages = {}
         
@@ -82,11 +122,23 @@ class Selector(MmxApplication):
             samples = contributions[key]
             averages[key] = float(sum(samples) / max(len(samples), 1))
             
-        sortedAvgs = sorted(averages.items(), 
-                            key = lambda x:x[1], 
-                            reverse = True)[:10]
-                            
-        self.config.topTen = [k for k, v in sortedAvgs]
+        return sorted(averages.items(), key = lambda x:x[1], reverse = True)
+        
+    #---------------------------------------------------------------------------
+    # run
+    #---------------------------------------------------------------------------
+    def run(self):
+        
+        contributions = self.compileContributions()
+        self.setTopTen(Selector.rankPredictors(contributions)[:10])
+        
+    #---------------------------------------------------------------------------
+    # setTopTen
+    #
+    # This writes the ranked predictors, with their average contributions, to
+    # the configuration as its top ten.
+    #---------------------------------------------------------------------------
+    def setTopTen(self, sortedAvgs):
         
         topTen = []
         
@@ -94,8 +146,8 @@ class Selector(MmxApplication):
             
             pred = os.path.join(self.config.inDir,
                                 'FINISHED',
-                                'asc',
-                                k + '.asc')
+                                self.config.layerFormat,
+                                k + '.' + self.config.layerFormat)
                                 
             topTen.append(pred)
             
@@ -0,0 +1,185 @@
+import csv
+import os
+import stat
+import subprocess
+import sys
+
+#-------------------------------------------------------------------------------
+# The tests run the applications from the MERRA-Max directory.
+#-------------------------------------------------------------------------------
+MMX_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if MMX_DIR not in sys.path:
+    sys.path.insert(0, MMX_DIR)
+
+#-------------------------------------------------------------------------------
+# This stands in for java.  It runs a "MaxEnt" that writes a contribution for
+# each layer it is given, and records each run's output directory in the
+# claims file.  In the directories of empty trials, it exits without writing
+# results.
+#-------------------------------------------------------------------------------
+STUB_JAVA = '''#!%(python)s
+import os
+import sys
+import time
+
+args    = sys.argv[1:]
+outDir  = args[args.index('-o') + 1]
+swdFile = args[args.index('-e') + 1]
+toggles = [args[i + 1] for i, arg in enumerate(args) if arg == '-N']
+
+with open(%(claimsFile)r, 'a') as f:
+    f.write(outDir + '\\n')
+
+time.sleep(%(seconds)r)
+
+if os.path.basename(os.path.dirname(outDir)) in %(emptyTrials)r:
+    sys.exit(0)
+
+with open(swdFile) as f:
+    names = f.readline().strip().split(',')[3:]
+
+# -N toggles every layer whose name begins with its argument.
+enabled = [n for n in names
+           if sum(1 for t in toggles if n.startswith(t)) %% 2 == 0]
+
+with open(os.path.join(outDir, 'maxentResults.csv'), 'w') as f:
+
+    f.write(','.join(['Species'] + [n + ' permutation importance'
+                                    for n in enabled]) + '\\n')
+
+    f.write(','.join(['species'] + [n[1:] for n in enabled]) + '\\n')
+'''
+
+#-------------------------------------------------------------------------------
+# class StubRun
+#
+# This is a samples-with-data run of numTrials trials, each of ten of
+# numLayers layers, with java replaced by STUB_JAVA, so trials run without
+# MaxEnt or real predictors.  Layers are named L1 to L<numLayers>.  The trials
+# numbered in emptyTrials write no results.
+#-------------------------------------------------------------------------------
+class StubRun(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, rootDir, numTrials = 12, numLayers = 20,
+                 stubSeconds = 0.2, emptyTrials = None):
+
+        from MmxConfig import MmxConfig
+        from TrialStore import TrialStore
+
+        self.rootDir    = rootDir
+        self.inDir      = os.path.join(rootDir, 'in')
+        self.outDir     = os.path.join(rootDir, 'out')
+        self.binDir     = os.path.join(rootDir, 'bin')
+        self.trialsDir  = os.path.join(self.outDir, 'TRIALS')
+        self.claimsFile = os.path.join(rootDir, 'claims.txt')
+        self.numTrials  = numTrials
+        self.layers     = ['L' + str(i + 1) for i in range(numLayers)]
+
+        for d in [self.inDir, self.outDir, self.binDir, self.trialsDir,
+                  os.path.join(self.outDir, 'SWD')]:
+
+            os.makedirs(d)
+
+        # Presence points
+        presFile = os.path.join(self.inDir, 'presence.csv')
+
+        with open(presFile, 'w') as f:
+            f.write('x,y,response,epsg\n1.5,2.5,1,4326\n2.5,1.5,1,4326\n')
+
+        config = MmxConfig()
+
+        config.initializeFromValues(presFile, '01-01-2016', '02-01-2016',
+                                    'species', self.inDir, self.outDir, 2,
+                                    numTrials)
+
+        config.setTrialMode('swd')
+        config.write()
+
+        self.configFile = config.configFile
+
+        # The tables samples-with-data trials share
+        for name, label in [('presence.csv',   'species'),
+                            ('background.csv', 'background')]:
+
+            with open(os.path.join(self.outDir, 'SWD', name), 'w') as f:
+
+                writer = csv.writer(f)
+                writer.writerow([label, 'x', 'y'] + self.layers)
+
+                for i in range(5):
+                    writer.writerow([label, i, i] + range(len(self.layers)))
+
+        # Trials of ten layers each
+        store = TrialStore(self.trialsDir)
+
+        for trialNum in range(numTrials):
+
+            predictors = [self.layers[(trialNum + i) % numLayers] + '.tif'
+                          for i in range(10)]
+
+            os.mkdir(os.path.join(self.trialsDir,
+                                  TrialStore.getTrialName(trialNum)))
+
+            store.addTrial(trialNum, predictors)
+
+        # Java
+        javaFile = os.path.join(self.binDir, 'java')
+
+        with open(javaFile, 'w') as f:
+
+            f.write(STUB_JAVA % {'python':      sys.executable,
+                                 'claimsFile':  self.claimsFile,
+                                 'seconds':     stubSeconds,
+                                 'emptyTrials': [TrialStore.getTrialName(n)
+                                                 for n in emptyTrials or []]})
+
+        os.chmod(javaFile, os.stat(javaFile).st_mode | stat.S_IEXEC)
+
+    #---------------------------------------------------------------------------
+    # getClaims
+    #
+    # This returns the output directory of each stub MaxEnt run.
+    #---------------------------------------------------------------------------
+    def getClaims(self):
+
+        if not os.path.exists(self.claimsFile):
+            return []
+
+        with open(self.claimsFile) as f:
+            return [line.strip() for line in f if line.strip()]
+
+    #---------------------------------------------------------------------------
+    # getDeadPid
+    #
+    # This returns the ID of a process that has ended.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getDeadPid():
+
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+
+        return process.pid
+
+    #---------------------------------------------------------------------------
+    # getEnvironment
+    #
+    # This returns the environment in which applications find the stub java.
+    #---------------------------------------------------------------------------
+    def getEnvironment(self):
+
+        env         = dict(os.environ)
+        env['PATH'] = self.binDir + os.pathsep + env.get('PATH', '')
+
+        return env
+
+    #---------------------------------------------------------------------------
+    # getScript
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getScript(name):
+        return os.path.join(MMX_DIR, name)
@@ -0,0 +1,238 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from StubRun import StubRun
+
+try:
+    import osgeo
+    HAVE_GDAL = True
+
+except ImportError:
+    HAVE_GDAL = False
+
+#-------------------------------------------------------------------------------
+# class TestTrialQueue
+#
+# These run several runTrials.py --queue processes against one trial store,
+# as on nodes sharing a run directory.
+#
+# cd MERRA-Max/tests; python -m unittest discover
+#-------------------------------------------------------------------------------
+@unittest.skipUnless(HAVE_GDAL, 'MERRA-Max requires GDAL')
+class TestTrialQueue(unittest.TestCase):
+
+    NUM_PROCESSES = 3
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.rootDir = tempfile.mkdtemp()
+        self.run     = StubRun(self.rootDir)
+
+    #---------------------------------------------------------------------------
+    # tearDown
+    #---------------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.rootDir, ignore_errors = True)
+
+    #---------------------------------------------------------------------------
+    # startQueue
+    #
+    # Short leases keep idle processes from waiting long for others' trials.
+    #---------------------------------------------------------------------------
+    def startQueue(self, attempts = 3):
+
+        return subprocess.Popen([sys.executable,
+                                 StubRun.getScript('runTrials.py'),
+                                 '-c', self.run.configFile,
+                                 '--queue',
+                                 '--lease', '3',
+                                 '--speculation', '0',
+                                 '--attempts', str(attempts)],
+                                env = self.run.getEnvironment())
+
+    #---------------------------------------------------------------------------
+    # testEachTrialClaimedOnce
+    #---------------------------------------------------------------------------
+    def testEachTrialClaimedOnce(self):
+
+        from TrialStore import TrialStore
+
+        processes = [self.startQueue()
+                     for i in range(TestTrialQueue.NUM_PROCESSES)]
+
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+
+        trials = TrialStore(self.run.trialsDir).getTrials()
+
+        self.assertEqual(len(trials), self.run.numTrials)
+
+        for trial in trials:
+
+            self.assertEqual(trial['state'], TrialStore.COMPLETE)
+            self.assertEqual(trial['attempts'], 1)
+
+        # MaxEnt ran once in each trial's directory.
+        claims = self.run.getClaims()
+
+        self.assertEqual(len(claims), self.run.numTrials)
+        self.assertEqual(len(set(claims)), self.run.numTrials)
+
+    #---------------------------------------------------------------------------
+    # testAbandonedTrialFails
+    #
+    # A trial whose holder keeps dying fails after its last attempt, instead
+    # of being claimed again.
+    #---------------------------------------------------------------------------
+    def testAbandonedTrialFails(self):
+
+        from MaxEntHelper import MaxEntHelper
+        from TrialStore import TrialStore
+
+        store     = TrialStore(self.run.trialsDir, maxAttempts = 1)
+        abandoned = store.claimNextTrial(leaseSeconds = 0.1)
+
+        time.sleep(0.2)
+
+        claimed = store.claimNextTrial()
+        trial   = store.getTrial(abandoned['id'])
+
+        self.assertNotEqual(claimed['id'], abandoned['id'])
+        self.assertEqual(trial['state'], TrialStore.FAILED)
+        self.assertEqual(trial['outcome'], MaxEntHelper.UNKNOWN)
+        self.assertEqual(trial['token'], None)
+
+    #---------------------------------------------------------------------------
+    # testDeadHolderRecovered
+    #
+    # A trial left running by a process that ended is pending again, or
+    # fails after its last attempt.
+    #---------------------------------------------------------------------------
+    def testDeadHolderRecovered(self):
+
+        from TrialStore import TrialStore
+
+        store = TrialStore(self.run.trialsDir, maxAttempts = 2)
+        first = store.claimTrial(0)
+        last  = store.claimTrial(1)
+
+        with store.connect() as conn:
+
+            conn.execute('UPDATE trials SET pid = ?, attempts = ?, '
+                         'specToken = ?, specLease = ? WHERE id = ?',
+                         (StubRun.getDeadPid(), 1, 'copy', time.time(), 0))
+
+            conn.execute('UPDATE trials SET pid = ?, attempts = ? '
+                         'WHERE id = ?',
+                         (StubRun.getDeadPid(), 2, 1))
+
+        self.assertEqual(store.recoverTrials(), 2)
+
+        first = store.getTrial(first['id'])
+        last  = store.getTrial(last['id'])
+
+        self.assertEqual(first['state'], TrialStore.PENDING)
+        self.assertEqual(first['specToken'], None)
+        self.assertEqual(first['specLease'], None)
+        self.assertEqual(last['state'], TrialStore.FAILED)
+
+    #---------------------------------------------------------------------------
+    # testExpiredLeaseReclaimed
+    #
+    # A trial claimed by a holder that stops renewing its lease, while its
+    # process still exists, is claimed again once the lease expires.
+    #---------------------------------------------------------------------------
+    def testExpiredLeaseReclaimed(self):
+
+        from TrialStore import TrialStore
+
+        store     = TrialStore(self.run.trialsDir)
+        abandoned = store.claimNextTrial(leaseSeconds = 0.5)
+
+        self.assertEqual(abandoned['state'], TrialStore.RUNNING)
+        time.sleep(1.0)
+
+        processes = [self.startQueue()
+                     for i in range(TestTrialQueue.NUM_PROCESSES)]
+
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+
+        trial = store.getTrial(abandoned['id'])
+
+        self.assertEqual(trial['state'], TrialStore.COMPLETE)
+        self.assertEqual(trial['attempts'], 2)
+        self.assertNotEqual(trial['pid'], os.getpid())
+
+        # The abandoned claim can no longer complete the trial.
+        self.assertEqual(store.completeTrial(abandoned, 'success', 0), None)
+
+        claims = self.run.getClaims()
+        self.assertEqual(len(set(claims)), self.run.numTrials)
+
+    #---------------------------------------------------------------------------
+    # testStaleResultsRemoved
+    #
+    # Results left in a trial's directory by an earlier run do not pass for
+    # those of a run that writes none.
+    #---------------------------------------------------------------------------
+    def testStaleResultsRemoved(self):
+
+        from TrialStore import TrialStore
+
+        shutil.rmtree(self.rootDir)
+        os.mkdir(self.rootDir)
+
+        self.run  = StubRun(self.rootDir, emptyTrials = [0])
+        staleFile = os.path.join(self.run.trialsDir,
+                                 TrialStore.getTrialName(0),
+                                 TrialStore.RESULTS_NAME,
+                                 'maxentResults.csv')
+
+        os.makedirs(os.path.dirname(staleFile))
+
+        with open(staleFile, 'w') as f:
+            f.write('Species,L1 permutation importance\nspecies,1\n')
+
+        self.assertEqual(self.startQueue(attempts = 1).wait(), 0)
+
+        store = TrialStore(self.run.trialsDir)
+
+        self.assertEqual(store.getTrial(0)['state'], TrialStore.FAILED)
+        self.assertFalse(os.path.exists(staleFile))
+
+        self.assertEqual(len(store.getTrials([TrialStore.COMPLETE])),
+                         self.run.numTrials - 1)
+
+    #---------------------------------------------------------------------------
+    # testGetTrialsByStateAndToken
+    #---------------------------------------------------------------------------
+    def testGetTrialsByStateAndToken(self):
+
+        from TrialStore import TrialStore
+
+        store = TrialStore(self.run.trialsDir)
+        trial = store.claimTrial(0)
+
+        self.assertEqual(
+            [t['id'] for t in store.getTrials([TrialStore.RUNNING],
+                                              trial['token'])],
+            [0])
+
+        self.assertEqual(store.getTrials([TrialStore.PENDING],
+                                         trial['token']),
+                         [])
+
+#-------------------------------------------------------------------------------
+# Invoke the tests
+#-------------------------------------------------------------------------------
+if __name__ == '__main__':
+    unittest.main()
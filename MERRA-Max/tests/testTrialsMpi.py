@@ -0,0 +1,133 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from StubRun import StubRun
+
+try:
+    import osgeo
+    import mpi4py
+    HAVE_MPI = True
+
+except ImportError:
+    HAVE_MPI = False
+
+def findMpirun():
+
+    for pathDir in os.environ.get('PATH', '').split(os.pathsep):
+
+        mpirun = os.path.join(pathDir, 'mpirun')
+
+        if os.access(mpirun, os.X_OK):
+            return mpirun
+
+    return None
+
+#-------------------------------------------------------------------------------
+# class TestTrialsMpi
+#
+# These run runTrialsMpi.py under mpirun, with a stub java, as one job would
+# on a cluster.
+#
+# cd MERRA-Max/tests; python -m unittest testTrialsMpi
+#-------------------------------------------------------------------------------
+@unittest.skipUnless(HAVE_MPI and findMpirun(),
+                     'runTrialsMpi requires GDAL, mpi4py and mpirun')
+class TestTrialsMpi(unittest.TestCase):
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.rootDir = tempfile.mkdtemp()
+        self.run     = StubRun(self.rootDir)
+
+    #---------------------------------------------------------------------------
+    # tearDown
+    #---------------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.rootDir, ignore_errors = True)
+
+    #---------------------------------------------------------------------------
+    # runMpi
+    #
+    # This runs runTrialsMpi.py on numRanks ranks, and returns its exit code.
+    # Open MPI is allowed more ranks than cores, and to run as root, as in a
+    # container.
+    #---------------------------------------------------------------------------
+    def runMpi(self, numRanks):
+
+        env = self.run.getEnvironment()
+
+        env.update({'OMPI_MCA_rmaps_base_oversubscribe': '1',
+                    'OMPI_ALLOW_RUN_AS_ROOT': '1',
+                    'OMPI_ALLOW_RUN_AS_ROOT_CONFIRM': '1'})
+
+        with open(os.path.join(self.rootDir, 'mpirun.log'), 'w') as log:
+
+            return subprocess.call([findMpirun(),
+                                    '-n', str(numRanks),
+                                    sys.executable,
+                                    StubRun.getScript('runTrialsMpi.py'),
+                                    '-c', self.run.configFile,
+                                    '--speculation', '0'],
+                                   env = env,
+                                   stdout = log,
+                                   stderr = subprocess.STDOUT)
+
+    #---------------------------------------------------------------------------
+    # testOneRankRejected
+    #---------------------------------------------------------------------------
+    def testOneRankRejected(self):
+
+        from TrialStore import TrialStore
+
+        self.assertNotEqual(self.runMpi(1), 0)
+
+        with open(os.path.join(self.rootDir, 'mpirun.log')) as log:
+            self.assertIn('needs at least two ranks', log.read())
+
+        trials = TrialStore(self.run.trialsDir).getTrials()
+
+        self.assertEqual([t['state'] for t in trials],
+                         [TrialStore.PENDING] * self.run.numTrials)
+
+        self.assertEqual(self.run.getClaims(), [])
+
+    #---------------------------------------------------------------------------
+    # testTrialsFinishAndSelect
+    #---------------------------------------------------------------------------
+    def testTrialsFinishAndSelect(self):
+
+        from MmxConfig import MmxConfig
+        from TrialStore import TrialStore
+
+        self.assertEqual(self.runMpi(4), 0)
+
+        trials = TrialStore(self.run.trialsDir).getTrials()
+
+        self.assertEqual(len(trials), self.run.numTrials)
+
+        for trial in trials:
+            self.assertEqual(trial['state'], TrialStore.COMPLETE)
+
+        claims = self.run.getClaims()
+
+        self.assertEqual(len(claims), self.run.numTrials)
+        self.assertEqual(len(set(claims)), self.run.numTrials)
+
+        # The selector ran after the last trial.
+        config = MmxConfig()
+        config.initializeFromFile(self.run.configFile)
+
+        self.assertEqual(len(config.topTen), 10)
+
+#-------------------------------------------------------------------------------
+# Invoke the tests
+#-------------------------------------------------------------------------------
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+import argparse
+import glob
+import math
+import os
+import random
+import sys
+
+from MmxApplication import MmxApplication
+from MmxConfig import MmxConfig
+from prepareTrials import PrepareTrials
+from runTrials import RunTrials
+from selector import Selector
+
+#-------------------------------------------------------------------------------
+# class TournamentSelector
+#
+# This selects the top-ten predictors by successive halving, instead of from
+# trials of random predictors.  Each round runs trials in which every
+# surviving predictor appears the same number of times, ranks the survivors by
+# their average contributions in that round, and keeps the best fraction of
+# them.  Rounds stop when the next would have ten or fewer survivors, and the
+# last round's ten best are the top ten.  Weak predictors are dropped early,
+# so large pools of predictors need far fewer MaxEnt runs.
+#-------------------------------------------------------------------------------
+class TournamentSelector(MmxApplication):
+
+    DEFAULT_APPEARANCES  = 3
+    DEFAULT_REDUCTION    = 2.0
+    PREDICTORS_PER_TRIAL = 10
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #
+    # In each round, every survivor appears in the given number of trials, and
+    # the survivors are divided by the reduction.
+    #---------------------------------------------------------------------------
+    def __init__(self, configFile, appearances = DEFAULT_APPEARANCES,
+                 reduction = DEFAULT_REDUCTION, useWorkers = False,
+                 logger = None):
+
+        mmxConfig = MmxConfig()
+        mmxConfig.initializeFromFile(configFile)
+
+        super(TournamentSelector, self).__init__(mmxConfig,
+                                                 'TournamentSelector',
+                                                 logger)
+
+        if appearances < 1:
+            raise RuntimeError('Predictors must appear in at least one trial.')
+
+        if reduction <= 1.0:
+            raise RuntimeError('The reduction must be greater than one.')
+
+        self.configFile  = configFile
+        self.appearances = appearances
+        self.reduction   = reduction
+        self.useWorkers  = useWorkers
+
+        self.logHeader()
+
+    #---------------------------------------------------------------------------
+    # getPhase
+    #---------------------------------------------------------------------------
+    def getPhase(self):
+        return 'TOURNAMENT_SELECTOR'
+
+    #---------------------------------------------------------------------------
+    # getRoundTrials
+    #
+    # This returns the predictors of a round's trials.  The survivors are
+    # shuffled and dealt into trials, once for each appearance.  The last
+    # trial of a deal is filled with other survivors.
+    #---------------------------------------------------------------------------
+    def getRoundTrials(self, survivors):
+
+        perTrial       = TournamentSelector.PREDICTORS_PER_TRIAL
+        predictorLists = []
+
+        for i in range(self.appearances):
+
+            shuffled = random.sample(survivors, len(survivors))
+
+            for start in range(0, len(shuffled), perTrial):
+
+                trialPredictors = shuffled[start:start + perTrial]
+                others = [s for s in survivors if s not in trialPredictors]
+
+                trialPredictors += \
+                    random.sample(others,
+                                  min(perTrial - len(trialPredictors),
+                                      len(others)))
+
+                predictorLists.append(trialPredictors)
+
+        return predictorLists
+
+    #---------------------------------------------------------------------------
+    # run
+    #---------------------------------------------------------------------------
+    def run(self):
+
+        prepTrials = PrepareTrials(self.configFile, logger = self.logger)
+        prepTrials.prepareInputs()
+
+        survivors = glob.glob(os.path.join(self.finishedDir, '*.tif'))
+        numRuns   = 0
+        roundNum  = 0
+
+        while True:
+
+            roundNum  += 1
+            trialNums  = \
+                prepTrials.addPredictorTrials(self.getRoundTrials(survivors))
+
+            numRuns += len(trialNums)
+
+            if self.logger:
+
+                self.logger.info('Round ' + str(roundNum) + ' runs ' + \
+                                 str(len(trialNums)) + ' trials of ' + \
+                                 str(len(survivors)) + ' predictors.')
+
+            RunTrials(self.configFile,
+                      str(trialNums[0]) + '-' + str(trialNums[-1]),
+                      self.useWorkers,
+                      logger = self.logger).run()
+
+            # Contributions are relative to a trial's other predictors, so
+            # only this round's trials rank the survivors.
+            selector      = Selector(self.configFile, self.logger)
+            contributions = selector.compileContributions(trialNums)
+            ranked        = Selector.rankPredictors(contributions)
+
+            numKept = int(math.ceil(len(survivors) / self.reduction))
+
+            if numKept <= 10 or numKept >= len(ranked):
+                break
+
+            # Predictors in no successful trial are dropped.
+            keptNames = set([name for name, mean in ranked[:numKept]])
+
+            survivors = [s for s in survivors
+                         if os.path.splitext(os.path.basename(s))[0] in
+                         keptNames]
+
+            if self.logger:
+
+                self.logger.info('Kept ' + str(len(survivors)) + \
+                                 ' predictors: ' + \
+                                 str(sorted(keptNames)))
+
+        if self.logger:
+
+            self.logger.info('The tournament ran ' + str(numRuns) + \
+                             ' trials in ' + str(roundNum) + ' rounds.')
+
+        selector.setTopTen(ranked[:10])
+
+#-------------------------------------------------------------------------------
+# main
+#
+# 1.  configureMmxRun
+# 2.  getMerra
+# 3.  prepareImages
+# 4.  ./tournamentSelector.py -c ~/Desktop/SystemTesting/Mmx/config.mmx,
+#     instead of prepareTrials, runTrials and selector
+# 5.  ./modeler.py
+#-------------------------------------------------------------------------------
+def main():
+
+    # Process command-line args.
+    desc = 'This application selects the top ten predictors by a ' + \
+           'tournament of successive halving.'
+
+    parser = argparse.ArgumentParser(description = desc)
+
+    parser.add_argument('-c',
+                        required = True,
+                        help = 'Path to MERRA-Max configuration file')
+
+    parser.add_argument('--appearances',
+                        type = int,
+                        default = TournamentSelector.DEFAULT_APPEARANCES,
+                        help = 'trials in which each surviving predictor ' + \
+                               'appears in a round')
+
+    parser.add_argument('--reduction',
+                        type = float,
+                        default = TournamentSelector.DEFAULT_REDUCTION,
+                        help = 'divide the surviving predictors by this ' + \
+                               'after each round')
+
+    parser.add_argument('--workers',
+                        action = 'store_true',
+                        help = 'Run the trials in persistent MaxEnt JVMs, ' + \
+                               'instead of a JVM for each trial.')
+
+    args = parser.parse_args()
+
+    selector = TournamentSelector(args.c,
+                                  args.appearances,
+                                  args.reduction,
+                                  args.workers)
+    selector.run()
+
+#-------------------------------------------------------------------------------
+# Invoke the main
+#-------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,559 @@
+import hashlib
+import httplib
+import json
+import os
+import random
+import socket
+import threading
+import time
+import urlparse
+
+from multiprocessing.pool import ThreadPool
+
+#-------------------------------------------------------------------------------
+# class Downloader
+#
+# This downloads large files, like RECOVER's predictor zips, without holding
+# them in memory.  Each file is streamed in chunks to a partial file beside
+# its destination.  When the connection fails, the download resumes where it
+# stopped with an HTTP Range request, instead of starting over.  A finished
+# download is checked against its expected size and SHA-1, when known, then
+# renamed into place, so the destination is never a partial file.
+#
+# The server's validator of the file, its ETag or Last-Modified date, is kept
+# beside the partial file, and a resumed request sends it as If-Range.  A
+# server whose file has changed then sends the whole file, instead of the
+# rest of another file.  A partial file without a validator, as from a server
+# that sends none, is started over.
+#
+# Connections are kept alive and reused for later requests to the same host,
+# from any thread, so API calls, redirects and resumed downloads do not each
+# open a new TLS connection.  Waits between attempts, and between polls of a
+# request's status, grow exponentially with random jitter, so many clients
+# polling one server spread out.
+#
+# An SSL context, like one that does not verify certificates, applies to every
+# HTTPS connection.
+#-------------------------------------------------------------------------------
+class Downloader(object):
+
+    BASE_DELAY       = 2
+    CHUNK_BYTES      = 1024 * 1024
+    MAX_DELAY        = 60
+    MAX_REDIRECTS    = 5
+    MAX_RETRIES      = 5
+    PART_SUFFIX      = '.part'
+    PROGRESS_SECONDS = 30
+    TIMEOUT          = 300
+    VALIDATOR_SUFFIX = '.validator'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, maxRetries = MAX_RETRIES, timeout = TIMEOUT,
+                 sslContext = None, logger = None):
+
+        self.maxRetries  = maxRetries
+        self.timeout     = timeout
+        self.sslContext  = sslContext
+        self.logger      = logger
+        self.connections = {}
+        self.lock        = threading.Lock()
+
+    #---------------------------------------------------------------------------
+    # close
+    #
+    # This closes the idle connections.
+    #---------------------------------------------------------------------------
+    def close(self):
+
+        with self.lock:
+
+            for idle in self.connections.values():
+
+                for conn in idle:
+                    conn.close()
+
+            self.connections = {}
+
+    #---------------------------------------------------------------------------
+    # download
+    #
+    # This downloads a URL to destFile, and returns destFile.  A partial file
+    # left by an earlier attempt is resumed.
+    #---------------------------------------------------------------------------
+    def download(self, url, destFile, size = None, sha1 = None):
+
+        partFile = destFile + Downloader.PART_SUFFIX
+        retries  = 0
+        start    = time.time()
+
+        while True:
+
+            try:
+                total = self.fetch(url, partFile)
+                break
+
+            except (IOError, socket.error, httplib.HTTPException), e:
+
+                retries += 1
+
+                if retries > self.maxRetries:
+
+                    raise RuntimeError('Unable to download ' + url + \
+                                       ' after ' + str(retries) + \
+                                       ' attempts:  ' + str(e))
+
+                delay = Downloader.getDelay(retries)
+
+                if self.logger:
+
+                    self.logger.warning('Download of ' + url + \
+                                        ' interrupted (' + str(e) + \
+                                        ').  Resuming in ' + \
+                                        '%.0f seconds.' % delay)
+
+                time.sleep(delay)
+
+        self.verify(partFile, size or total, sha1)
+        os.rename(partFile, destFile)
+        Downloader.removePartFile(partFile)
+
+        if self.logger:
+
+            seconds = max(time.time() - start, 1e-3)
+            numMB   = os.path.getsize(destFile) / 1048576.0
+
+            self.logger.info('Downloaded ' + destFile + ', ' + \
+                             '%.1f MB in %.0f seconds (%.2f MB/s).' % \
+                             (numMB, seconds, numMB / seconds))
+
+        return destFile
+
+    #---------------------------------------------------------------------------
+    # downloadAll
+    #
+    # This downloads several files at once, like the predictors of an order
+    # or the orders of several sites.  Downloads are (url, destFile, size,
+    # sha1) tuples, whose size and SHA-1 may be None.  It returns the
+    # destination files, after all downloads finish or fail.
+    #---------------------------------------------------------------------------
+    def downloadAll(self, downloads, numThreads = 4):
+
+        numThreads = max(min(numThreads, len(downloads)), 1)
+        pool       = ThreadPool(numThreads)
+
+        try:
+            results = pool.map(self.tryDownload, downloads)
+
+        finally:
+            pool.close()
+            pool.join()
+
+        failures = [(url, error) for url, error in results if error]
+
+        for url, error in failures:
+
+            if self.logger:
+                self.logger.error(error)
+
+        if failures:
+
+            raise RuntimeError('Unable to download ' + \
+                               str(len(failures)) + ' of ' + \
+                               str(len(downloads)) + ' files.')
+
+        return [download[1] for download in downloads]
+
+    #---------------------------------------------------------------------------
+    # fetch
+    #
+    # This appends the rest of a URL to the partial file, and returns the
+    # URL's size, or None when the server does not say.  It raises IOError
+    # when the transfer stops early, so it can be resumed.
+    #---------------------------------------------------------------------------
+    def fetch(self, url, partFile):
+
+        offset    = 0
+        validator = Downloader.readValidator(partFile)
+        headers   = {}
+
+        if validator and os.path.exists(partFile):
+            offset = os.path.getsize(partFile)
+
+        if offset:
+
+            headers = {'Range': 'bytes=' + str(offset) + '-',
+                       'If-Range': validator}
+
+        conn, response = self.request(url, headers)
+
+        try:
+            # The partial file is already complete, when it is as long as the
+            # file it was validated against.  Otherwise, it is started over.
+            if response.status == 416:
+
+                response.read()
+
+                length  = (response.getheader('Content-Range') or '')
+                current = Downloader.getValidator(response)
+
+                if length == 'bytes */' + str(offset) and \
+                   current in (None, validator):
+
+                    return offset
+
+                Downloader.removePartFile(partFile)
+
+                raise IOError('The partial file ' + partFile + ' does not ' + \
+                              'match ' + url + ', so it was removed.')
+
+            if response.status >= 500:
+
+                raise IOError('The server returned ' + \
+                              str(response.status) + ' ' + response.reason)
+
+            if response.status not in (200, 206):
+
+                raise RuntimeError('Unable to download ' + url + ':  ' + \
+                                   str(response.status) + ' ' + \
+                                   response.reason)
+
+            # A server ignoring the range, or whose file changed, sends the
+            # whole file.
+            if response.status == 200:
+
+                offset = 0
+                Downloader.writeValidator(partFile,
+                                          Downloader.getValidator(response))
+
+            length = response.getheader('Content-Length')
+            total  = offset + int(length) if length else None
+            mode   = 'ab' if offset else 'wb'
+
+            totalMB = '%.1f' % (total / 1048576.0) if total else 'unknown'
+
+            if self.logger:
+
+                self.logger.info(('Resuming ' if offset else 'Downloading ') + \
+                                 url + ' at ' + str(offset) + ' of ' + \
+                                 str(total) + ' bytes.')
+
+            received     = offset
+            lastProgress = time.time()
+            lastReceived = received
+
+            with open(partFile, mode) as f:
+
+                while True:
+
+                    chunk = response.read(Downloader.CHUNK_BYTES)
+
+                    if not chunk:
+                        break
+
+                    f.write(chunk)
+                    received += len(chunk)
+
+                    now = time.time()
+
+                    if self.logger and \
+                       now - lastProgress >= Downloader.PROGRESS_SECONDS:
+
+                        rate = (received - lastReceived) / 1048576.0 / \
+                               (now - lastProgress)
+
+                        self.logger.info('Downloaded %.1f of %s MB ' % \
+                                         (received / 1048576.0, totalMB) + \
+                                         'at %.2f MB/s.' % rate)
+
+                        lastProgress = now
+                        lastReceived = received
+
+            if total and received < total:
+
+                raise IOError('The connection closed after ' + \
+                              str(received) + ' of ' + str(total) + \
+                              ' bytes.')
+
+            return total
+
+        finally:
+            self.releaseConnection(conn, response)
+
+    #---------------------------------------------------------------------------
+    # getConnection
+    #
+    # This returns an idle connection to the URL's host, or a new one, and
+    # whether it was idle.
+    #---------------------------------------------------------------------------
+    def getConnection(self, parsedUrl, reuse = True):
+
+        key = (parsedUrl.scheme, parsedUrl.netloc)
+
+        with self.lock:
+
+            idle = self.connections.get(key)
+
+            if reuse and idle:
+                return idle.pop(), True
+
+        if parsedUrl.scheme == 'https':
+
+            conn = httplib.HTTPSConnection(parsedUrl.netloc,
+                                           timeout = self.timeout,
+                                           context = self.sslContext)
+
+        elif parsedUrl.scheme == 'http':
+
+            conn = httplib.HTTPConnection(parsedUrl.netloc,
+                                          timeout = self.timeout)
+
+        else:
+            raise RuntimeError('Unable to download ' + parsedUrl.geturl() + \
+                               ', which is not an HTTP URL.')
+
+        conn.poolKey = key
+
+        return conn, False
+
+    #---------------------------------------------------------------------------
+    # getDelay
+    #
+    # This returns the seconds to wait before the given attempt, from zero to
+    # an exponentially growing limit.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getDelay(attempt):
+
+        return random.uniform(0, min(Downloader.MAX_DELAY,
+                                     Downloader.BASE_DELAY * 2 ** attempt))
+
+    #---------------------------------------------------------------------------
+    # getJson
+    #
+    # This requests a URL, like a RECOVER API call, and returns its JSON.
+    #---------------------------------------------------------------------------
+    def getJson(self, url, headers = None):
+
+        conn, response = self.request(url, headers or {})
+
+        try:
+            if response.status != 200:
+
+                raise RuntimeError('Request ' + url + ' failed:  ' + \
+                                   str(response.status) + ' ' + \
+                                   response.reason)
+
+            return json.loads(response.read())
+
+        finally:
+            self.releaseConnection(conn, response)
+
+    #---------------------------------------------------------------------------
+    # getValidator
+    #
+    # This returns the response's strong ETag, or its Last-Modified date, or
+    # None.  Weak ETags cannot be sent as If-Range.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getValidator(response):
+
+        etag = response.getheader('ETag')
+
+        if etag and not etag.startswith('W/'):
+            return etag
+
+        return response.getheader('Last-Modified')
+
+    #---------------------------------------------------------------------------
+    # poll
+    #
+    # This calls isDone, like a check of an order's status, until it returns
+    # something other than None, and returns that.  Waits between calls grow
+    # exponentially with jitter.
+    #---------------------------------------------------------------------------
+    def poll(self, isDone, maxSeconds, description = 'request'):
+
+        start   = time.time()
+        attempt = 0
+
+        while True:
+
+            result = isDone()
+
+            if result != None:
+                return result
+
+            attempt += 1
+            delay    = Downloader.getDelay(attempt)
+
+            if time.time() + delay - start > maxSeconds:
+
+                raise RuntimeError('The ' + description + ' did not ' + \
+                                   'finish within ' + str(maxSeconds) + \
+                                   ' seconds.')
+
+            if self.logger:
+
+                self.logger.info('Waiting %.0f seconds for the ' % delay + \
+                                 description + '.')
+
+            time.sleep(delay)
+
+    #---------------------------------------------------------------------------
+    # readValidator
+    #
+    # This returns the validator of the file a partial file is part of, or
+    # None.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def readValidator(partFile):
+
+        validatorFile = partFile + Downloader.VALIDATOR_SUFFIX
+
+        if not os.path.exists(validatorFile):
+            return None
+
+        with open(validatorFile) as f:
+            return f.read().strip() or None
+
+    #---------------------------------------------------------------------------
+    # releaseConnection
+    #
+    # A connection whose response was read to its end is kept for reuse.
+    #---------------------------------------------------------------------------
+    def releaseConnection(self, conn, response):
+
+        if response.will_close or not response.isclosed():
+
+            conn.close()
+            return
+
+        with self.lock:
+            self.connections.setdefault(conn.poolKey, []).append(conn)
+
+    #---------------------------------------------------------------------------
+    # removePartFile
+    #
+    # This removes a partial file and its validator.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def removePartFile(partFile):
+
+        for leftFile in [partFile, partFile + Downloader.VALIDATOR_SUFFIX]:
+
+            if os.path.exists(leftFile):
+                os.remove(leftFile)
+
+    #---------------------------------------------------------------------------
+    # request
+    #
+    # This requests a URL, following redirects, and returns the connection
+    # and its response.
+    #---------------------------------------------------------------------------
+    def request(self, url, headers):
+
+        for i in range(Downloader.MAX_REDIRECTS + 1):
+
+            parsedUrl = urlparse.urlparse(url)
+            path      = parsedUrl.path or '/'
+
+            if parsedUrl.query:
+                path += '?' + parsedUrl.query
+
+            conn, reused = self.getConnection(parsedUrl)
+
+            try:
+                conn.request('GET', path, headers = headers)
+                response = conn.getresponse()
+
+            except (socket.error, httplib.HTTPException):
+
+                conn.close()
+
+                # The server may have closed an idle connection.
+                if not reused:
+                    raise
+
+                conn, reused = self.getConnection(parsedUrl, reuse = False)
+                conn.request('GET', path, headers = headers)
+                response = conn.getresponse()
+
+            if response.status not in (301, 302, 303, 307, 308):
+                return conn, response
+
+            url = urlparse.urljoin(url, response.getheader('Location'))
+            response.read()
+            self.releaseConnection(conn, response)
+
+        raise RuntimeError('Too many redirects from ' + url + '.')
+
+    #---------------------------------------------------------------------------
+    # tryDownload
+    #
+    # This returns the URL and an error message, or None, so one failure does
+    # not stop the others in downloadAll.
+    #---------------------------------------------------------------------------
+    def tryDownload(self, download):
+
+        url, destFile, size, sha1 = download
+
+        try:
+            self.download(url, destFile, size, sha1)
+            return url, None
+
+        except Exception, e:
+            return url, 'Unable to download ' + url + ':  ' + str(e)
+
+    #---------------------------------------------------------------------------
+    # verify
+    #
+    # A partial file failing the check is removed, so the next attempt starts
+    # over.
+    #---------------------------------------------------------------------------
+    def verify(self, partFile, size, sha1):
+
+        error = None
+
+        if size != None and os.path.getsize(partFile) != size:
+
+            error = 'is ' + str(os.path.getsize(partFile)) + \
+                    ' bytes, instead of ' + str(size) + '.'
+
+        elif sha1:
+
+            digest = hashlib.sha1()
+
+            with open(partFile, 'rb') as f:
+
+                for block in iter(lambda: f.read(Downloader.CHUNK_BYTES), b''):
+                    digest.update(block)
+
+            if digest.hexdigest() != sha1.lower():
+
+                error = 'has SHA-1 ' + digest.hexdigest() + ', instead of ' + \
+                        sha1.lower() + '.'
+
+        if error:
+
+            Downloader.removePartFile(partFile)
+            raise RuntimeError('The download ' + partFile + ' ' + error)
+
+    #---------------------------------------------------------------------------
+    # writeValidator
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def writeValidator(partFile, validator):
+
+        validatorFile = partFile + Downloader.VALIDATOR_SUFFIX
+
+        if not validator:
+
+            if os.path.exists(validatorFile):
+                os.remove(validatorFile)
+
+            return
+
+        with open(validatorFile, 'w') as f:
+            f.write(validator)
@@ -0,0 +1,218 @@
+import BaseHTTPServer
+import hashlib
+import json
+import os
+import SocketServer
+import sys
+import threading
+import urlparse
+
+#-------------------------------------------------------------------------------
+# The tests run the scripts from the RecoverScripts directory.
+#-------------------------------------------------------------------------------
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+#-------------------------------------------------------------------------------
+# class MockRecoverHandler
+#
+# This answers RECOVER's addPredictor, predictorStatus and downloadPredictor
+# calls from the orders of the server's MockRecover.  Connections are kept
+# alive, as RECOVER's are.
+#-------------------------------------------------------------------------------
+class MockRecoverHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    #---------------------------------------------------------------------------
+    # do_GET
+    #---------------------------------------------------------------------------
+    def do_GET(self):
+
+        mock    = self.server.mock
+        url     = urlparse.urlparse(self.path)
+        command = url.path.split('/')[-1]
+        params  = dict(urlparse.parse_qsl(url.query))
+
+        with mock.lock:
+            mock.requests.append((command, params, self.headers.get('Range')))
+
+        site      = params.get('site')
+        predictor = params.get('predictorName') or params.get('predictor')
+        order     = mock.orders.get((site, predictor))
+
+        if command == 'downloadPredictor' and order:
+            self.sendZip(order['data'])
+
+        elif command == 'addPredictor':
+
+            if order:
+                self.sendJson({'success': True, 'msg': 'Added', 'state': 'PND'})
+
+            else:
+                self.sendJson({'success': False, 'msg': 'No such site'})
+
+        elif command == 'predictorStatus' and order:
+
+            with mock.lock:
+                order['polls'] += 1
+                done = order['polls'] > order['pendingPolls']
+
+            state = ('FLD' if order['fail'] else 'CPT') if done else 'PND'
+            self.sendJson({'success': True, 'msg': state, 'state': state})
+
+        else:
+            self.send_error(404)
+
+    #---------------------------------------------------------------------------
+    # log_message
+    #---------------------------------------------------------------------------
+    def log_message(self, format, *args):
+        pass
+
+    #---------------------------------------------------------------------------
+    # sendJson
+    #---------------------------------------------------------------------------
+    def sendJson(self, doc):
+
+        body = json.dumps(doc)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #---------------------------------------------------------------------------
+    # sendZip
+    #
+    # This honors a Range request, unless its If-Range does not match the
+    # zip's ETag.  While the server has drops remaining, it sends only
+    # dropAfter bytes, then closes the connection.
+    #---------------------------------------------------------------------------
+    def sendZip(self, data):
+
+        mock   = self.server.mock
+        etag   = '"' + hashlib.sha1(data).hexdigest() + '"'
+        offset = 0
+        rangeHeader = self.headers.get('Range')
+
+        if rangeHeader and self.headers.get('If-Range', etag) == etag:
+            offset = int(rangeHeader.split('=')[1].split('-')[0])
+
+        if offset >= len(data) and offset:
+
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */' + str(len(data)))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = data[offset:]
+
+        self.send_response(206 if offset else 200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        with mock.lock:
+
+            drop = mock.numDrops > 0
+
+            if drop:
+                mock.numDrops -= 1
+
+        if drop:
+
+            self.wfile.write(body[:mock.dropAfter])
+            self.close_connection = True
+
+        else:
+            self.wfile.write(body)
+
+    #---------------------------------------------------------------------------
+    # setup
+    #---------------------------------------------------------------------------
+    def setup(self):
+
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+        with self.server.mock.lock:
+            self.server.mock.numConnections += 1
+
+#-------------------------------------------------------------------------------
+# class MockRecoverServer
+#-------------------------------------------------------------------------------
+class MockRecoverServer(SocketServer.ThreadingMixIn,
+                        BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+#-------------------------------------------------------------------------------
+# class MockRecover
+#
+# This is a RECOVER server on localhost, in a thread.  Each order is a site's
+# predictor, whose status is pending for its first pendingPolls checks.
+#-------------------------------------------------------------------------------
+class MockRecover(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, numDrops = 0, dropAfter = 0):
+
+        self.lock           = threading.Lock()
+        self.numConnections = 0
+        self.numDrops       = numDrops
+        self.dropAfter      = dropAfter
+        self.orders         = {}
+        self.requests       = []
+
+        self.server      = MockRecoverServer(('127.0.0.1', 0),
+                                             MockRecoverHandler)
+        self.server.mock = self
+
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    #---------------------------------------------------------------------------
+    # addOrder
+    #---------------------------------------------------------------------------
+    def addOrder(self, site, predictor, data, pendingPolls = 0, fail = False):
+
+        self.orders[(str(site), predictor)] = {'data': data,
+                                               'pendingPolls': pendingPolls,
+                                               'polls': 0,
+                                               'fail': fail}
+
+    #---------------------------------------------------------------------------
+    # getEndPoint
+    #---------------------------------------------------------------------------
+    def getEndPoint(self):
+        return 'http://127.0.0.1:' + str(self.server.server_address[1])
+
+    #---------------------------------------------------------------------------
+    # getRequests
+    #
+    # This returns the parameters and Range header of each call of a command.
+    #---------------------------------------------------------------------------
+    def getRequests(self, command):
+
+        with self.lock:
+
+            return [(params, rangeHeader)
+                    for cmd, params, rangeHeader in self.requests
+                    if cmd == command]
+
+    #---------------------------------------------------------------------------
+    # stop
+    #---------------------------------------------------------------------------
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
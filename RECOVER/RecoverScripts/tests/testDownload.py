@@ -0,0 +1,208 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from MockRecover import MockRecover
+
+from Downloader import Downloader
+import wrangleOnePredictor
+
+#-------------------------------------------------------------------------------
+# class TestDownload
+#
+# These download predictors from a local RECOVER server that drops
+# connections mid-transfer.
+#
+# cd RECOVER/RecoverScripts/tests; python -m unittest discover
+#-------------------------------------------------------------------------------
+class TestDownload(unittest.TestCase):
+
+    SITE      = '414'
+    PREDICTOR = 'MERRA Max'
+    NUM_BYTES = 350000
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #
+    # Retries wait milliseconds, instead of seconds.
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.baseDelay         = Downloader.BASE_DELAY
+        Downloader.BASE_DELAY  = 0.01
+
+        self.cwd     = os.getcwd()
+        self.tempDir = tempfile.mkdtemp()
+        os.chdir(self.tempDir)
+
+        self.data = os.urandom(TestDownload.NUM_BYTES)
+        self.mock = MockRecover(numDrops = 2, dropAfter = 100000)
+
+        self.mock.addOrder(TestDownload.SITE, TestDownload.PREDICTOR,
+                           self.data)
+
+    #---------------------------------------------------------------------------
+    # tearDown
+    #---------------------------------------------------------------------------
+    def tearDown(self):
+
+        self.mock.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempDir, ignore_errors = True)
+        Downloader.BASE_DELAY = self.baseDelay
+
+    #---------------------------------------------------------------------------
+    # getUrl
+    #---------------------------------------------------------------------------
+    def getUrl(self):
+
+        return self.mock.getEndPoint() + '/api/downloadPredictor?site=' + \
+               TestDownload.SITE + '&predictor=MERRA+Max'
+
+    #---------------------------------------------------------------------------
+    # testBadChecksum
+    #---------------------------------------------------------------------------
+    def testBadChecksum(self):
+
+        destFile = os.path.join(self.tempDir, 'bad.zip')
+
+        with self.assertRaises(RuntimeError):
+            Downloader().download(self.getUrl(), destFile, sha1 = '0' * 40)
+
+        self.assertFalse(os.path.exists(destFile))
+        self.assertFalse(os.path.exists(destFile + Downloader.PART_SUFFIX))
+
+    #---------------------------------------------------------------------------
+    # testGoodChecksum
+    #---------------------------------------------------------------------------
+    def testGoodChecksum(self):
+
+        destFile = os.path.join(self.tempDir, 'good.zip')
+        sha1     = hashlib.sha1(self.data).hexdigest()
+
+        Downloader().download(self.getUrl(), destFile, len(self.data), sha1)
+
+        with open(destFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    #---------------------------------------------------------------------------
+    # testLongPartialFileRemoved
+    #
+    # A partial file longer than the file it was validated against is not
+    # taken for the whole file.
+    #---------------------------------------------------------------------------
+    def testLongPartialFileRemoved(self):
+
+        self.mock.numDrops = 0
+
+        destFile = os.path.join(self.tempDir, 'long.zip')
+        partFile = destFile + Downloader.PART_SUFFIX
+
+        with open(partFile, 'wb') as f:
+            f.write(self.data + os.urandom(1000))
+
+        Downloader.writeValidator(partFile,
+                                  '"' + hashlib.sha1(self.data).hexdigest() + \
+                                  '"')
+
+        Downloader().download(self.getUrl(), destFile)
+
+        with open(destFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    #---------------------------------------------------------------------------
+    # testOtherFileNotResumed
+    #
+    # A partial file of another order, validated against another ETag, is
+    # replaced by the whole file, not spliced onto its rest.
+    #---------------------------------------------------------------------------
+    def testOtherFileNotResumed(self):
+
+        self.mock.numDrops = 0
+
+        destFile = os.path.join(self.tempDir, 'other.zip')
+        partFile = destFile + Downloader.PART_SUFFIX
+
+        with open(partFile, 'wb') as f:
+            f.write(os.urandom(100000))
+
+        Downloader.writeValidator(partFile, '"another order"')
+        Downloader().download(self.getUrl(), destFile)
+
+        with open(destFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+        self.assertFalse(os.path.exists(partFile + \
+                                        Downloader.VALIDATOR_SUFFIX))
+
+    #---------------------------------------------------------------------------
+    # testRetriesExhausted
+    #
+    # A download that keeps failing leaves its partial file to resume later.
+    #---------------------------------------------------------------------------
+    def testRetriesExhausted(self):
+
+        destFile = os.path.join(self.tempDir, 'partial.zip')
+
+        with self.assertRaises(RuntimeError):
+            Downloader(maxRetries = 1).download(self.getUrl(), destFile)
+
+        self.assertFalse(os.path.exists(destFile))
+
+        self.assertEqual(os.path.getsize(destFile + Downloader.PART_SUFFIX),
+                         200000)
+
+    #---------------------------------------------------------------------------
+    # testUnvalidatedFileStartedOver
+    #---------------------------------------------------------------------------
+    def testUnvalidatedFileStartedOver(self):
+
+        self.mock.numDrops = 0
+
+        destFile = os.path.join(self.tempDir, 'unvalidated.zip')
+
+        with open(destFile + Downloader.PART_SUFFIX, 'wb') as f:
+            f.write(os.urandom(100000))
+
+        Downloader().download(self.getUrl(), destFile)
+
+        with open(destFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+        self.assertEqual([rangeHeader for params, rangeHeader
+                          in self.mock.getRequests('downloadPredictor')],
+                         [None])
+
+    #---------------------------------------------------------------------------
+    # testWrangleResumes
+    #
+    # The predictor's download is dropped twice, then resumed where it
+    # stopped.
+    #---------------------------------------------------------------------------
+    def testWrangleResumes(self):
+
+        zipFile = wrangleOnePredictor.wrangle('user', 'key', TestDownload.SITE,
+                                              False, False, False, True, False,
+                                              self.mock.getEndPoint())
+
+        self.assertEqual(zipFile,
+                         os.path.join(os.getcwd(),
+                                      TestDownload.SITE + '-' + \
+                                      TestDownload.PREDICTOR + '.zip'))
+
+        with open(zipFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+        self.assertFalse(os.path.exists(zipFile + Downloader.PART_SUFFIX))
+
+        self.assertEqual([rangeHeader for params, rangeHeader
+                          in self.mock.getRequests('downloadPredictor')],
+                         [None, 'bytes=100000-', 'bytes=200000-'])
+
+#-------------------------------------------------------------------------------
+# Invoke the tests
+#-------------------------------------------------------------------------------
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from MockRecover import MockRecover
+
+from Downloader import Downloader
+import wrangleOnePredictor
+import wranglerUtils
+
+#-------------------------------------------------------------------------------
+# class TestWrangleAll
+#
+# These order predictors for several sites at once from a local RECOVER
+# server whose orders stay pending for a few status checks.
+#
+# cd RECOVER/RecoverScripts/tests; python -m unittest discover
+#-------------------------------------------------------------------------------
+class TestWrangleAll(unittest.TestCase):
+
+    PENDING_POLLS = 3
+    PREDICTORS    = ['MERRA', 'MERRA Max']
+    SITES         = ['414', '415', '416']
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #
+    # Polls wait milliseconds, instead of seconds.
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.baseDelay        = Downloader.BASE_DELAY
+        self.maxDelay         = Downloader.MAX_DELAY
+        Downloader.BASE_DELAY = 0.01
+        Downloader.MAX_DELAY  = 0.05
+
+        # A client pooling connections to an earlier test's server
+        wranglerUtils.client = None
+
+        self.tempDir = tempfile.mkdtemp()
+        self.mock    = MockRecover()
+        self.data    = {}
+
+        for site in TestWrangleAll.SITES:
+
+            for predictor in TestWrangleAll.PREDICTORS:
+
+                self.data[(site, predictor)] = os.urandom(50000)
+
+                self.mock.addOrder(site, predictor,
+                                   self.data[(site, predictor)],
+                                   TestWrangleAll.PENDING_POLLS)
+
+    #---------------------------------------------------------------------------
+    # tearDown
+    #---------------------------------------------------------------------------
+    def tearDown(self):
+
+        wranglerUtils.getClient().close()
+        wranglerUtils.client = None
+
+        self.mock.stop()
+        shutil.rmtree(self.tempDir, ignore_errors = True)
+
+        Downloader.BASE_DELAY = self.baseDelay
+        Downloader.MAX_DELAY  = self.maxDelay
+
+    #---------------------------------------------------------------------------
+    # getOrders
+    #---------------------------------------------------------------------------
+    def getOrders(self, sites, predictors):
+
+        return [(site, predictor,
+                 os.path.join(self.tempDir, site + '-' + predictor + '.zip'))
+                for site in sites for predictor in predictors]
+
+    #---------------------------------------------------------------------------
+    # testFailuresDoNotStopOthers
+    #---------------------------------------------------------------------------
+    def testFailuresDoNotStopOthers(self):
+
+        self.mock.addOrder('417', 'MERRA', '', fail = True)
+
+        orders = self.getOrders(['414', '417', '999'], ['MERRA'])
+
+        zipFiles = wrangleOnePredictor.wrangleAll('user', 'key', orders,
+                                                  self.mock.getEndPoint())
+
+        self.assertEqual(zipFiles, [orders[0][2], None, None])
+
+        self.assertEqual([params['site'] for params, rangeHeader
+                          in self.mock.getRequests('downloadPredictor')],
+                         ['414'])
+
+    #---------------------------------------------------------------------------
+    # testOrdersRunConcurrently
+    #
+    # Every order is placed before any is downloaded, and the calls share a
+    # few connections.
+    #---------------------------------------------------------------------------
+    def testOrdersRunConcurrently(self):
+
+        orders = self.getOrders(TestWrangleAll.SITES,
+                                TestWrangleAll.PREDICTORS)
+
+        zipFiles = wrangleOnePredictor.wrangleAll('user', 'key', orders,
+                                                  self.mock.getEndPoint())
+
+        self.assertEqual(zipFiles, [order[2] for order in orders])
+
+        for site, predictor, zipFile in orders:
+
+            with open(zipFile, 'rb') as f:
+                self.assertEqual(f.read(), self.data[(site, predictor)])
+
+        commands = [request[0] for request in self.mock.requests]
+        numCalls = len(commands)
+
+        self.assertEqual(commands.count('addPredictor'), len(orders))
+        self.assertEqual(commands.count('downloadPredictor'), len(orders))
+
+        self.assertEqual(commands.count('predictorStatus'),
+                         len(orders) * (TestWrangleAll.PENDING_POLLS + 1))
+
+        lastAdd = numCalls - 1 - commands[::-1].index('addPredictor')
+
+        self.assertLess(lastAdd, commands.index('downloadPredictor'))
+        self.assertLessEqual(self.mock.numConnections, len(orders))
+        self.assertLess(self.mock.numConnections, numCalls)
+
+    #---------------------------------------------------------------------------
+    # testRequestErrors
+    #
+    # A failed call returns a failed document, instead of raising.
+    #---------------------------------------------------------------------------
+    def testRequestErrors(self):
+
+        doc = wranglerUtils.callAPI(self.mock.getEndPoint(), 'noSuchCommand',
+                                    {})
+
+        self.assertFalse(doc['success'])
+        self.assertEqual(doc['state'], 'FAILED')
+        self.assertIn('404', str(doc['msg']))
+
+        self.mock.stop()
+
+        doc = wranglerUtils.callAPI(self.mock.getEndPoint(), 'addPredictor',
+                                    {})
+
+        self.assertFalse(doc['success'])
+        self.assertEqual(doc['state'], 'FAILED')
+
+        # tearDown stops the server again.
+        self.mock = MockRecover()
+
+    #---------------------------------------------------------------------------
+    # testWranglePolls
+    #---------------------------------------------------------------------------
+    def testWranglePolls(self):
+
+        cwd = os.getcwd()
+        os.chdir(self.tempDir)
+
+        try:
+            zipFile = wrangleOnePredictor.wrangle('user', 'key', '414',
+                                                  False, False, True, False,
+                                                  False,
+                                                  self.mock.getEndPoint())
+
+        finally:
+            os.chdir(cwd)
+
+        with open(zipFile, 'rb') as f:
+            self.assertEqual(f.read(), self.data[('414', 'MERRA')])
+
+        self.assertEqual(len(self.mock.getRequests('predictorStatus')),
+                         TestWrangleAll.PENDING_POLLS + 1)
+
+#-------------------------------------------------------------------------------
+# Invoke the tests
+#-------------------------------------------------------------------------------
+if __name__ == '__main__':
+    unittest.main()
@@ -3,57 +3,38 @@
 import argparse
 import os
 import sys
-import time
-import urllib2
+import traceback
+
+from multiprocessing.pool import ThreadPool
 
 import wranglerUtils
 
+# 60 secs * 60 mins * 24 hours * 2 = 2 days
+MAX_WAIT = 60 * 60 * 24 * 2
+
 #---------------------------------------------------------------------------
-# wrangle
+# addPredictor
+#
+# This returns True when the predictor was added to the site.
 #---------------------------------------------------------------------------
-def wrangle(user, key, site, gpcp, landsat, merra, merraMax, modis, \
-            server = 'recoverdss.us', verbose = False):
-    
-    if user == None or user == '':
-        raise RuntimeError('A user must be provided.')
-        
-    if key == None or key == '':
-        raise RuntimeError('A key must be provided.')
-
-    predictor = None
+def addPredictor(user, key, site, predictor, server, verbose):
 
-    if gpcp:
-        predictor = 'GPCP'
-        
-    elif landsat:
-        predictor = 'Landsat'
-        
-    elif merra:
-        predictor = 'MERRA'
-        
-    elif merraMax:
-        predictor = 'MERRA Max'
-        
-    elif modis:
-        predictor = 'MODIS Time Series'
-        
-    # Initiate the predictor.
     args = {'site'          : site,
             'key'           : key,
             'user'          : user,
             'predictorName' : predictor}
-    
+
     predCreated = False
-    
+
     while not predCreated:
-        
+
         response = wranglerUtils.callAPI(server, 'addPredictor', args, verbose)
 
         if not response['success']:
 
             if response.has_key('state') and response['state'] == 'FLD' and \
                response.has_key('message') and 'failed' in response['message']:
-            
+
                 #---
                 # This happens when: 1) the site does not exist, 2) the end
                 # point / predictor does not exist, 3) the predictor processing
@@ -61,99 +42,227 @@ def wrangle(user, key, site, gpcp, landsat, merra, merraMax, modis, \
                 # case 3, look for 'failed' in the message.
                 #---
                 delResp = wranglerUtils.callAPI(server, 'deletePredictor', args)
-            
+
             else:
-                print 'Unable to add this predictor due to: ' + str(response['msg'])
-                return
-                
+                print 'Unable to add ' + predictor + ' to site ' + str(site) + \
+                      ' due to: ' + str(response['msg'])
+
+                return False
+
         else:
             predCreated = True
 
         print response['msg']
-    
-    # Wait for it to complete.
-    startTime = time.time()
-    
-    # 60 secs * 60 mins * 24 hours * 2 = 2 days
-    maxWait = 60 * 60 * 24 * 2 
-    
-    status    = None
-    firstTime = True
-    
-    while status != 'CPT' and status != 'FLD':
-        
-        if not firstTime: 
-            
-            # Wait
-            print 'Waiting ...'
-            time.sleep(5)
-            waited = time.time() - startTime
-
-            if waited > maxWait and status != 'CPT':
-
-                print 'Job has not completed in ' + str(maxWait) + ' seconds, so timing out.'
-                return
 
-        else:
-            firstTime = False
-            
-        # Check the status
-        response = wranglerUtils.callAPI(server, 'predictorStatus', args, verbose)
-        status   = response['state']
-        msg      = response['msg']
-
-    if status == 'FLD':
-        
-        print 'Predictor creation failed.'
-        print msg
-        return
+    return True
+
+#---------------------------------------------------------------------------
+# checkCredentials
+#---------------------------------------------------------------------------
+def checkCredentials(user, key):
+
+    if user == None or user == '':
+        raise RuntimeError('A user must be provided.')
+
+    if key == None or key == '':
+        raise RuntimeError('A key must be provided.')
+
+#---------------------------------------------------------------------------
+# downloadPredictor
+#---------------------------------------------------------------------------
+def downloadPredictor(user, key, site, predictor, outFileName, server):
+
+    print 'Downloading ' + predictor + ' for site ' + str(site)
 
-    # Download it.
-    print 'Downloading ' + predictor
-    
     args = {'site'      : site,
             'predictor' : predictor,
             'key'       : key,
             'user'      : user}
-    
-    downloadURL  = wranglerUtils.composeURL(server, 'downloadPredictor', args) 
 
-    # downloadFile = urllib2.urlopen(downloadURL)
-    downloadFile = wranglerUtils.openURL(downloadURL)
-    
-    outFileName  = os.path.join(os.getcwd(), predictor + '.zip')
+    downloadURL = wranglerUtils.composeURL(server, 'downloadPredictor', args)
 
-    oFile = open(outFileName, 'wb')
-    oFile.write(downloadFile.read())
-    downloadFile.close()
-    oFile.close()
+    #---
+    # The zip is streamed to disk, resumed after a dropped connection and
+    # checked against its length before it is renamed into place.
+    #---
+    wranglerUtils.getClient().download(downloadURL, outFileName)
 
     print 'Predictor file: ' + str(outFileName)
     return outFileName
-    
+
+#---------------------------------------------------------------------------
+# getZipName
+#
+# Files are named for their sites, so a partial download of one site's
+# predictor is never resumed as another's.
+#---------------------------------------------------------------------------
+def getZipName(site, predictor):
+    return str(site) + '-' + predictor + '.zip'
+
+#---------------------------------------------------------------------------
+# waitForPredictor
+#
+# This checks the predictor's status, waiting longer between checks the
+# longer it runs, and returns True when it completed.
+#---------------------------------------------------------------------------
+def waitForPredictor(user, key, site, predictor, server, verbose):
+
+    args = {'site'          : site,
+            'key'           : key,
+            'user'          : user,
+            'predictorName' : predictor}
+
+    def checkStatus():
+
+        response = wranglerUtils.callAPI(server, 'predictorStatus', args,
+                                         verbose)
+
+        if response['state'] == 'CPT' or response['state'] == 'FLD':
+            return response
+
+        print 'Waiting for ' + predictor + ' for site ' + str(site) + ' ...'
+        return None
+
+    try:
+        response = wranglerUtils.getClient().poll(checkStatus,
+                                                  MAX_WAIT,
+                                                  predictor + ' order')
+
+    except RuntimeError:
+
+        print 'Job has not completed in ' + str(MAX_WAIT) + \
+              ' seconds, so timing out.'
+
+        return False
+
+    if response['state'] == 'FLD':
+
+        print 'Predictor creation failed.'
+        print response['msg']
+        return False
+
+    return True
+
+#---------------------------------------------------------------------------
+# wrangle
+#---------------------------------------------------------------------------
+def wrangle(user, key, site, gpcp, landsat, merra, merraMax, modis, \
+            server = 'recoverdss.us', verbose = False):
+
+    checkCredentials(user, key)
+
+    predictor = None
+
+    if gpcp:
+        predictor = 'GPCP'
+
+    elif landsat:
+        predictor = 'Landsat'
+
+    elif merra:
+        predictor = 'MERRA'
+
+    elif merraMax:
+        predictor = 'MERRA Max'
+
+    elif modis:
+        predictor = 'MODIS Time Series'
+
+    outFileName = os.path.join(os.getcwd(), getZipName(site, predictor))
+
+    return wranglePredictor(user, key, site, predictor, outFileName, server,
+                            verbose)
+
+#---------------------------------------------------------------------------
+# wrangleAll
+#
+# This adds several predictors, to one or more sites, at once.  Each order
+# is a (site, predictor, outFileName) tuple.  The orders are placed, waited
+# for and downloaded concurrently, over shared connections.  This returns the
+# file of each order, or None for orders that failed.
+#---------------------------------------------------------------------------
+def wrangleAll(user, key, orders, server = 'recoverdss.us', verbose = False,
+               numThreads = 8):
+
+    checkCredentials(user, key)
+
+    def tryWrangle(order):
+
+        site, predictor, outFileName = order
+
+        try:
+            return wranglePredictor(user, key, site, predictor, outFileName,
+                                    server, verbose)
+
+        except Exception:
+
+            print 'Unable to wrangle ' + predictor + ' for site ' + \
+                  str(site) + ':'
+
+            traceback.print_exc()
+            return None
+
+    pool = ThreadPool(max(min(numThreads, len(orders)), 1))
+
+    try:
+        return pool.map(tryWrangle, orders)
+
+    finally:
+        pool.close()
+        pool.join()
+
+#---------------------------------------------------------------------------
+# wranglePredictor
+#
+# This adds a predictor to a site, waits for it to complete, then downloads
+# it.  It returns the downloaded file, or None when the predictor failed.
+#---------------------------------------------------------------------------
+def wranglePredictor(user, key, site, predictor, outFileName, \
+                     server = 'recoverdss.us', verbose = False):
+
+    if not addPredictor(user, key, site, predictor, server, verbose):
+        return None
+
+    if not waitForPredictor(user, key, site, predictor, server, verbose):
+        return None
+
+    return downloadPredictor(user, key, site, predictor, outFileName, server)
+
 #-------------------------------------------------------------------------------
 # main
+#
+# ./wrangleOnePredictor.py -s 414 415 --merra --merra_max
 #-------------------------------------------------------------------------------
 def main():
 
     #---
-    # Process command-line args. 
+    # Process command-line args.
     #---
-    desc = 'This application adds MERRA to a site, creating the site, if necessary.'
+    desc = 'This application adds predictors to one or more sites, then ' + \
+           'downloads them.  Several are ordered and downloaded at once.'
 
     parser = argparse.ArgumentParser(description=desc)
-    parser.add_argument('-s', required = True, help='site ID')
+    parser.add_argument('-s', required = True, nargs = '+', help='site IDs')
     parser.add_argument('-v', help='show verbose progress messages', action='store_true')
 
-    group = parser.add_mutually_exclusive_group(required = True)
-    group.add_argument('--gpcp',      action='store_true')
-    group.add_argument('--landsat',   action='store_true')
-    group.add_argument('--merra',     action='store_true')
-    group.add_argument('--merra_max', action='store_true')
-    group.add_argument('--modis',     action='store_true')
+    parser.add_argument('--gpcp',      action='store_true')
+    parser.add_argument('--landsat',   action='store_true')
+    parser.add_argument('--merra',     action='store_true')
+    parser.add_argument('--merra_max', action='store_true')
+    parser.add_argument('--modis',     action='store_true')
 
     args = parser.parse_args()
 
+    predictors = [name for flag, name in [(args.gpcp,      'GPCP'),
+                                          (args.landsat,   'Landsat'),
+                                          (args.merra,     'MERRA'),
+                                          (args.merra_max, 'MERRA Max'),
+                                          (args.modis,     'MODIS Time Series')]
+                  if flag]
+
+    if not predictors:
+        parser.error('At least one predictor must be chosen.')
+
     # server = 'dev.nasawrangler.us'
     server = 'recoverdss.us'
     # server = 'localhost:8000'
@@ -162,12 +271,14 @@ def main():
     # user   = 'wmAdmin'
     # key    = '13c952ea-9ca6-4248-a6b1-f9af29a1fa37'
 
-    wrangle(user, key, args.s, args.gpcp, args.landsat, args.merra, \
-            args.merra_max, args.modis, server, args.v)
-    
+    orders = [(site, predictor,
+               os.path.join(os.getcwd(), getZipName(site, predictor)))
+              for site in args.s for predictor in predictors]
+
+    wrangleAll(user, key, orders, server, args.v)
+
 #-------------------------------------------------------------------------------
 # Invoke the main
 #-------------------------------------------------------------------------------
 if __name__ == "__main__":
         sys.exit(main())
-        
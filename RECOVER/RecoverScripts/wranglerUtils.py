@@ -1,8 +1,15 @@
 
-import json
+import httplib
+import socket
 import ssl
+import threading
 import urllib
-import urllib2
+
+from Downloader import Downloader
+
+# One client makes every call, so calls from any thread reuse its connections.
+client     = None
+clientLock = threading.Lock()
 
 #---------------------------------------------------------------------------
 # callAPI
@@ -20,12 +27,15 @@ def callAPI(endPoint, command, args, verbose = False):
 
 #---------------------------------------------------------------------------
 # composeURL
+#
+# An end point without a scheme uses HTTPS.  An explicit http:// is kept, as
+# for a server on localhost.
 #---------------------------------------------------------------------------
 def composeURL(endPoint, command, args):
 
     httpPrefix = 'https://'
     
-    if endPoint[:8] != httpPrefix:
+    if endPoint[:8] != httpPrefix and endPoint[:7] != 'http://':
         endPoint = httpPrefix + endPoint
     
     endPoint += '/api/'
@@ -34,15 +44,30 @@ def composeURL(endPoint, command, args):
     return orderURL
     
 #-------------------------------------------------------------------------------
-# openURL
+# getClient
 #-------------------------------------------------------------------------------
-def openURL(sendURL):
+def getClient():
+
+    global client
+
+    with clientLock:
+
+        if not client:
+            client = Downloader(sslContext = getSSLContext())
+
+    return client
     
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-        response = urllib2.urlopen(sendURL, context = ctx)
-        return response
+#-------------------------------------------------------------------------------
+# getSSLContext
+#
+# RECOVER's certificates are not verified.
+#-------------------------------------------------------------------------------
+def getSSLContext():
+    
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
     
 #-------------------------------------------------------------------------------
 # sendRequest
@@ -54,22 +79,11 @@ def sendRequest(sendURL):
     try:
 
         # Send request, then parse the response.
-        # ctx = ssl.create_default_context()
-        # ctx.check_hostname = False
-        # ctx.verify_mode = ssl.CERT_NONE
-        #
-        # doc = json.loads(urllib2.urlopen(sendURL, context = ctx).readline())
-        doc = json.loads(openURL(sendURL).readline())
+        doc = getClient().getJson(sendURL)
             
-    except urllib2.HTTPError, e:
-    
-        doc['msg']     = 'HTTP error: %d' % e.code + '\n'
-        doc['state']   = 'FAILED'
-        doc['success'] = False
-        
-    except urllib2.URLError, e:
+    except (socket.error, httplib.HTTPException), e:
     
-        doc['msg']     = 'Network error: %s' % e.reason + '\n'
+        doc['msg']     = 'Network error: %s' % e + '\n'
         doc['state']   = 'FAILED'
         doc['success'] = False
         